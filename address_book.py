@@ -0,0 +1,250 @@
+"""
+    Name: address_book.py
+    Author: Jed Felker
+    Created: 10/18/26
+    Purpose: Headless command line for the address book, for
+    scripts, cron jobs and pipelines. Never imports tkinter.
+
+    python address_book.py import contacts.csv
+    python address_book.py export --format csv > contacts.csv
+    python address_book.py export --format columnar -o contacts.abcol
+    python address_book.py query smith
+    python address_book.py dedupe --merge
+    python address_book.py vacuum
+    python address_book.py maintain --budget 5
+    python address_book.py --attach sales.db --attach hr.db query smith
+"""
+import argparse
+# Records are streamed to stdout as JSON lines or CSV
+import csv
+import json
+import os
+import sys
+
+import contact_import
+import db_operations
+import maintenance
+
+FORMATS = ("jsonl", "csv")
+
+
+# -------------------------- OUTPUT -----------------------------------------#
+def write_records(records, format: str, columns=db_operations.COLUMNS):
+    """Stream record tuples to stdout, one line per record
+
+    Each record is written as soon as it is read, so the first lines
+    reach the next program in the pipe before the last are queried."""
+    out = sys.stdout
+    if format == "csv":
+        writer = csv.writer(out, lineterminator="\n")
+        writer.writerow(columns)
+        writer.writerows(records)
+    else:
+        for record in records:
+            out.write(json.dumps(dict(zip(columns, record))) + "\n")
+    out.flush()
+
+
+# -------------------------- SUBCOMMANDS ------------------------------------#
+def command_import(db_op, args) -> int:
+    """Bulk import a CSV or vCard file"""
+    if not os.path.exists(args.file):
+        print(f"No such file: {args.file}", file=sys.stderr)
+        return 1
+    contact_import.import_file(
+        db_op,
+        args.file,
+        chunk_size=args.chunk_size,
+        resume=not args.restart,
+        verbose=not args.quiet
+    )
+    return 0
+
+
+def command_export(db_op, args) -> int:
+    """Every record in sort column order"""
+    if args.format == "columnar":
+        # A binary file for analytics tools, in id order
+        if not args.output:
+            print("--format columnar needs --output FILE", file=sys.stderr)
+            return 2
+        rows = db_op.columnar_export(args.output)
+        print(f"{rows:,} records written to {args.output}", file=sys.stderr)
+        return 0
+    if db_op.books:
+        # Every book merged into one list, each record names its book
+        write_records(
+            db_op.iter_all_records(
+                sort=args.sort, descending=args.descending),
+            args.format,
+            columns=db_operations.BOOK_COLUMNS
+        )
+        return 0
+    write_records(
+        db_op.iter_records(sort=args.sort, descending=args.descending),
+        args.format
+    )
+    return 0
+
+
+def command_query(db_op, args) -> int:
+    """Records matching a name, email or phone number search"""
+    if db_op.books:
+        write_records(
+            db_op.search_all_records(args.text, args.limit),
+            args.format,
+            columns=db_operations.BOOK_COLUMNS
+        )
+        return 0
+    write_records(db_op.search_records(args.text, args.limit), args.format)
+    return 0
+
+
+def command_dedupe(db_op, args) -> int:
+    """List near-duplicate records, or merge them with --merge"""
+    # Imported here, its process pool loads multiprocessing, which
+    # would slow down the start of every other command
+    import dedupe
+    if args.exact:
+        # Only records that are the same after normalizing
+        if args.delete:
+            count = db_op.remove_duplicates()
+            print(f"{count} duplicate records deleted", file=sys.stderr)
+        else:
+            write_records(
+                db_op.find_duplicates(),
+                args.format,
+                columns=db_operations.COLUMNS + ("keep",)
+            )
+        return 0
+    matches = dedupe.find_candidates(
+        db_op.iter_records(sort="id"),
+        threshold=args.threshold,
+        processes=args.processes
+    )
+    if args.merge:
+        count = dedupe.merge_duplicates(
+            db_op, dedupe.group_candidates(matches))
+        print(f"{count} duplicate records merged", file=sys.stderr)
+    else:
+        write_records(
+            ((id_a, id_b, round(similarity, 3))
+             for similarity, id_a, id_b in matches),
+            args.format,
+            columns=("keep", "duplicate", "score")
+        )
+    return 0
+
+
+def command_vacuum(db_op, args) -> int:
+    """Compact the database file"""
+    before, after = db_op.vacuum()
+    print(f"{before:,} bytes -> {after:,} bytes", file=sys.stderr)
+    return 0
+
+
+def command_maintain(db_op, args) -> int:
+    """Refresh statistics, give back free pages and check the file"""
+    reports = maintenance.Maintenance(
+        db_op, budget=args.budget).run_all(args.task)
+    # Exit status 1 if the integrity check found problems
+    return 1 if any(report["problems"] for report in reports) else 0
+
+
+# -------------------------- ARGUMENTS --------------------------------------#
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Headless address book commands")
+    parser.add_argument(
+        "--database", default="address_book.db",
+        help="SQLite database file")
+    parser.add_argument(
+        "--profile", choices=list(db_operations.PROFILES), default="safe",
+        help="SQLite performance profile")
+    parser.add_argument(
+        "--attach", action="append", default=[], metavar="DATABASE",
+        help="another book file to export and query with --database, "
+             "records are listed as book \"main\" or the file name")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    command = commands.add_parser("import", help=command_import.__doc__)
+    command.add_argument("file", help="CSV or vCard (.vcf) file")
+    command.add_argument("--chunk-size", type=int, default=1000)
+    command.add_argument(
+        "--restart", action="store_true",
+        help="start over instead of resuming an interrupted import")
+    command.add_argument("--quiet", action="store_true")
+    command.set_defaults(run=command_import)
+
+    command = commands.add_parser("export", help=command_export.__doc__)
+    command.add_argument(
+        "--format", choices=FORMATS + ("columnar",), default="jsonl")
+    command.add_argument(
+        "-o", "--output",
+        help="file to write, needed for --format columnar (see columnar.py)")
+    command.add_argument(
+        "--sort", choices=list(db_operations.SORT_KEYS), default="last_name")
+    command.add_argument("--descending", action="store_true")
+    command.set_defaults(run=command_export)
+
+    command = commands.add_parser("query", help=command_query.__doc__)
+    command.add_argument("text", help="name or email prefix, or phone digits")
+    command.add_argument("--format", choices=FORMATS, default="jsonl")
+    command.add_argument("--limit", type=int, default=500)
+    command.set_defaults(run=command_query)
+
+    command = commands.add_parser("dedupe", help=command_dedupe.__doc__)
+    command.add_argument("--format", choices=FORMATS, default="jsonl")
+    command.add_argument(
+        "--threshold", type=float, default=0.85,
+        help="lowest similarity (0-1) listed or merged")
+    command.add_argument(
+        "--processes", type=int, default=1,
+        help="worker processes scoring the candidate pairs")
+    command.add_argument(
+        "--merge", action="store_true",
+        help="merge each group of candidates into its lowest id")
+    command.add_argument(
+        "--exact", action="store_true",
+        help="only records that match exactly after normalizing")
+    command.add_argument(
+        "--delete", action="store_true",
+        help="with --exact, delete the duplicates keeping the lowest id")
+    command.set_defaults(run=command_dedupe)
+
+    command = commands.add_parser("vacuum", help=command_vacuum.__doc__)
+    command.set_defaults(run=command_vacuum)
+
+    command = commands.add_parser("maintain", help=command_maintain.__doc__)
+    command.add_argument(
+        "--task", action="append", choices=list(maintenance.INTERVALS),
+        help="run only this task, can be repeated (default all)")
+    command.add_argument(
+        "--budget", type=float, default=None,
+        help="seconds each task may run, unfinished work is left for "
+             "the next run (default no limit)")
+    command.set_defaults(run=command_maintain)
+    return parser.parse_args(argv)
+
+
+# -------------------------- MAIN -------------------------------------------#
+def main(argv=None) -> int:
+    args = parse_args(argv)
+    with db_operations.DBOperations(
+        args.database, profile=args.profile
+    ) as db_op:
+        db_op.create_table()
+        for path in args.attach:
+            db_op.attach_book(path)
+        try:
+            return args.run(db_op, args)
+        except BrokenPipeError:
+            # The reader stopped early (| head), that's not an error
+            # Point stdout at devnull so the exit flush doesn't fail
+            devnull = os.open(os.devnull, os.O_WRONLY)
+            os.dup2(devnull, sys.stdout.fileno())
+            return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -5,27 +5,170 @@
     Tkinter version of address book
 """
 
+# Read the launcher options from the command line
+import argparse
+# Time the GUI phases
+import time
+# Startup is timed from here, see mark_startup
+STARTED = time.perf_counter()
 # Import tkinter library
 from tkinter import *
 # Override tk widgets with nicer looking ttk themed widgets
 from tkinter.ttk import *
 # Database operations libary
 import db_operations
+# Runs the database operations on a worker thread
+import db_executor
+# Latency histograms shown in the debug panel
+import instrumentation
+# Journal of edits not written to SQLite yet
+import write_behind
+# The same record rules as the database controller
+import validation
+# Statistics, free pages and integrity checks while the window is idle
+import maintenance
 
 
 class AddressBook:
-    def __init__(self):
+    def __init__(self, database="address_book.db", profile="safe",
+                 server=None, debug=False, write_behind_ms=None,
+                 write_behind_size=100, startup_times=False,
+                 maintain=True):
         # Create the database controller object
         # If the database doesn't exist, it is created
-        self.db_op = db_operations.DBOperations("address_book.db")
+        # profile trades durability for write speed, see PROFILES
+        if server:
+            # Use a shared address book served by api_server.py
+            # Imported here so the local app doesn't load http.client
+            import api_client
+            self.db_op = api_client.RemoteDBOperations(server)
+        else:
+            self.db_op = db_operations.DBOperations(
+                database, profile=profile)
+        # GUI phases are timed into the same metrics as the queries
+        self.metrics = getattr(self.db_op, "metrics", None) or (
+            instrumentation.Metrics())
+        # When the last full list refresh started, see draw_rows
+        self.refresh_started = None
+        # Print every SQL statement as it runs
+        if debug and hasattr(self.db_op, "set_debugging"):
+            self.db_op.set_debugging(True)
         # The controller creates the table if it doesn't exist
         self.db_op.create_table()
+        # Write-behind mode, edits go to a journal file first and are
+        # committed together every write_behind_ms milliseconds or
+        # once write_behind_size edits are waiting
+        # Needs a local database, group commit is a transaction
+        self.write_behind = None
+        if write_behind_ms and not server:
+            self.write_behind = write_behind.WriteBehind(
+                database + ".pending")
+        self.write_behind_ms = write_behind_ms
+        self.write_behind_size = write_behind_size
+        self.flush_after = None
+        # Reads waiting for the pending edits to be committed
+        self.flush_waiters = {}
+        # Print the time to first paint and to interactive, then quit
+        self.startup_times = startup_times
         # Initialize the Tkinter GUI
         self.init_gui()
-        # List the existing records to show on startup
-        self.fetch_all_records()
+        # All database calls from the GUI run on a worker thread
+        # so the window keeps repainting while a query runs
+        self.db = db_executor.DBExecutor(
+            self.db_op, self.window, busy=self.on_busy,
+            report=self.show_error)
+        # Edits made by other windows and programs show up live, see
+        # poll_changes. A remote book has no change log to poll
+        self.syncing = hasattr(self.db_op, "changes_since")
+        # Newest change already in the list, None until it is counted
+        self.change_seq = None
+        self.sync_ms = 1000
+        # More changes than this at once reload the list instead
+        self.sync_limit = 1000
+        self.sync_job = None
+        self.sync_after = None
+        # Maintenance tasks run one at a time once the user has left
+        # the window alone for maintenance_idle_ms, any key or click
+        # cancels the running one. A remote book maintains itself
+        self.maintenance = None
+        if maintain and hasattr(self.db_op, "incremental_vacuum"):
+            self.maintenance = maintenance.Maintenance(self.db_op)
+        self.maintenance_ms = 1000
+        self.maintenance_idle_ms = 5000
+        self.maintenance_job = None
+        self.maintenance_after = None
+        self.last_activity = time.perf_counter()
+        if self.syncing:
+            # This window's own edits are already in the list
+            self.db.submit(self.db_op.track_own_changes)
+        # Finish pending writes before the window closes
+        self.window.protocol("WM_DELETE_WINDOW", self.on_close)
+        # F12 shows the query and GUI timings
+        self.debug_panel = None
+        self.window.bind("<F12>", self.open_debug_panel)
+        if debug:
+            self.open_debug_panel()
+        # List the first records as soon as the window shows
+        self.start_up()
+        if self.syncing:
+            self.sync_after = self.window.after(
+                self.sync_ms, self.poll_changes)
+        if self.maintenance is not None:
+            for sequence in ("<KeyPress>", "<ButtonPress>", "<MouseWheel>"):
+                self.window.bind_all(
+                    sequence, self.on_user_activity, add="+")
+            self.maintenance_after = self.window.after(
+                self.maintenance_ms, self.run_maintenance)
         # Start the main Tkinter program loop
         mainloop()
+        # The window was closed, release the database connection
+        self.db_op.close()
+        # Report how long the remote backend took to answer
+        if server:
+            for endpoint, times in self.db_op.latency_summary().items():
+                print(
+                    f"{endpoint:<24}{times['count']:>6} requests  "
+                    f"median {times['median_ms']:.1f} ms  "
+                    f"p95 {times['p95_ms']:.1f} ms  "
+                    f"max {times['max_ms']:.1f} ms"
+                )
+
+# ------------------ CLOSE WINDOW --------------------------------------#
+    def on_close(self):
+        """Wait for the database worker, then close the window"""
+        if self.flush_after is not None:
+            self.window.after_cancel(self.flush_after)
+        if self.sync_after is not None:
+            self.window.after_cancel(self.sync_after)
+        if self.maintenance_after is not None:
+            self.window.after_cancel(self.maintenance_after)
+        # Stop a running task instead of waiting for its budget
+        self.db.cancel(self.maintenance_job)
+        self.db.shutdown()
+        if self.write_behind is not None:
+            # Commit what is left, if that fails the journal keeps
+            # the edits and they are committed on the next start
+            if self.write_behind.pending:
+                try:
+                    self.write_behind.committed(write_behind.apply(
+                        self.db_op, *self.write_behind.take()))
+                except Exception as e:
+                    print(f"There was an SQLite error: {e}")
+            self.write_behind.close()
+        self.window.destroy()
+
+# ------------------ BUSY INDICATOR ------------------------------------#
+    def on_busy(self, busy):
+        """Run the progress bar while database jobs are pending"""
+        if busy:
+            self.progress.start(10)
+        else:
+            self.progress.stop()
+
+    def show_error(self, message):
+        """Print an error and show it in the status bar"""
+        print(message)
+        self.lbl_status.configure(text=message)
 
 # ------------------ INITIALIZE GUI ------------------------------------#
     def init_gui(self):
@@ -34,8 +177,6 @@ class AddressBook:
         # Set window location on screen 400 pixels right 300 pixels down
         # The window size will change based on the controls
         self.window.geometry("+400+300")
-        # Add icon to program title bar
-        self.window.iconbitmap("address_book.ico")
         self.window.title("Address Book")
         self.window.resizable(False, False)
         # Create and grid all widgets
@@ -43,6 +184,93 @@ class AddressBook:
         self.create_widgets()
         self.create_treeview()
 
+# --------------------------- STARTUP ----------------------------------#
+    def start_up(self):
+        """Show the first screenful of records, then count the table
+
+        The first page doesn't need the row count, so it is read first
+        and shows before the count finishes on a big table. The rest
+        of the buffer is read a screenful at a time while idle."""
+        # The window can show without its icon
+        self.window.after_idle(self.load_icon)
+        self.refresh_started = time.perf_counter()
+        # Edits left by a crash are committed before anything is read
+        if self.writes_waiting("count", self.start_up):
+            return
+
+        def first_page(rows):
+            # Until the count arrives the list is just these rows
+            self.total_rows = len(rows)
+            self.set_buffer(0, rows)
+            self.show_rows(0)
+            # Runs once Tk has drawn them
+            self.window.after_idle(self.mark_startup, "first_paint")
+
+        def counted(total_rows):
+            if not self.search_text:
+                self.total_rows = total_rows
+                # Sizes the scrollbar to the whole table
+                self.show_rows(self.top_row)
+                self.window.after_idle(self.prefetch_rows)
+            self.window.after_idle(self.mark_startup, "interactive")
+
+        # Both are queued now so the worker runs them back to back
+        self.db.submit(
+            self.db_op.fetch_page,
+            None, None, self.page_rows,
+            self.sort_descending, self.sort_column,
+            callback=first_page,
+            interruptible=True
+        )
+        self.count_rows(counted)
+
+    def load_icon(self):
+        """Add icon to program title bar"""
+        try:
+            self.window.iconbitmap("address_book.ico")
+        except TclError:
+            # .ico files are only read by Tk on Windows
+            pass
+
+    def prefetch_rows(self):
+        """Fill the buffer below the first page one screenful at a time
+
+        Each chunk is read when the GUI is idle, so key presses and
+        clicks are never stuck behind the reads. A page load or an
+        edit cancels the chunk being read."""
+        end = self.buffer_start + len(self.buffer)
+        if self.search_text or self.load_job is not None or (
+            not self.buffer or len(self.buffer) >= self.buffer_size
+        ) or end >= self.total_rows or self.buffer[-1][0] < 0:
+            # Done, busy, or the last row is journalled (not saved yet)
+            return
+
+        def fetched(rows):
+            self.load_job = None
+            self.buffer.extend(rows)
+            if rows:
+                self.window.after_idle(self.prefetch_rows)
+
+        self.load_job = self.db.submit(
+            self.db_op.fetch_page,
+            self.row_key(self.buffer[-1]), None, self.page_rows,
+            self.sort_descending, self.sort_column,
+            callback=fetched,
+            interruptible=True
+        )
+
+    def mark_startup(self, phase):
+        """Record the time from launch to a startup phase
+
+        first_paint is the first records on screen, interactive the
+        whole table listed and the scrollbar sized."""
+        seconds = time.perf_counter() - STARTED
+        self.metrics.observe("gui", "startup_" + phase, seconds)
+        if self.startup_times:
+            print(f"{phase:<12}{seconds * 1000:>8.1f} ms")
+            if phase == "interactive":
+                self.on_close()
+
 # --------------------------- INSERT RECORD ----------------------------#
     def insert_record(self):
         """Add new record to database"""
@@ -54,15 +282,39 @@ class AddressBook:
         phone = self.phone_entry.get()
         email = self.email_entry.get()
 
-        # Ensure the user enters a complete record
-        if first_name == "" or last_name == "":
-            self.lbl_status.configure(text="Please fill out all entries")
+        # The same rules as updates and the database, see validation
+        record = self.clean_record(first_name, last_name, phone, email)
+        if record is None:
+            # Leave the entries so the user can fix them
+            return
+        first_name, last_name, phone, email = record
+        # One of the names may be empty
+        name = " ".join(filter(None, (first_name, last_name)))
+
+        def inserted(id):
+            if id is None:
+                # The database reported an error, nothing was added
+                self.show_error(
+                    f"{name} was not added, the database reported an error.")
+                self.refill_entries(record)
+                return
+            # Show just the new record in the treeview
+            self.add_row((id, first_name, last_name, phone, email))
+            # Let the user know the add record was successful
+            self.lbl_status.configure(text=f"{name} was successfully added.")
+
+        if self.write_behind is not None:
+            # Journal the record, it gets a temporary id until
+            # the next group commit
+            inserted(self.write_behind.insert(
+                first_name, last_name, phone, email))
+            self.journal_edit()
         else:
             # Insert record into database
-            self.db_op.insert_record(first_name, last_name, phone, email)
-            # Let the user know the add record was successful
-            self.lbl_status.configure(
-                text=f"{first_name} {last_name} was successfully added."
+            self.db.submit(
+                self.db_op.insert_record,
+                first_name, last_name, phone, email,
+                callback=inserted
             )
 
         # Clear the entry widgets
@@ -71,81 +323,843 @@ class AddressBook:
         self.phone_entry.delete(0, END)
         self.email_entry.delete(0, END)
 
-        # Display all records in treeview
-        self.fetch_all_records()
-
         # Set focus to entry widget for next entry
         self.first_name_entry.focus()
 
+    def clean_record(self, first_name, last_name, phone, email):
+        """The record normalized the way it is stored
+
+        None if it is not valid, the problems are shown in the status."""
+        try:
+            return validation.clean_record(first_name, last_name, phone, email)
+        except validation.ValidationError as e:
+            self.lbl_status.configure(text="Not saved: " + str(e))
+            return None
+
+    def refill_entries(self, record):
+        """Put a record that wasn't saved back in the empty form"""
+        entries = (
+            self.first_name_entry,
+            self.last_name_entry,
+            self.phone_entry,
+            self.email_entry,
+        )
+        if any(entry.get() for entry in entries):
+            # The user started typing the next record
+            return
+        for entry, value in zip(entries, record):
+            entry.insert(0, value or "")
+
 # --------------------------- FETCH ALL RECORDS ------------------------#
     def fetch_all_records(self):
-        """List all records in database"""
-        # Return a list of tuples from treeview
-        items = self.tree.get_children()
+        """Reload the record list from the database
 
-        # Iterate through list to delete all items in the treeview
-        for item in items:
-            self.tree.delete(item)
+        The tree is a virtual list, only the visible rows exist as
+        Treeview items. Rows are paged in from the database as the
+        list is scrolled."""
+        # Timed until the first page is drawn, see draw_rows
+        self.refresh_started = time.perf_counter()
+        # Leave search mode, the whole table is listed again
+        self.search_text = ""
+        self.db.cancel(self.search_job)
+        self.search_job = None
+        # Count after the journalled edits are committed
+        if self.writes_waiting("count", self.fetch_all_records):
+            return
+        # Count the rows once so the scrollbar can be sized
+        self.count_rows(self.on_records_counted)
 
-        # Query to get all contacts
-        # sorted by last name in desc (descending) order
-        # Get all records as a list of tuples
-        records = self.db_op.fetch_all_records()
+    def count_rows(self, callback):
+        """Count the records on the database worker, then callback(count)
 
-        # Insert all records into tree
-        # Unpack the records tuple into variables one item at a time
-        try:
-            for id, first_name, last_name, phone, email in records:
-                self.tree.insert("", 0, text=id, values=(
-                    id, first_name, last_name, phone, email)
+        When syncing, the change the count is up to is read with it,
+        changes after that one are polled for."""
+        def counted(result):
+            if self.syncing:
+                result, self.change_seq = result
+            callback(result)
+
+        self.db.submit(
+            self.db_op.count_with_seq if self.syncing
+            else self.db_op.count_records,
+            callback=counted,
+            interruptible=True
+        )
+
+    def on_records_counted(self, total_rows):
+        """Start the virtual list over with the new row count"""
+        if self.search_text:
+            # A search started while counting, it owns the list now
+            return
+        self.total_rows = total_rows
+        # Drop the buffered rows, they are fetched again when shown
+        self.set_buffer(0, [])
+        self.show_rows(self.top_row)
+
+# --------------------------- SEARCH -----------------------------------#
+    def on_search_key(self, event):
+        """Debounce typing in the search box
+
+        The search only runs once typing pauses, every key press
+        cancels the search scheduled by the key press before it."""
+        if self.search_after is not None:
+            self.window.after_cancel(self.search_after)
+        self.search_after = self.window.after(
+            self.search_delay, self.run_search)
+
+    def run_search(self, top=0):
+        """List the records matching the search box
+
+        A search still running for older text is cancelled."""
+        if self.writes_waiting("search", lambda: self.run_search(top)):
+            return
+        self.search_after = None
+        text = self.search_entry.get().strip()
+        if text == self.search_text:
+            return
+        self.db.cancel(self.search_job)
+        self.search_job = None
+        self.top_row = top
+        if not text:
+            # Empty search box, go back to the full virtual list
+            self.fetch_all_records()
+            return
+        self.search_text = text
+
+        def found(records):
+            self.search_job = None
+            # Show the matches in the order of the sorted column
+            records.sort(key=self.order_key, reverse=self.sort_descending)
+            # The matches are the whole buffer, scrolling never queries
+            self.set_buffer(0, records)
+            self.total_rows = len(records)
+            self.show_rows(self.top_row)
+
+        self.search_job = self.db.submit(
+            self.db_op.search_records,
+            text, self.search_limit,
+            callback=found,
+            interruptible=True
+        )
+
+    def refresh_search(self):
+        """Run the current search again after a record changed"""
+        # Forget the last search so run_search queries again
+        self.search_text = ""
+        # Stay at the same place in the results
+        self.run_search(self.top_row)
+
+# --------------------------- VIRTUAL LIST -----------------------------#
+    def row_key(self, record, sort=None):
+        """Sort key of a record for keyset pagination
+
+        The columns of SORT_KEYS for sort, the sorted column if None."""
+        columns = db_operations.SORT_KEYS[sort or self.sort_column]
+        if record[0] < 0:
+            # A journalled record's temporary id, it sorts after every
+            # saved id like the id it will get (-1, -2, ... in order)
+            return tuple(
+                2 ** 62 - record[0] if column == "id"
+                else record[self.column_index[column]]
+                for column in columns
+            )
+        return tuple(record[self.column_index[column]] for column in columns)
+
+    def order_key(self, record, sort=None):
+        """row_key made safe to compare, NULL (None) first like SQLite
+
+        row_key is what fetch_page takes, this is what the list is
+        sorted and searched by in Python, see db_operations.sort_key."""
+        key = self.row_key(record, sort)
+        return db_operations.sort_key(key, range(len(key)))
+
+    def sorts_before(self, key, other):
+        """True if key comes before other in the list order
+
+        Both are order_key keys."""
+        return key > other if self.sort_descending else key < other
+
+    def set_buffer(self, start, rows):
+        """Replace the buffered rows
+
+        A page load still running was read for the old buffer,
+        so it is cancelled."""
+        self.db.cancel(self.load_job)
+        self.load_job = None
+        self.buffer_start = start
+        self.buffer = rows
+
+    def buffer_covers(self, top):
+        """True if the window starting at top is already buffered"""
+        end = self.buffer_start + len(self.buffer)
+        needed_end = min(top + self.page_rows, self.total_rows)
+        return self.buffer_start <= top and needed_end <= end
+
+    def read_rows(self, start, rows, top, sort, descending):
+        """Read the rows for the window starting at top
+
+        Runs on the database worker, it gets a copy of the buffer and
+        the sort order and returns the new (start, rows) buffer. Small
+        scrolls continue the buffer from its first or last key, only a
+        jump with the scrollbar has to look up a new starting key."""
+        end = start + len(rows)
+        if rows and start < top <= end:
+            # Scrolling down, continue after the last buffered row
+            more = self.db_op.fetch_page(
+                after=self.row_key(rows[-1], sort),
+                limit=self.buffer_size,
+                descending=descending,
+                sort=sort
+            )
+            return top, rows[top - start:] + more
+        if rows and top < start <= top + self.buffer_size:
+            # Scrolling up, continue before the first buffered row
+            more = self.db_op.fetch_page(
+                before=self.row_key(rows[0], sort),
+                limit=self.buffer_size,
+                descending=descending,
+                sort=sort
+            )
+            return start - len(more), more + rows[:self.buffer_size]
+        # Jump, find the key just above the new top row
+        # This walks the index up to top, the only step that costs
+        # more the further down the list the jump goes
+        after = None
+        if top > 0:
+            after = self.db_op.fetch_key_at(top - 1, descending, sort)
+        rows = self.db_op.fetch_page(
+            after=after,
+            limit=self.buffer_size,
+            descending=descending,
+            sort=sort
+        )
+        return top, rows
+
+    def load_rows(self, top):
+        """Fetch the window starting at top on the database worker"""
+        # Only the latest scroll position matters
+        self.db.cancel(self.load_job)
+        self.load_job = None
+        if self.writes_waiting(
+            "load", lambda: self.show_rows(self.top_row)
+        ):
+            return
+
+        def loaded(buffer):
+            self.load_job = None
+            self.buffer_start, self.buffer = buffer
+            self.draw_rows()
+            # The list was scrolled further while this page loaded
+            if self.top_row != top and not self.buffer_covers(self.top_row):
+                self.load_rows(self.top_row)
+
+        self.load_job = self.db.submit(
+            self.read_rows,
+            self.buffer_start, list(self.buffer), top,
+            self.sort_column, self.sort_descending,
+            callback=loaded,
+            interruptible=True
+        )
+
+    def buffer_index(self, key):
+        """Position of an order_key in the buffer, found by binary search
+
+        The buffer is in list order, see sorts_before."""
+        low, high = 0, len(self.buffer)
+        while low < high:
+            middle = (low + high) // 2
+            if self.sorts_before(self.order_key(self.buffer[middle]), key):
+                low = middle + 1
+            else:
+                high = middle
+        return low
+
+    def add_row(self, record, show=True):
+        """Put one new or updated record at its sorted place in the list
+
+        With show False the tree is redrawn later by the caller."""
+        if self.search_text:
+            # The record may not match, let the search decide
+            self.refresh_search()
+            return
+        # A page load in flight doesn't know about this record
+        self.set_buffer(self.buffer_start, self.buffer)
+        if any(row[0] == record[0] for row in self.buffer):
+            # A page read after the change already has it
+            self.total_rows += 1
+            if show:
+                self.show_rows(self.top_row)
+            return
+        index = self.buffer_index(self.order_key(record))
+        buffer_end = self.buffer_start + len(self.buffer)
+        if 0 < index < len(self.buffer) or (
+            index == 0 and self.buffer_start == 0
+        ) or (
+            index == len(self.buffer) and buffer_end == self.total_rows
+        ):
+            # Inside the buffered rows (or at either end of the table)
+            self.buffer.insert(index, record)
+            position = self.buffer_start + index
+        elif index == 0:
+            # Above the buffered rows, they all move down one place
+            self.buffer_start += 1
+            position = self.buffer_start - 1
+        else:
+            # Below the buffered rows, nothing shown changes
+            position = buffer_end
+        self.total_rows += 1
+        # Keep the same rows on screen when a row is added above them
+        if position < self.top_row:
+            self.top_row += 1
+        if show:
+            self.show_rows(self.top_row)
+
+    def remove_row(self, record, show=True):
+        """Take one deleted or updated record out of the list
+
+        record holds the values the tree showed before the change."""
+        # Its row may still be in the tree, it is not selected any more
+        self.selected_records.pop(record[0], None)
+        self.visible.pop(str(record[0]), None)
+        if self.search_text:
+            self.refresh_search()
+            return
+        self.set_buffer(self.buffer_start, self.buffer)
+        # Look the record up by id, the values shown in the tree are
+        # strings and may not match the stored sort key exactly
+        id = record[0]
+        index = next(
+            (i for i, row in enumerate(self.buffer) if row[0] == id), None)
+        if index is not None:
+            del self.buffer[index]
+            position = self.buffer_start + index
+        elif self.buffer_start > 0 and self.buffer_index(
+            self.order_key(record)
+        ) == 0:
+            # Above the buffered rows, they all move up one place
+            self.buffer_start -= 1
+            position = self.buffer_start
+        else:
+            # Below the buffered rows, nothing shown changes
+            position = self.buffer_start + len(self.buffer)
+        self.total_rows -= 1
+        # Keep the same rows on screen when a row is removed above them
+        if position < self.top_row:
+            self.top_row -= 1
+        if show:
+            self.show_rows(self.top_row)
+
+    def replace_rows(self, removed, added=()):
+        """Take many records out of the list and put others in
+
+        The tree is redrawn once at the end, a search runs once."""
+        if self.search_text:
+            for record in removed:
+                self.selected_records.pop(record[0], None)
+            self.refresh_search()
+            return
+        for record in removed:
+            self.remove_row(record, show=False)
+        for record in added:
+            self.add_row(record, show=False)
+        self.show_rows(self.top_row)
+
+    def show_rows(self, top):
+        """Show the window of rows starting at position top"""
+        # Keep the window inside the table
+        top = max(0, min(top, self.total_rows - self.page_rows))
+        self.top_row = top
+        if self.buffer_covers(top):
+            self.draw_rows()
+        else:
+            # Drawn when the page arrives from the database worker
+            self.load_rows(top)
+
+    def draw_rows(self):
+        """Put the buffered rows of the current window in the tree"""
+        top = self.top_row
+        offset = top - self.buffer_start
+        records = self.buffer[max(0, offset):offset + self.page_rows]
+
+        # The record id is the item id
+        # Rows still visible keep their item (and their selection)
+        wanted = [str(record[0]) for record in records]
+        # Remember what is selected before rows leave the tree
+        self.sync_selection()
+        with self.metrics.timer("gui", "tree_clear"):
+            stale = set(self.tree.get_children()) - set(wanted)
+            if stale:
+                self.tree.delete(*stale)
+        with self.metrics.timer("gui", "tree_insert"):
+            for index, (iid, record) in enumerate(zip(wanted, records)):
+                if self.tree.exists(iid):
+                    self.tree.item(iid, text=record[0], values=record)
+                    self.tree.move(iid, "", index)
+                else:
+                    self.tree.insert(
+                        "", index, iid=iid, text=record[0], values=record
+                    )
+        self.visible = dict(zip(wanted, records))
+        # Selected records scrolled back into view are selected again
+        # Only a real change, every selection change refills the form
+        reselect = [
+            iid for iid, record in self.visible.items()
+            if record[0] in self.selected_records
+        ]
+        if set(reselect) != set(self.tree.selection()):
+            self.tree.selection_set(reselect)
+        if self.refresh_started is not None:
+            # From fetch_all_records to the first page on screen
+            self.metrics.observe(
+                "gui", "fetch_all_records",
+                time.perf_counter() - self.refresh_started, len(records))
+            self.refresh_started = None
+
+        # Size the scrollbar thumb to the visible part of the whole table
+        if self.total_rows:
+            self.scrollbar.set(
+                top / self.total_rows,
+                (top + len(records)) / self.total_rows
+            )
+        else:
+            self.scrollbar.set(0, 1)
+
+    def on_scrollbar(self, *args):
+        """Scrollbar was dragged or clicked"""
+        if args[0] == "moveto":
+            top = int(float(args[1]) * self.total_rows)
+        else:
+            # ("scroll", number, "units" or "pages")
+            step = self.page_rows if args[2] == "pages" else 1
+            top = self.top_row + int(args[1]) * step
+        self.show_rows(top)
+
+    def on_mouse_wheel(self, event):
+        """Scroll the list three rows per wheel step"""
+        # Windows/macOS report delta, X11 uses buttons 4 and 5
+        if event.num == 4 or event.delta > 0:
+            self.show_rows(self.top_row - 3)
+        else:
+            self.show_rows(self.top_row + 3)
+        return "break"
+
+    def on_arrow_key(self, event):
+        """Scroll the list when the arrow keys reach the top or bottom"""
+        children = self.tree.get_children()
+        if not children:
+            return
+        # The default binding then moves the focus to the new row
+        if event.keysym == "Down" and self.tree.focus() == children[-1]:
+            self.show_rows(self.top_row + 1)
+        elif event.keysym == "Up" and self.tree.focus() == children[0]:
+            self.show_rows(self.top_row - 1)
+
+# --------------------------- SORTING ----------------------------------#
+    def sort_by(self, column):
+        """Heading clicked, sort on that column or flip the direction"""
+        if column == self.sort_column:
+            self.sort_descending = not self.sort_descending
+        else:
+            self.sort_column = column
+            self.sort_descending = False
+        self.show_sort_arrow()
+        if self.search_text:
+            # The matches are all in memory, sort them there
+            rows = sorted(
+                self.buffer, key=self.order_key, reverse=self.sort_descending)
+        else:
+            # The buffered rows are in the old order, load new ones
+            rows = []
+        self.set_buffer(0, rows)
+        self.top_row = 0
+        self.show_rows(0)
+
+    def show_sort_arrow(self):
+        """Mark the sorted column heading with the sort direction"""
+        for column, text in self.column_titles.items():
+            if column == self.sort_column:
+                text += " \u25bc" if self.sort_descending else " \u25b2"
+            self.tree.heading(column, text=text)
+
+# --------------------------- LIVE SYNC --------------------------------#
+    def poll_changes(self):
+        """Apply the edits other windows and programs made since the last poll
+
+        One range query on the change log's primary key, the cost is
+        the number of changes, not the size of the table."""
+        self.sync_after = self.window.after(self.sync_ms, self.poll_changes)
+        if self.sync_job is not None or self.change_seq is None:
+            return
+        seq = self.change_seq
+
+        def polled(result):
+            self.sync_job = None
+            if seq != self.change_seq:
+                # The list was counted again while polling
+                return
+            if result is None:
+                # Too far behind, read the list again
+                self.change_seq = None
+                self.fetch_all_records()
+                return
+            self.change_seq, changes = result
+            if not changes:
+                return
+            if self.search_text:
+                self.refresh_search()
+                return
+            # A page read while these changes were made may already
+            # have them, then the buffered positions are off
+            reread = False
+            # An update is logged as a delete and an insert
+            for change_seq, op, record in changes:
+                if not self.buffer or not self.sorts_before(
+                    self.order_key(self.buffer[-1]), self.order_key(record)
+                ):
+                    # Inside or above the buffered rows
+                    reread = True
+                if op == "insert":
+                    self.add_row(record, show=False)
+                else:
+                    self.remove_row(record, show=False)
+            if reread:
+                # Read the rows on screen again, the count and the
+                # scroll position are kept
+                self.set_buffer(self.top_row, [])
+            self.show_rows(self.top_row)
+
+        def poll_failed(e):
+            self.sync_job = None
+            print(f"There was an SQLite error: {e}")
+
+        self.sync_job = self.db.submit(
+            self.db_op.changes_since,
+            seq, self.sync_limit, True,
+            callback=polled,
+            error=poll_failed
+        )
+
+# --------------------------- MAINTENANCE ------------------------------#
+    def on_user_activity(self, event=None):
+        """Put maintenance off, the user's own queries go first"""
+        self.last_activity = time.perf_counter()
+        if self.maintenance_job is not None:
+            # Interrupts the task's statement, a vacuum step is
+            # rolled back and the task runs again later
+            self.db.cancel(self.maintenance_job)
+            self.maintenance_job = None
+
+    def run_maintenance(self):
+        """Run the next due maintenance task if the window is idle
+
+        One task per call, each within the Maintenance budget, so a
+        key press never waits long for the database worker."""
+        self.maintenance_after = self.window.after(
+            self.maintenance_ms, self.run_maintenance)
+        idle = time.perf_counter() - self.last_activity
+        if (
+            self.maintenance_job is not None
+            or self.db.pending
+            or idle * 1000 < self.maintenance_idle_ms
+        ):
+            return
+        due = self.maintenance.due()
+        if not due:
+            return
+
+        def maintained(report):
+            self.maintenance_job = None
+
+        def maintenance_failed(e):
+            self.maintenance_job = None
+            print(f"There was an SQLite error: {e}")
+
+        self.maintenance_job = self.db.submit(
+            self.maintenance.run_task, due[0],
+            callback=maintained,
+            error=maintenance_failed,
+            interruptible=True
+        )
+
+# --------------------------- WRITE-BEHIND -----------------------------#
+    def journal_edit(self):
+        """An edit was journalled, commit soon or now if many are waiting"""
+        self.show_pending()
+        if self.write_behind.pending >= self.write_behind_size:
+            self.flush_writes()
+        elif self.flush_after is None:
+            self.flush_after = self.window.after(
+                self.write_behind_ms, self.flush_writes)
+
+    def writes_waiting(self, name, then):
+        """Commit the journalled edits before a read
+
+        Returns True if there are edits to commit first, then() is
+        called once they are. Only the latest then() per name runs."""
+        if self.write_behind is None or not self.write_behind.pending:
+            return False
+        self.flush_waiters[name] = then
+        self.flush_writes()
+        return True
+
+    def flush_writes(self):
+        """Group commit the journalled edits on the database worker"""
+        if self.flush_after is not None:
+            self.window.after_cancel(self.flush_after)
+            self.flush_after = None
+        if self.write_behind.flushing:
+            # The commit running now flushes again when it is done
+            return
+        if not self.write_behind.pending:
+            self.run_flush_waiters()
+            return
+
+        def flushed(id_map):
+            self.write_behind.committed(id_map)
+            self.show_pending()
+            # Rows with temporary ids are read again with their real ids
+            if any(record[0] < 0 for record in self.buffer):
+                self.set_buffer(self.buffer_start, [])
+                if "load" not in self.flush_waiters:
+                    self.show_rows(self.top_row)
+            if self.write_behind.pending:
+                # Edits made during the commit
+                if self.flush_waiters:
+                    self.flush_writes()
+                    return
+                self.flush_after = self.window.after(
+                    self.write_behind_ms, self.flush_writes)
+            self.run_flush_waiters()
+
+        def flush_failed(e):
+            # The edits stay journalled, try again later
+            self.write_behind.failed()
+            self.lbl_status.configure(text=f"Saving failed: {e}")
+            self.flush_after = self.window.after(
+                self.write_behind_ms, self.flush_writes)
+
+        self.db.submit(
+            write_behind.apply,
+            self.db_op, *self.write_behind.take(),
+            callback=flushed,
+            error=flush_failed
+        )
+
+    def run_flush_waiters(self):
+        waiters = list(self.flush_waiters.values())
+        self.flush_waiters.clear()
+        for then in waiters:
+            then()
+
+    def show_pending(self):
+        """Update the pending writes counter"""
+        self.lbl_pending.configure(
+            text=f"Pending writes: {self.write_behind.pending}")
+
+# --------------------------- DEBUG PANEL ------------------------------#
+    def open_debug_panel(self, event=None):
+        """Window with the query and GUI timings, refreshed every second"""
+        if self.debug_panel is not None:
+            self.debug_panel.lift()
+            return
+        self.debug_panel = Toplevel(self.window)
+        self.debug_panel.title("Address Book Timings")
+        self.debug_panel.protocol("WM_DELETE_WINDOW", self.close_debug_panel)
+        self.debug_text = Text(self.debug_panel, width=80, height=24)
+        self.debug_text.grid(row=0, column=0, columnspan=3, padx=7, pady=7)
+        Button(
+            self.debug_panel,
+            text="Save JSON",
+            command=lambda: self.save_metrics("address_book_metrics.json")
+        ).grid(row=1, column=0, padx=7, pady=7)
+        Button(
+            self.debug_panel,
+            text="Save Prometheus",
+            command=lambda: self.save_metrics("address_book_metrics.prom")
+        ).grid(row=1, column=1, padx=7, pady=7)
+        Button(
+            self.debug_panel,
+            text="Reset",
+            command=self.metrics.reset
+        ).grid(row=1, column=2, padx=7, pady=7)
+        self.refresh_debug_panel()
+
+    def refresh_debug_panel(self):
+        if self.debug_panel is None:
+            return
+        snapshot = self.metrics.snapshot()
+        lines = [f"{'':<24}{'calls':>8}{'rows':>9}{'p50 ms':>9}"
+                 f"{'p95 ms':>9}{'max ms':>9}"]
+        for family, histograms in snapshot["histograms"].items():
+            lines.append(family.upper())
+            for name, histogram in histograms.items():
+                lines.append(
+                    f"  {name:<22}{histogram['count']:>8}"
+                    f"{histogram['rows']:>9}"
+                    f"{histogram['p50_seconds'] * 1000:>9.2f}"
+                    f"{histogram['p95_seconds'] * 1000:>9.2f}"
+                    f"{histogram['max_seconds'] * 1000:>9.2f}"
                 )
-        except:
-            pass
+        for name, count in snapshot["counters"].items():
+            lines.append(f"{name}: {count}")
+        self.debug_text.delete("1.0", END)
+        self.debug_text.insert("1.0", "\n".join(lines))
+        self.debug_panel.after(1000, self.refresh_debug_panel)
+
+    def save_metrics(self, path):
+        self.metrics.dump(path)
+        self.lbl_status.configure(text=f"Timings saved to {path}")
+
+    def close_debug_panel(self):
+        self.debug_panel.destroy()
+        self.debug_panel = None
 
 # --------------------------- ON TREE SELECT ---------------------------#
     def on_tree_select(self, event):
         """When a record is selected, the values are inserted into
-           the appropriate entry boxes for modification."""
+           the appropriate entry boxes for modification.
+           With several selected the boxes are left empty, the fields
+           typed in are changed on all of them."""
         try:
+            self.sync_selection()
+            selection = set(self.selected_records)
+            # Rows scrolling in or out of the tree fire this too,
+            # keep whatever was typed in the form then
+            if selection == self.last_selection:
+                return
+            self.last_selection = selection
+
             # Clear entry boxes
             self.first_name_entry.delete(0, END)
             self.last_name_entry.delete(0, END)
-            self.last_name_entry.delete(0, END)
-            self.last_name_entry.delete(0, END)
+            self.phone_entry.delete(0, END)
+            self.email_entry.delete(0, END)
+            self.selected_values = None
 
-            # Get the selected (focus) item from the tree
-            self.selected = self.tree.focus()
-            # Get the values from the selected tree item if item is selected
-            if self.selected != "":
-                self.selected_values = self.tree.item(self.selected, "values")
+            if len(selection) > 1:
+                self.lbl_status.configure(
+                    text=f"{len(selection)} records selected. Fields "
+                    "filled in are changed on all of them, @domain "
+                    "changes the email domain.")
+            elif selection:
+                # Get the values of the selected record
+                record = next(iter(self.selected_records.values()))
+                self.selected_values = tuple(
+                    "" if value is None else value for value in record)
 
                 # Insert tree values into Entry widgets
                 # to show the selected record
                 self.first_name_entry.insert(0, self.selected_values[1])
                 self.last_name_entry.insert(0, self.selected_values[2])
                 self.phone_entry.insert(0, self.selected_values[3])
-                self.email_entry.insery(0, self.selected_values[4])
+                self.email_entry.insert(0, self.selected_values[4])
 
-            # Set focus on first name entry
-            # If tree still has focus, will cause selected value errors
-            self.first_name_entry.focus()
+                # Set focus on first name entry
+                # If tree still has focus, will cause selected value errors
+                # Left in the tree for several, Shift+arrows select more
+                self.first_name_entry.focus()
         except Exception as e:
             print(e)
 
+    def sync_selection(self):
+        """Update selected_records from the rows selected in the tree
+
+        Only the rows in the tree are looked at, selected records
+        scrolled out of it stay selected."""
+        selected = set(self.tree.selection())
+        for iid, record in self.visible.items():
+            if iid in selected:
+                self.selected_records[record[0]] = record
+            else:
+                self.selected_records.pop(record[0], None)
+
+    def on_tree_click(self, event):
+        """A plain click on a row starts a new selection
+
+        Ctrl and Shift clicks add to it, the default bindings then
+        select the rows in the tree."""
+        if event.state & 0x0005:
+            # Shift (0x0001) or Control (0x0004) held down
+            return
+        if self.tree.identify_region(event.x, event.y) in ("cell", "tree"):
+            self.selected_records.clear()
+
+    def select_all(self, event=None):
+        """Ctrl+A selects every record in the list
+
+        Only when the whole list is buffered, like search results."""
+        if self.buffer_start > 0 or len(self.buffer) < self.total_rows:
+            self.lbl_status.configure(
+                text="Search for the records first, all the matches "
+                "can be selected.")
+            return "break"
+        self.selected_records = {record[0]: record for record in self.buffer}
+        self.tree.selection_set(list(self.visible))
+        self.on_tree_select(event)
+        return "break"
+
+    def clear_selection(self, event=None):
+        """Escape unselects every record"""
+        self.selected_records.clear()
+        self.tree.selection_set([])
+        self.on_tree_select(event)
+
 # --------------------------- UPDATE RECORD ----------------------------#
     def update_record(self):
         """Update the currently selected record from the info in the form"""
+        if len(self.selected_records) > 1:
+            self.update_records()
+            return
         try:
             # Get the id (Primary Key) from the selected tree item
             id = self.selected_values[0]
+            if self.write_behind is not None:
+                # The record may have been committed since it was
+                # selected, its temporary id was replaced
+                id = self.write_behind.resolve(int(id))
             # Get the modified data from the entry widgets
-            first_name = self.first_name_entry.get()
-            last_name = self.last_name_entry.get()
-            phone = self.phone_entry.get()
-            email = self.email_entry.get()
+            record = self.clean_record(
+                self.first_name_entry.get(),
+                self.last_name_entry.get(),
+                self.phone_entry.get(),
+                self.email_entry.get()
+            )
+            if record is None:
+                return
+            first_name, last_name, phone, email = record
+
+            # The values before the update find the old tree row
+            old_record = (int(id),) + tuple(
+                str(value) for value in self.selected_values[1:5])
 
-            # Exexute query against SQLite database
-            self.db_op.update_record(first_name, last_name, phone, email, id)
+            def updated(record):
+                if record is None:
+                    # Not changed, the record is gone or the database
+                    # reported an error, the row stays as it was
+                    self.show_error(
+                        f"{first_name} {last_name} was not updated, it "
+                        "was deleted or the database reported an error.")
+                    return
+                # Move just the updated record to its new place
+                self.remove_row(old_record)
+                self.add_row(record)
+                # Give the user the status of the operation
+                self.lbl_status.configure(
+                    text=f"{first_name} {last_name} was successfully updated.")
+
+            if self.write_behind is not None:
+                self.write_behind.update(
+                    first_name, last_name, phone, email, id)
+                updated((int(id), first_name, last_name, phone, email))
+                self.journal_edit()
+            else:
+                # Exexute query against SQLite database
+                # The updated record is returned to refresh the treeview
+                self.db.submit(
+                    self.db_op.update_record,
+                    first_name, last_name, phone, email, id,
+                    callback=updated
+                )
 
             # Clear entry widgets, set focus to name entry widget
             self.first_name_entry.delete(0, END)
@@ -154,46 +1168,150 @@ class AddressBook:
             self.email_entry.delete(0, END)
             self.first_name_entry.focus()
 
-            # Display all records in treeview
-            self.fetch_all_records()
-            # Give the user the status of the operation
-            self.lbl_status.configure(
-                text=f"{first_name} {last_name} was successfully updated.")
-            
         except:
             self.lbl_status.configure(
                 text="Please select a record to modify.")
             
+    def update_records(self):
+        """Change the fields filled in the form on every selected record
+
+        Empty fields are left as they are. An email starting with @
+        replaces just the domain of each email."""
+        first_name = self.first_name_entry.get()
+        last_name = self.last_name_entry.get()
+        phone = self.phone_entry.get()
+        email = self.email_entry.get()
+        if not (first_name or last_name or phone or email):
+            self.lbl_status.configure(
+                text="Fill in the fields to change on the selected records.")
+            return
+        old_records = list(self.selected_records.values())
+        new_records = []
+        for id, *values in old_records:
+            if self.write_behind is not None:
+                id = self.write_behind.resolve(int(id))
+            new_email = email or values[3]
+            if email.startswith("@"):
+                # Keep the part before the last @, no @ means no domain
+                old_email = values[3] or ""
+                at = old_email.rfind("@")
+                new_email = old_email[:at] + email if at >= 0 else values[3]
+            record = self.clean_record(
+                first_name or values[0],
+                last_name or values[1],
+                phone or values[2],
+                new_email
+            )
+            if record is None:
+                # Nothing is changed unless every record is valid
+                return
+            new_records.append((id,) + record)
+
+        def updated(count):
+            if not count:
+                self.lbl_status.configure(text="No records were updated.")
+                return
+            # Move the records to their new places, redraw once
+            self.replace_rows(old_records, new_records)
+            self.lbl_status.configure(
+                text=f"{count} records were successfully updated.")
+
+        if self.write_behind is not None:
+            for id, *values in new_records:
+                self.write_behind.update(*values, id)
+            updated(len(new_records))
+            self.journal_edit()
+        else:
+            # One executemany, one transaction for all of them
+            self.db.submit(
+                self.db_op.update_records,
+                [(*values, id) for id, *values in new_records],
+                callback=updated
+            )
+        self.first_name_entry.delete(0, END)
+        self.last_name_entry.delete(0, END)
+        self.phone_entry.delete(0, END)
+        self.email_entry.delete(0, END)
+
 # --------------------------- DELETE RECORD ----------------------------#
     def delete_record(self):
         """Delete selected record from database"""
+        if len(self.selected_records) > 1:
+            self.delete_records()
+            return
         try:
             self.lbl_status.configure(text="")
 
             # id is the first value in the
             # selected item/values in the treelist
             id = (self.selected_values[0])
+            if self.write_behind is not None:
+                id = self.write_behind.resolve(int(id))
+            first_name = self.selected_values[1]
+            last_name = self.selected_values[2]
+            record = (int(id),) + tuple(
+                str(value) for value in self.selected_values[1:5])
+
+            def deleted(count):
+                if not count:
+                    # The row stays, see updated above
+                    self.show_error(
+                        f"{first_name} {last_name} was not deleted, it "
+                        "was already gone or the database reported an "
+                        "error.")
+                    return
+                # Remove just that record from the treeview
+                self.remove_row(record)
+                # Confirm to the user that the record was deleted
+                self.lbl_status.configure(
+                    text=f"{first_name} {last_name} was successfully deleted.")
 
-            # Execute the query against the SQLite database
-            self.db_op.delete_record(id)
+            if self.write_behind is not None:
+                self.write_behind.delete(id)
+                deleted(1)
+                self.journal_edit()
+            else:
+                # Execute the query against the SQLite database
+                self.db.submit(
+                    self.db_op.delete_record, id, callback=deleted)
 
             # Clear the Entry widgets
             self.first_name_entry.delete(0, END)
             self.last_name_entry.delete(0, END)
             self.phone_entry.delete(0, END)
             self.email_entry.delete(0, END)
-            # Set the focus and list all records
+            # Set the focus
             self.first_name_entry.focus()
-            self.fetch_all_records()
-
-            # Confirm to the user that the record was deleted
-            status = f"{self.selected_values[1]}"
-            status += f"{self.selected_values[2]} was successfully deleted."
-            self.lbl_status.configure(text=status)
+            # The record is gone, it can't be updated or deleted again
+            self.selected_values = None
 
         except:
             self.lbl_status.configure(text="Please select a record to delete")
 
+    def delete_records(self):
+        """Delete every selected record in one transaction"""
+        records = list(self.selected_records.values())
+        ids = [record[0] for record in records]
+        if self.write_behind is not None:
+            ids = [self.write_behind.resolve(int(id)) for id in ids]
+
+        def deleted(count):
+            if not count:
+                self.lbl_status.configure(text="No records were deleted.")
+                return
+            # Take them all out of the list, redraw once
+            self.replace_rows(records)
+            self.lbl_status.configure(
+                text=f"{count} records were successfully deleted.")
+
+        if self.write_behind is not None:
+            for id in ids:
+                self.write_behind.delete(id)
+            deleted(len(ids))
+            self.journal_edit()
+        else:
+            self.db.submit(self.db_op.delete_records, ids, callback=deleted)
+
 # --------------------------- CREATE FRAMES ----------------------------#
     def create_frames(self):
         self.entry_frame = LabelFrame(
@@ -236,6 +1354,28 @@ class AddressBook:
         self.phone_entry = Entry(self.entry_frame, width=30)
         self.email_entry = Entry(self.entry_frame, width=30)
 
+        # --------------------- CREATE SEARCH BOX ----------------------#
+        self.search_frame = Frame(self.treeview_frame)
+        self.lbl_search = Label(self.search_frame, text="Search:")
+        self.search_entry = Entry(self.search_frame, width=40)
+        # Search as you type, see on_search_key
+        self.search_entry.bind("<KeyRelease>", self.on_search_key)
+        # Milliseconds to wait after the last key press
+        self.search_delay = 250
+        # Most matches listed for one search
+        self.search_limit = 500
+        # Pending debounce timer and running search job
+        self.search_after = None
+        self.search_job = None
+        self.search_text = ""
+
+        # ------------------- CREATE BUSY INDICATOR --------------------#
+        # Runs while the database worker has jobs pending
+        self.progress = Progressbar(
+            self.operations_frame, mode="indeterminate", length=100)
+        # Edits journalled but not committed, only in write-behind mode
+        self.lbl_pending = Label(self.operations_frame, text="")
+
         # -------------------- CREATE BUTTON ---------------------------#
         self.btn_add = Button(
             self.operations_frame,
@@ -268,6 +1408,14 @@ class AddressBook:
         self.btn_add.grid(row=0, column=0, sticky=EW)
         self.btn_modify.grid(row=1, column=0, sticky=EW)
         self.btn_delete.grid(row=2, column=0, sticky=EW)
+        self.progress.grid(row=3, column=0, sticky=EW)
+        if self.write_behind is not None:
+            self.lbl_pending.grid(row=4, column=0, sticky=EW)
+            self.show_pending()
+
+        self.search_frame.grid(row=0, column=0, sticky=W)
+        self.lbl_search.grid(row=0, column=0)
+        self.search_entry.grid(row=0, column=1, padx=(7, 0))
 
         # Set padding between frame and window
         self.entry_frame.grid_configure(padx=20, pady=(20))
@@ -286,14 +1434,51 @@ class AddressBook:
 # ------------------------ TREEVIEW AND SCROLLBAR ---------------------#
     def create_treeview(self):
         """Setup tree view for record display"""
+        # Virtual list state
+        # Number of rows visible at once, same as the tree height
+        self.page_rows = 10
+        # Rows fetched from the database per query
+        self.buffer_size = self.page_rows * 5
+        self.total_rows = 0
+        self.top_row = 0
+        self.buffer_start = 0
+        self.buffer = []
+        # Page load running on the database worker
+        self.load_job = None
+        # Selected records by id, also those scrolled out of the tree
+        self.selected_records = {}
+        # Item id -> record of the rows in the tree
+        self.visible = {}
+        # Ids of the selection the form was last filled for
+        self.last_selection = set()
+        self.selected_values = None
+
+        # Column the list is sorted on, the database sorts and pages
+        # by it, see SORT_KEYS in db_operations
+        self.sort_column = "last_name"
+        self.sort_descending = True
+        self.column_titles = {
+            "id": "ID",
+            "first_name": "First Name",
+            "last_name": "Last Name",
+            "phone": "Phone",
+            "email": "Email",
+        }
+        # Position of each column in a record tuple
+        self.column_index = {
+            column: index for index, column in enumerate(self.column_titles)
+        }
+
         # Create treeview
         self.tree = Treeview(
             self.treeview_frame,
-            height=10,
+            height=self.page_rows,
             columns=("id", "first_name", "last_name", "phone", "email"),
             style="Treeview",
             show="headings",
-            selectmode="browse"
+            # Ctrl and Shift clicks select several records to update
+            # or delete at once
+            selectmode="extended"
         )
         # Setup the columns
         self.tree.column("id", width=30)
@@ -303,32 +1488,87 @@ class AddressBook:
         self.tree.column("email", width=175)
 
         # Setup the heading text visible at the top of the column
-        self.tree.heading("id", text="ID", anchor=W)
-        self.tree.heading("first_name", text="First Name", anchor=W)
-        self.tree.heading("last_name", text="Last Name", anchor=W)
-        self.tree.heading("phone", text="Phone", anchor=W)
-        self.tree.heading("email", text="Email", anchor=W)
+        # Clicking a heading sorts the list on that column
+        for column, text in self.column_titles.items():
+            self.tree.heading(
+                column,
+                text=text,
+                anchor=W,
+                command=lambda column=column: self.sort_by(column)
+            )
+        self.show_sort_arrow()
 
-        # Grid the tree
-        self.tree.grid(row=0, column=0)
+        # Grid the tree below the search box
+        self.tree.grid(row=1, column=0)
 
         # Create scrollbar for treeview
+        # The scrollbar moves through the whole table, not just the
+        # rows that are in the tree
         self.scrollbar = Scrollbar(
             self.treeview_frame,
             orient="vertical",
-            command=self.tree.yview
+            command=self.on_scrollbar
         )
 
-        # Set scroll bar to scroll vertically and attach to the tree
-        self.tree.configure(yscroll=self.scrollbar.set)
-
         # Grid scrollbar just to the right of the tree
         # sn (SouthNorth) expands scrollbar to height of tree
-        self.scrollbar.grid(row=0, column=1, sticky="sn")
+        self.scrollbar.grid(row=1, column=1, sticky="sn")
+
+        # Scroll the virtual list with the mouse wheel and arrow keys
+        self.tree.bind("<MouseWheel>", self.on_mouse_wheel)
+        self.tree.bind("<Button-4>", self.on_mouse_wheel)
+        self.tree.bind("<Button-5>", self.on_mouse_wheel)
+        self.tree.bind("<Up>", self.on_arrow_key)
+        self.tree.bind("<Down>", self.on_arrow_key)
 
         # Enable filling from the treeview selection to the entry boxes
         self.tree.bind("<<TreeviewSelect>>", self.on_tree_select)
+        self.tree.bind("<ButtonPress-1>", self.on_tree_click)
+        self.tree.bind("<Control-a>", self.select_all)
+        self.tree.bind("<Escape>", self.clear_selection)
 
 
 # -------------------- START PROGRAM ----------------------#
-address_book = AddressBook()
\ No newline at end of file
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Address Book")
+    parser.add_argument(
+        "--database",
+        default="address_book.db",
+        help="address book file to open"
+    )
+    parser.add_argument(
+        "--profile",
+        choices=list(db_operations.PROFILES),
+        default="safe",
+        help="SQLite performance profile (default: safe)"
+    )
+    parser.add_argument(
+        "--server",
+        help="URL of an api_server.py to use instead of a local file"
+    )
+    parser.add_argument(
+        "--debug",
+        action="store_true",
+        help="print every SQL statement and show the timings window"
+    )
+    parser.add_argument(
+        "--write-behind",
+        type=int,
+        metavar="MS",
+        help="journal edits and commit them together every MS milliseconds"
+    )
+    parser.add_argument(
+        "--startup-times",
+        action="store_true",
+        help="print the time to first paint and to interactive, then quit"
+    )
+    parser.add_argument(
+        "--no-maintenance",
+        action="store_true",
+        help="don't optimize, vacuum or check the file while idle"
+    )
+    args = parser.parse_args()
+    address_book = AddressBook(
+        args.database, args.profile, args.server, args.debug,
+        args.write_behind, startup_times=args.startup_times,
+        maintain=not args.no_maintenance)
@@ -0,0 +1,285 @@
+"""
+    Name: api_client.py
+    Author: Jed Felker
+    Created: 10/18/26
+    Purpose: DBOperations look-alike that talks to api_server.py,
+    so the GUI can use a shared address book as a remote backend
+"""
+# Keep-alive HTTP connections, one per thread like DBOperations
+import http.client
+import json
+import statistics
+import threading
+import time
+# Recent request times per endpoint
+from collections import deque
+from urllib.parse import urlencode, urlsplit
+
+import db_operations
+import instrumentation
+
+
+class RemoteError(Exception):
+    """The server answered with an error status"""
+
+    def __init__(self, status: int, message: str):
+        super().__init__(f"{status}: {message}")
+        self.status = status
+
+
+class RemoteDBOperations:
+    def __init__(
+        self,
+        url: str = "http://127.0.0.1:8765",
+        samples: int = 1000,
+        max_etags: int = 256
+    ):
+        """url of a running api_server.py
+
+        The last samples request times of each endpoint are kept
+        for latency_summary(), and the ETags of the last max_etags
+        list pages."""
+        parts = urlsplit(url)
+        self.host = parts.hostname or "127.0.0.1"
+        self.port = parts.port or 8765
+        self.samples = samples
+        self.max_etags = max_etags
+        # Connections keyed by thread id, like DBOperations
+        self._connections = {}
+        self._lock = threading.Lock()
+        # URL -> (etag, result) of list pages, sent as If-None-Match
+        self._etags = {}
+        # endpoint -> recent request seconds
+        self.latency = {}
+        # Request histograms, shown by the GUI debug panel
+        self.metrics = instrumentation.Metrics()
+
+# -------------------------- CONNECTION HANDLING ----------------------------#
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def open(self) -> http.client.HTTPConnection:
+        """Open (or reuse) the connection for the calling thread"""
+        thread_id = threading.get_ident()
+        with self._lock:
+            connection = self._connections.get(thread_id)
+            if connection is None:
+                connection = http.client.HTTPConnection(
+                    self.host, self.port, timeout=30)
+                self._connections[thread_id] = connection
+                self.metrics.increment("connections_opened")
+        return connection
+
+    def close(self):
+        with self._lock:
+            connections = list(self._connections.values())
+            self._connections.clear()
+        for connection in connections:
+            connection.close()
+
+    def interrupt(self):
+        """Requests can't be aborted part way, they finish normally"""
+
+    def create_table(self):
+        """The server creates and upgrades the tables"""
+
+# -------------------------- REQUESTS ---------------------------------------#
+    def request(self, method: str, path: str, body=None, cached=False):
+        """Send one request, return the decoded JSON result
+
+        cached GETs send the ETag of the last response for the same URL
+        and reuse that result when the server answers 304."""
+        headers = {}
+        if body is not None:
+            body = json.dumps(body)
+            headers["Content-Type"] = "application/json"
+        etag = self._etags.get(path) if cached else None
+        if etag is not None:
+            headers["If-None-Match"] = etag[0]
+        endpoint = f"{method} {path.split('?')[0].rstrip('0123456789')}"
+        start = time.perf_counter()
+        connection = self.open()
+        try:
+            connection.request(method, path, body, headers)
+            response = connection.getresponse()
+            payload = response.read()
+        except (http.client.HTTPException, OSError):
+            # The server closed the keep-alive connection, retry once
+            # A POST may already have been applied, don't send it twice
+            connection.close()
+            if method == "POST":
+                raise
+            connection.request(method, path, body, headers)
+            response = connection.getresponse()
+            payload = response.read()
+        self.record_latency(endpoint, time.perf_counter() - start)
+
+        if response.status == 304 and etag is not None:
+            return etag[1]
+        result = json.loads(payload) if payload else None
+        if response.status >= 400:
+            message = result.get("error", "") if result else ""
+            raise RemoteError(response.status, message)
+        if cached and response.getheader("ETag"):
+            self._etags.pop(path, None)
+            self._etags[path] = (response.getheader("ETag"), result)
+            if len(self._etags) > self.max_etags:
+                # Dicts keep insertion order, drop the oldest page
+                del self._etags[next(iter(self._etags))]
+        return result
+
+    def record_latency(self, endpoint: str, seconds: float):
+        times = self.latency.get(endpoint)
+        if times is None:
+            times = self.latency[endpoint] = deque(maxlen=self.samples)
+        times.append(seconds)
+        self.metrics.observe("request", endpoint, seconds)
+
+    def latency_summary(self) -> dict:
+        """endpoint -> count, median, 95th percentile and max in ms"""
+        summary = {}
+        for endpoint, times in list(self.latency.items()):
+            times = sorted(times)
+            summary[endpoint] = {
+                "count": len(times),
+                "median_ms": statistics.median(times) * 1000,
+                "p95_ms": times[int(len(times) * 0.95)] * 1000
+                if len(times) > 1 else times[0] * 1000,
+                "max_ms": times[-1] * 1000,
+            }
+        return summary
+
+# -------------------------- RECORDS ----------------------------------------#
+    # Same methods and return values as DBOperations
+
+    @staticmethod
+    def record_tuple(record: dict) -> tuple:
+        return tuple(record[column] for column in db_operations.COLUMNS)
+
+    def count_records(self) -> int:
+        return self.request("GET", "/count", cached=True)["count"]
+
+    def fetch_page(
+        self,
+        after: tuple = None,
+        before: tuple = None,
+        limit: int = 100,
+        descending: bool = False,
+        sort: str = "last_name"
+    ) -> list:
+        query = {"limit": limit, "sort": sort}
+        if descending:
+            query["descending"] = 1
+        if after is not None:
+            query["after"] = json.dumps(list(after))
+        if before is not None:
+            query["before"] = json.dumps(list(before))
+        result = self.request(
+            "GET", "/records?" + urlencode(query), cached=True)
+        return [self.record_tuple(record) for record in result["records"]]
+
+    def fetch_key_at(
+        self,
+        offset: int,
+        descending: bool = False,
+        sort: str = "last_name"
+    ) -> tuple:
+        query = {"offset": offset, "sort": sort}
+        if descending:
+            query["descending"] = 1
+        key = self.request("GET", "/key?" + urlencode(query))["key"]
+        return tuple(key) if key is not None else None
+
+    def search_records(self, text: str, limit: int = 500) -> list:
+        query = urlencode({"q": text, "limit": limit})
+        result = self.request("GET", "/search?" + query)
+        return [self.record_tuple(record) for record in result["records"]]
+
+    def fetch_record(self, id: int):
+        try:
+            return self.record_tuple(
+                self.request("GET", f"/records/{int(id)}"))
+        except RemoteError as e:
+            if e.status == 404:
+                return None
+            raise
+
+    def insert_record(self, first_name, last_name, phone, email):
+        record = self.request("POST", "/records", {
+            "first_name": first_name,
+            "last_name": last_name,
+            "phone": phone,
+            "email": email,
+        })
+        return record["id"]
+
+    def insert_records(self, records, chunk_size: int = 1000) -> int:
+        """Send the records in batches of chunk_size"""
+        count = 0
+        records = list(records)
+        for start in range(0, len(records), chunk_size):
+            result = self.request("POST", "/records/batch", [
+                dict(zip(db_operations.COLUMNS[1:], record))
+                for record in records[start:start + chunk_size]
+            ])
+            count += result["count"]
+        return count
+
+    def update_record(self, first_name, last_name, phone, email, id):
+        try:
+            return self.record_tuple(self.request(
+                "PUT", f"/records/{int(id)}", {
+                    "first_name": first_name,
+                    "last_name": last_name,
+                    "phone": phone,
+                    "email": email,
+                }))
+        except RemoteError as e:
+            if e.status == 404:
+                return None
+            raise
+
+    def delete_record(self, id) -> int:
+        try:
+            return self.request("DELETE", f"/records/{int(id)}")["deleted"]
+        except RemoteError as e:
+            if e.status == 404:
+                return 0
+            raise
+
+    def update_records(self, records) -> int:
+        """Update many (first_name, last_name, phone, email, id)
+        records in one round trip, return the number updated"""
+        responses = self.batch([
+            ("PUT", f"/records/{int(id)}", {
+                "first_name": first_name,
+                "last_name": last_name,
+                "phone": phone,
+                "email": email,
+            })
+            for first_name, last_name, phone, email, id in records
+        ])
+        return sum(status == 200 for status, body in responses)
+
+    def delete_records(self, ids) -> int:
+        """Delete many records in one round trip, return the number deleted"""
+        responses = self.batch([
+            ("DELETE", f"/records/{int(id)}", None) for id in ids])
+        return sum(
+            body["deleted"] for status, body in responses if status == 200)
+
+    def batch(self, requests: list) -> list:
+        """Several (method, path, body) requests in one round trip
+
+        Returns the (status, result) of each request."""
+        result = self.request("POST", "/batch", {"requests": [
+            {"method": method, "path": path, "body": body}
+            for method, path, body in requests
+        ]})
+        return [
+            (response["status"], response["body"])
+            for response in result["responses"]
+        ]
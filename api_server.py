@@ -0,0 +1,410 @@
+"""
+    Name: api_server.py
+    Author: Jed Felker
+    Created: 10/18/26
+    Purpose: Local HTTP/JSON service over DBOperations so several
+    desktops and scripts can use one address book at the same time
+
+    python api_server.py --database address_book.db --port 8765
+
+    GET    /records?sort=&descending=&after=&before=&limit=   one page
+    GET    /records/<id>           one record
+    POST   /records                create, body is a record object
+    PUT    /records/<id>           update
+    DELETE /records/<id>           delete
+    POST   /records/batch          create many, body is a list of records
+    GET    /count                  number of records
+    GET    /key?offset=&sort=&descending=   sort key of the row at offset
+    GET    /search?q=&limit=       name, email or phone search
+    POST   /batch                  {"requests": [{"method", "path", "body"}]}
+"""
+import argparse
+import asyncio
+# The thread pool is the connection pool, DBOperations keeps
+# one connection per thread
+from concurrent.futures import ThreadPoolExecutor
+# Cached list pages, least recently used first
+from collections import OrderedDict
+# ETags are a short hash of the response body
+import hashlib
+import json
+import os
+from urllib.parse import parse_qsl, urlsplit
+
+import db_operations
+import validation
+
+STATUS_TEXT = {
+    200: "OK",
+    201: "Created",
+    304: "Not Modified",
+    400: "Bad Request",
+    404: "Not Found",
+    405: "Method Not Allowed",
+    500: "Internal Server Error",
+}
+# Largest page a client can ask for
+MAX_LIMIT = 1000
+
+
+class APIError(Exception):
+    """Turned into an error response with status and message"""
+
+    def __init__(self, status: int, message: str):
+        super().__init__(message)
+        self.status = status
+
+
+def record_object(record) -> dict:
+    """Record tuple as a JSON object"""
+    return dict(zip(db_operations.COLUMNS, record))
+
+
+def int_option(query, name, default=None) -> int:
+    """Integer query option, 400 if it is missing (and has no default)
+    or isn't an integer"""
+    value = query.get(name)
+    if value is None:
+        if default is None:
+            raise APIError(400, f"{name} is required")
+        return default
+    try:
+        return int(value)
+    except ValueError:
+        raise APIError(400, f"{name} must be an integer, not {value!r}")
+
+
+def limit_option(query, default: int) -> int:
+    """The limit option kept within 1 to MAX_LIMIT
+
+    SQLite takes a negative LIMIT as no limit at all."""
+    return min(max(int_option(query, "limit", default), 1), MAX_LIMIT)
+
+
+def record_fields(data) -> tuple:
+    """(first_name, last_name, phone, email) from a JSON record object
+
+    Normalized, a record that is not valid is a 400 response
+    (ValidationError is a ValueError)."""
+    if not isinstance(data, dict):
+        raise APIError(400, "expected a record object")
+    return validation.clean_record(*(
+        str(data.get(column) or "") for column in db_operations.COLUMNS[1:]))
+
+
+class APIServer:
+    def __init__(
+        self,
+        database: str,
+        pool_size: int = 4,
+        profile: str = "balanced",
+        cache_size: int = 256
+    ):
+        """pool_size threads each keep one SQLite connection
+
+        The balanced profile uses WAL, so readers don't wait for a
+        writer. cache_size list pages are kept for ETag checks."""
+        self.database = database
+        self.db_op = db_operations.DBOperations(database, profile=profile)
+        self.db_op.create_table()
+        self.pool = ThreadPoolExecutor(
+            max_workers=pool_size, thread_name_prefix="db_pool")
+        # Bumped by every write made through the server
+        self.generation = 0
+        self.cache_size = cache_size
+        # (path, query) -> (version, etag, body)
+        self.page_cache = OrderedDict()
+
+# -------------------------- CONNECTION POOL --------------------------------#
+    async def call(self, function, *args):
+        """Run a DBOperations call on one of the pool threads"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.pool, function, *args)
+
+    async def write(self, function, *args):
+        """Run a call that changes records, cached pages are now stale"""
+        try:
+            return await self.call(function, *args)
+        finally:
+            self.generation += 1
+
+    def version(self) -> tuple:
+        """Changes whenever the database file changes
+
+        Writes by other programs don't bump the generation, but they
+        do change the size or modified time of the file or its WAL."""
+        stats = [self.generation]
+        for path in (self.database, self.database + "-wal"):
+            try:
+                stat = os.stat(path)
+                stats.append((stat.st_mtime_ns, stat.st_size))
+            except OSError:
+                stats.append(None)
+        return tuple(stats)
+
+# -------------------------- HTTP -------------------------------------------#
+    async def handle_connection(self, reader, writer):
+        """Serve the requests of one keep-alive connection"""
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                method, target, version = (
+                    request_line.decode("latin-1").split())
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b"\r\n", b"\n", b""):
+                        break
+                    name, _, value = line.decode("latin-1").partition(":")
+                    headers[name.strip().lower()] = value.strip()
+                length = int(headers.get("content-length") or 0)
+                body = await reader.readexactly(length) if length else b""
+
+                status, payload, extra = await self.respond(
+                    method, target, body, headers.get("if-none-match"))
+                keep_alive = version == "HTTP/1.1" and (
+                    headers.get("connection", "").lower() != "close")
+                lines = [
+                    f"HTTP/1.1 {status} {STATUS_TEXT[status]}",
+                    "Content-Type: application/json",
+                    f"Content-Length: {len(payload)}",
+                    f"Connection: {'keep-alive' if keep_alive else 'close'}",
+                ]
+                lines += [f"{name}: {value}" for name, value in extra.items()]
+                writer.write(
+                    ("\r\n".join(lines) + "\r\n\r\n").encode("latin-1")
+                    + payload)
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError, ValueError):
+            # Client went away or sent something that isn't HTTP
+            pass
+        finally:
+            writer.close()
+
+    async def respond(self, method, target, body, if_none_match=None):
+        """(status, body bytes, extra headers) for one request"""
+        url = urlsplit(target)
+        query = dict(parse_qsl(url.query))
+        try:
+            data = json.loads(body) if body else None
+            if method == "GET" and url.path in ("/records", "/count"):
+                return await self.cached_get(url.path, query, if_none_match)
+            status, result = await self.dispatch(
+                method, url.path, query, data)
+        except APIError as e:
+            status, result = e.status, {"error": str(e)}
+        except (ValueError, TypeError) as e:
+            status, result = 400, {"error": str(e)}
+        except Exception as e:
+            print(f"There was an SQLite error: {e}")
+            status, result = 500, {"error": str(e)}
+        return status, json.dumps(result).encode(), {}
+
+    async def cached_get(self, path, query, if_none_match):
+        """GET a list page or the count with an ETag
+
+        The page is only queried again once the database changed.
+        A client sending the ETag it has gets an empty 304 back."""
+        cache_key = (path, tuple(sorted(query.items())))
+        # Read the version before the query, a write during the query
+        # leaves a stale version, never stale data under a new one
+        version = self.version()
+        cached = self.page_cache.get(cache_key)
+        if cached is not None and cached[0] == version:
+            self.page_cache.move_to_end(cache_key)
+            etag, payload = cached[1], cached[2]
+        else:
+            status, result = await self.dispatch("GET", path, query, None)
+            payload = json.dumps(result).encode()
+            etag = '"' + hashlib.blake2b(
+                payload, digest_size=8).hexdigest() + '"'
+            self.page_cache[cache_key] = (version, etag, payload)
+            self.page_cache.move_to_end(cache_key)
+            while len(self.page_cache) > self.cache_size:
+                self.page_cache.popitem(last=False)
+        headers = {"ETag": etag}
+        if if_none_match == etag:
+            return 304, b"", headers
+        return 200, payload, headers
+
+# -------------------------- ROUTES -----------------------------------------#
+    async def dispatch(self, method, path, query, data):
+        """Run one request, return (status, JSON result)"""
+        parts = path.strip("/").split("/")
+        if parts[0] == "records":
+            if len(parts) == 1:
+                if method == "GET":
+                    return 200, await self.list_records(query)
+                if method == "POST":
+                    return await self.create_record(data)
+            elif parts[1] == "batch":
+                if method == "POST":
+                    return await self.create_records(data)
+            elif len(parts) == 2 and parts[1].isdigit():
+                id = int(parts[1])
+                if method == "GET":
+                    return await self.get_record(id)
+                if method == "PUT":
+                    return await self.update_record(id, data)
+                if method == "DELETE":
+                    return await self.delete_record(id)
+            else:
+                raise APIError(404, f"no route {path}")
+            raise APIError(405, f"{method} not allowed on {path}")
+        if path == "/count" and method == "GET":
+            return 200, {"count": await self.call(self.db_op.count_records)}
+        if path == "/key" and method == "GET":
+            return 200, await self.sort_key(query)
+        if path == "/search" and method == "GET":
+            return 200, await self.search(query)
+        if path == "/batch" and method == "POST":
+            return 200, await self.batch(data)
+        raise APIError(404, f"no route {method} {path}")
+
+    def sort_options(self, query) -> tuple:
+        """(sort, descending) from the query string"""
+        sort = query.get("sort", "last_name")
+        if sort not in db_operations.SORT_KEYS:
+            raise APIError(400, f"can't sort on {sort!r}")
+        descending = query.get("descending", "").lower() in ("1", "true")
+        return sort, descending
+
+    def key_option(self, query, name, sort):
+        """A keyset key from the query string, None if not given
+
+        Keys are JSON arrays with one value per column of the sort
+        key, the same tuples fetch_page takes. 400 if it isn't one."""
+        if name not in query:
+            return None
+        key = json.loads(query[name])
+        columns = db_operations.SORT_KEYS[sort]
+        if not isinstance(key, list) or len(key) != len(columns) or any(
+            isinstance(value, (list, dict)) for value in key
+        ):
+            raise APIError(
+                400, f"{name} must be a list of {len(columns)} values "
+                f"({', '.join(columns)})")
+        return key
+
+    async def list_records(self, query) -> dict:
+        sort, descending = self.sort_options(query)
+        limit = limit_option(query, 100)
+        after = self.key_option(query, "after", sort)
+        before = self.key_option(query, "before", sort)
+        records = await self.call(
+            self.db_op.fetch_page, after, before, limit, descending, sort)
+        return {"records": [record_object(record) for record in records]}
+
+    async def sort_key(self, query) -> dict:
+        sort, descending = self.sort_options(query)
+        offset = int_option(query, "offset")
+        if offset < 0:
+            raise APIError(400, "offset can't be negative")
+        key = await self.call(
+            self.db_op.fetch_key_at, offset, descending, sort)
+        return {"key": key}
+
+    async def search(self, query) -> dict:
+        limit = limit_option(query, 500)
+        records = await self.call(
+            self.db_op.search_records, query.get("q", ""), limit)
+        return {"records": [record_object(record) for record in records]}
+
+    async def get_record(self, id) -> tuple:
+        record = await self.call(self.db_op.fetch_record, id)
+        if record is None:
+            raise APIError(404, f"no record {id}")
+        return 200, record_object(record)
+
+    async def create_record(self, data) -> tuple:
+        fields = record_fields(data)
+        id = await self.write(self.db_op.insert_record, *fields)
+        if id is None:
+            raise APIError(500, "the record was not added")
+        return 201, record_object((id,) + fields)
+
+    async def create_records(self, data) -> tuple:
+        """Bulk create, one transaction per chunk of records"""
+        if not isinstance(data, list):
+            raise APIError(400, "expected a list of records")
+        records = [record_fields(item) for item in data]
+        count = await self.write(self.db_op.insert_records, records)
+        return 201, {"count": count}
+
+    async def update_record(self, id, data) -> tuple:
+        record = await self.write(
+            self.db_op.update_record, *record_fields(data), id)
+        if record is None:
+            raise APIError(404, f"no record {id}")
+        return 200, record_object(record)
+
+    async def delete_record(self, id) -> tuple:
+        count = await self.write(self.db_op.delete_record, id)
+        if not count:
+            raise APIError(404, f"no record {id}")
+        return 200, {"deleted": count}
+
+    async def batch(self, data) -> dict:
+        """Several requests in one round trip, run in order"""
+        if not isinstance(data, dict) or not isinstance(
+            data.get("requests"), list
+        ):
+            raise APIError(400, "expected {\"requests\": [...]}")
+        if not all(isinstance(request, dict) for request in data["requests"]):
+            raise APIError(400, "each request must be an object")
+        responses = []
+        for request in data["requests"]:
+            method = str(request.get("method", "GET")).upper()
+            body = request.get("body")
+            status, payload, headers = await self.respond(
+                method,
+                str(request.get("path", "/")),
+                json.dumps(body).encode() if body is not None else b""
+            )
+            responses.append({"status": status, "body": json.loads(payload)})
+        return {"responses": responses}
+
+# -------------------------- SERVE ------------------------------------------#
+    async def serve(self, host: str = "127.0.0.1", port: int = 8765):
+        server = await asyncio.start_server(
+            self.handle_connection, host, port)
+        print(f"Address book API on http://{host}:{port}")
+        async with server:
+            await server.serve_forever()
+
+    def close(self):
+        self.pool.shutdown(wait=True)
+        self.db_op.close()
+
+
+# -------------------------- MAIN -------------------------------------------#
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Address book HTTP API")
+    parser.add_argument("--database", default="address_book.db")
+    parser.add_argument(
+        "--host", default="127.0.0.1",
+        help="interface to listen on, local only by default")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument(
+        "--pool-size", type=int, default=4,
+        help="database connections serving requests at once")
+    parser.add_argument(
+        "--profile", choices=list(db_operations.PROFILES),
+        default="balanced")
+    args = parser.parse_args(argv)
+
+    server = APIServer(args.database, args.pool_size, args.profile)
+    try:
+        asyncio.run(server.serve(args.host, args.port))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.close()
+
+
+if __name__ == "__main__":
+    main()
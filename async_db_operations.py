@@ -0,0 +1,227 @@
+"""
+    Name: async_db_operations.py
+    Author: Jed Felker
+    Created: 10/18/26
+    Purpose: DBOperations for asyncio code. Every call is an
+    awaitable served by one dedicated SQLite thread.
+
+    async with AsyncDBOperations("address_book.db") as db_op:
+        id = await db_op.insert_record("Ann", "Lee", "", "")
+"""
+import asyncio
+# Requests are handed to the SQLite thread through a queue
+import queue
+import threading
+
+import db_operations
+
+# Methods that only read, the same call from several callers at once
+# runs once and every caller gets the result
+READ_METHODS = {
+    "fetch_all_records",
+    "fetch_record",
+    "count_records",
+    "fetch_page",
+    "fetch_key_at",
+    "search_records",
+}
+# Methods whose concurrent calls share one transaction (one commit)
+WRITE_METHODS = {
+    "insert_record",
+    "update_record",
+    "delete_record",
+    "update_records",
+    "delete_records",
+}
+# Most requests the SQLite thread takes off the queue at once
+MAX_BATCH = 500
+
+
+class Request:
+    """One awaited call waiting for the SQLite thread"""
+    __slots__ = ("method", "args", "kwargs", "future", "loop")
+
+    def __init__(self, method, args, kwargs, future, loop):
+        self.method = method
+        self.args = args
+        self.kwargs = kwargs
+        self.future = future
+        self.loop = loop
+
+    def key(self) -> tuple:
+        """Calls with the same key return the same result"""
+        key = (self.method, self.args, tuple(sorted(self.kwargs.items())))
+        try:
+            hash(key)
+        except TypeError:
+            # A list argument, never shared with another call
+            return (id(self),)
+        return key
+
+
+class AsyncDBOperations:
+    def __init__(self, database: str, **options):
+        """options are passed on to DBOperations (profile, pragmas, ...)"""
+        self.db_op = db_operations.DBOperations(database, **options)
+        self.requests = queue.Queue()
+        self.thread = threading.Thread(
+            target=self.run, name="sqlite_async", daemon=True)
+        self.thread.start()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        await asyncio.to_thread(self.close)
+
+# -------------------------- AWAITABLE METHODS ------------------------------#
+    def call(self, method: str, *args, **kwargs) -> asyncio.Future:
+        """Queue db_op.method(*args, **kwargs) for the SQLite thread"""
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self.requests.put(Request(method, args, kwargs, future, loop))
+        return future
+
+    async def create_table(self):
+        return await self.call("create_table")
+
+    async def insert_record(self, first_name, last_name, phone, email):
+        return await self.call(
+            "insert_record", first_name, last_name, phone, email)
+
+    async def fetch_all_records(self):
+        return await self.call("fetch_all_records")
+
+    async def fetch_record(self, id: int):
+        return await self.call("fetch_record", id)
+
+    async def count_records(self) -> int:
+        return await self.call("count_records")
+
+    async def fetch_page(
+        self,
+        after: tuple = None,
+        before: tuple = None,
+        limit: int = 100,
+        descending: bool = False,
+        sort: str = "last_name"
+    ) -> list:
+        return await self.call(
+            "fetch_page", after, before, limit, descending, sort)
+
+    async def search_records(self, text: str, limit: int = 500) -> list:
+        return await self.call("search_records", text, limit)
+
+    async def update_record(self, first_name, last_name, phone, email, id):
+        return await self.call(
+            "update_record", first_name, last_name, phone, email, id)
+
+    async def delete_record(self, id: int) -> int:
+        return await self.call("delete_record", id)
+
+    async def update_records(self, records) -> int:
+        return await self.call("update_records", list(records))
+
+    async def delete_records(self, ids) -> int:
+        return await self.call("delete_records", list(ids))
+
+    async def database_dump(self, path: str = "database_dump.sql", **options):
+        return await self.call("database_dump", path, **options)
+
+# -------------------------- SQLITE THREAD ----------------------------------#
+    def run(self):
+        """Serve requests until close() queues None"""
+        while True:
+            # Wait for one request, then take whatever else is queued
+            batch = [self.requests.get()]
+            while len(batch) < MAX_BATCH:
+                try:
+                    batch.append(self.requests.get_nowait())
+                except queue.Empty:
+                    break
+            stop = None in batch
+            batch = [request for request in batch if request is not None]
+            # Runs of reads and runs of writes are served together,
+            # the order between reads and writes is kept
+            start = 0
+            while start < len(batch):
+                kind = self.kind(batch[start])
+                end = start + 1
+                if kind is not None:
+                    while end < len(batch) and (
+                        self.kind(batch[end]) == kind
+                    ):
+                        end += 1
+                if kind == "write":
+                    self.run_writes(batch[start:end])
+                else:
+                    self.run_reads(batch[start:end])
+                start = end
+            if stop:
+                self.db_op.close()
+                return
+
+    @staticmethod
+    def kind(request) -> str:
+        """"read", "write", or None for calls that run on their own"""
+        if request.method in READ_METHODS:
+            return "read"
+        if request.method in WRITE_METHODS:
+            return "write"
+        return None
+
+    def run_reads(self, requests):
+        """Run each distinct read once, share the result"""
+        results = {}
+        for request in requests:
+            key = request.key()
+            if key not in results:
+                results[key] = self.execute(request)
+            value, error = results[key]
+            # Every caller gets its own list to change
+            if isinstance(value, list):
+                value = list(value)
+            self.deliver(request, value, error)
+
+    def run_writes(self, requests):
+        """Run the writes in one transaction, commit once"""
+        results = []
+        try:
+            with self.db_op.transaction():
+                for request in requests:
+                    results.append(self.execute(request))
+        except Exception as e:
+            # The commit failed, none of the writes happened
+            results = [(None, e)] * len(requests)
+        for request, (value, error) in zip(requests, results):
+            self.deliver(request, value, error)
+
+    def execute(self, request) -> tuple:
+        """(result, None) or (None, exception)"""
+        try:
+            method = getattr(self.db_op, request.method)
+            return method(*request.args, **request.kwargs), None
+        except Exception as e:
+            return None, e
+
+    def deliver(self, request, value, error):
+        """Hand the result to the caller's event loop"""
+        def done():
+            if request.future.cancelled():
+                return
+            if error is not None:
+                request.future.set_exception(error)
+            else:
+                request.future.set_result(value)
+        try:
+            request.loop.call_soon_threadsafe(done)
+        except RuntimeError:
+            # The caller's event loop has already closed
+            pass
+
+# -------------------------- CLOSE ------------------------------------------#
+    def close(self):
+        """Finish the queued requests and stop the SQLite thread"""
+        if self.thread.is_alive():
+            self.requests.put(None)
+            self.thread.join()
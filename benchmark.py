@@ -0,0 +1,335 @@
+"""
+    Name: benchmark.py
+    Author: Jed Felker
+    Created: 10/18/26
+    Purpose: Time the DBOperations data layer and the GUI
+    list refresh path at several table sizes, headless
+
+    python benchmark.py --sizes 1000 100000 1000000
+    python benchmark.py --baseline benchmark_baseline.json
+"""
+import argparse
+import json
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+import columnar
+import db_operations
+import validation
+
+FIRST_NAMES = (
+    "James", "Mary", "John", "Patricia", "Robert", "Jennifer", "Michael",
+    "Linda", "William", "Elizabeth", "David", "Barbara", "Richard", "Susan",
+    "Joseph", "Jessica", "Thomas", "Sarah", "Charles", "Karen",
+)
+LAST_NAMES = (
+    "Smith", "Johnson", "Williams", "Brown", "Jones", "Garcia", "Miller",
+    "Davis", "Rodriguez", "Martinez", "Hernandez", "Lopez", "Gonzalez",
+    "Wilson", "Anderson", "Thomas", "Taylor", "Moore", "Jackson", "Martin",
+)
+DOMAINS = ("example.com", "mail.com", "work.org", "school.edu")
+
+
+# -------------------------- SYNTHETIC CONTACTS -----------------------------#
+def generate_contacts(count: int, seed: int = 0):
+    """Yield count random (first_name, last_name, phone, email) tuples"""
+    rng = random.Random(seed)
+    for number in range(count):
+        first_name = rng.choice(FIRST_NAMES)
+        # A number suffix keeps last names from being too repetitive
+        last_name = f"{rng.choice(LAST_NAMES)}{rng.randrange(1000)}"
+        phone = (
+            f"({rng.randrange(200, 1000)}) "
+            f"{rng.randrange(200, 1000)}-{rng.randrange(10000):04}"
+        )
+        email = f"{first_name.lower()}.{number}@{rng.choice(DOMAINS)}"
+        yield first_name, last_name, phone, email
+
+
+# -------------------------- STUBBED TREEVIEW -------------------------------#
+class StubTree:
+    """Stand-in for ttk.Treeview with the calls the virtual list makes"""
+
+    def __init__(self):
+        self.items = {}
+        self.order = []
+        self.selected = ()
+
+    def get_children(self, item=""):
+        return tuple(self.order)
+
+    def delete(self, *iids):
+        for iid in iids:
+            self.order.remove(iid)
+            del self.items[iid]
+
+    def exists(self, iid):
+        return iid in self.items
+
+    def item(self, iid, option=None, **options):
+        self.items[iid].update(options)
+        return self.items[iid]
+
+    def move(self, iid, parent, index):
+        self.order.remove(iid)
+        self.order.insert(index, iid)
+
+    def insert(self, parent, index, iid=None, **options):
+        self.items[iid] = options
+        self.order.insert(index, iid)
+        return iid
+
+    def selection(self):
+        return tuple(iid for iid in self.selected if iid in self.items)
+
+    def selection_set(self, items):
+        self.selected = tuple(items)
+
+
+class StubScrollbar:
+    def set(self, first, last):
+        self.position = (first, last)
+
+
+def make_stub_gui(db_op):
+    """AddressBook with a stubbed tree, no Tk window is created"""
+    # Imported here so the data layer benchmarks don't need tkinter
+    from address_book_gui import AddressBook
+    gui = AddressBook.__new__(AddressBook)
+    gui.db_op = db_op
+    gui.tree = StubTree()
+    gui.scrollbar = StubScrollbar()
+    gui.page_rows = 10
+    gui.buffer_size = gui.page_rows * 5
+    gui.total_rows = 0
+    gui.top_row = 0
+    gui.buffer_start = 0
+    gui.buffer = []
+    gui.metrics = db_op.metrics
+    gui.refresh_started = None
+    gui.selected_records = {}
+    gui.visible = {}
+    gui.sort_column = "last_name"
+    gui.sort_descending = True
+    gui.column_index = {
+        column: index for index, column in enumerate(
+            ("id", "first_name", "last_name", "phone", "email"))
+    }
+    return gui
+
+
+def tree_refresh(gui, top):
+    """Count, load the page at top and draw it, like a GUI refresh
+
+    The same steps the GUI runs through the database worker,
+    called directly so the time is not spent waiting on a queue."""
+    gui.total_rows = gui.db_op.count_records()
+    gui.buffer_start, gui.buffer = gui.read_rows(
+        0, [], top, gui.sort_column, gui.sort_descending)
+    gui.top_row = top
+    gui.draw_rows()
+
+
+# -------------------------- TIMING -----------------------------------------#
+def time_calls(function, arguments):
+    """Call function once per argument tuple, return per call seconds"""
+    times = []
+    for args in arguments:
+        start = time.perf_counter()
+        function(*args)
+        times.append(time.perf_counter() - start)
+    return times
+
+
+def summarize(times, rows=None):
+    """Result entry for one benchmark"""
+    result = {
+        "calls": len(times),
+        "median_seconds": statistics.median(times),
+        "mean_seconds": statistics.fmean(times),
+        "max_seconds": max(times),
+    }
+    if rows is not None:
+        total = sum(times)
+        result["rows"] = rows
+        result["rows_per_second"] = rows / total if total else 0
+    return result
+
+
+def run_size(size: int, operations: int, profile: str, directory: str):
+    """Run every benchmark against a table of size rows"""
+    path = os.path.join(directory, f"bench_{size}.db")
+    rng = random.Random(size)
+    results = {}
+    with db_operations.DBOperations(path, profile=profile) as db_op:
+        db_op.create_table()
+
+        # Build the table with the bulk insert path
+        start = time.perf_counter()
+        db_op.insert_records(generate_contacts(size), chunk_size=5000)
+        results["insert_records"] = summarize(
+            [time.perf_counter() - start], rows=size)
+        # The normalization stage of insert_records on its own
+        records = list(generate_contacts(size))
+        results["prepare_batch"] = summarize(time_calls(
+            validation.prepare_batch, [(records,)]), rows=size)
+        del records
+
+        contacts = list(generate_contacts(operations, seed=size + 1))
+        results["insert_record"] = summarize(
+            time_calls(db_op.insert_record, contacts))
+
+        ids = [rng.randrange(1, size + 1) for _ in range(operations)]
+        results["update_record"] = summarize(time_calls(
+            db_op.update_record,
+            [contact + (id,) for contact, id in zip(contacts, ids)]
+        ))
+
+        results["fetch_all_records"] = summarize(
+            time_calls(db_op.fetch_all_records, [()] * 3), rows=size)
+
+        offsets = [(rng.randrange(size),) for _ in range(operations)]
+
+        def jump(offset):
+            key = db_op.fetch_key_at(offset, descending=True)
+            db_op.fetch_page(after=key, limit=50, descending=True)
+        results["fetch_page"] = summarize(time_calls(jump, offsets))
+
+        prefixes = [
+            (rng.choice(LAST_NAMES)[:rng.randrange(2, 5)],)
+            for _ in range(operations)
+        ]
+        results["search_records"] = summarize(
+            time_calls(db_op.search_records, prefixes))
+
+        gui = make_stub_gui(db_op)
+        results["tree_refresh"] = summarize(
+            time_calls(lambda top: tree_refresh(gui, top), offsets))
+
+        dump_path = os.path.join(directory, f"bench_{size}.sql")
+        results["database_dump"] = summarize(time_calls(
+            db_op.database_dump, [(dump_path,)]), rows=size)
+        restore_path = os.path.join(directory, f"restore_{size}.db")
+        with db_operations.DBOperations(
+            restore_path, profile=profile
+        ) as restore_op:
+            results["restore"] = summarize(time_calls(
+                restore_op.restore, [(dump_path,)]), rows=size)
+
+        # The columnar export against the SQL dump it replaces
+        columnar_path = os.path.join(directory, f"bench_{size}.abcol")
+        results["columnar_export"] = summarize(time_calls(
+            db_op.columnar_export, [(columnar_path,)]), rows=size)
+        results["columnar_scan"] = summarize(time_calls(
+            columnar_scan, [(columnar_path,)]), rows=size)
+        files = {
+            "sql_dump_bytes": os.path.getsize(dump_path),
+            "columnar_bytes": os.path.getsize(columnar_path),
+        }
+
+        # Deleted last so the other benchmarks see every row
+        results["delete_record"] = summarize(time_calls(
+            db_op.delete_record,
+            [(id,) for id in sorted(set(ids))]
+        ))
+    return results, files
+
+
+def columnar_scan(path: str) -> int:
+    """Read every value of a columnar file, return the rows read"""
+    rows = 0
+    with columnar.ColumnarReader(path) as reader:
+        for record in reader.iter_records():
+            rows += 1
+    return rows
+
+
+# -------------------------- BASELINE COMPARE -------------------------------#
+def compare(results: dict, baseline: dict, tolerance: float) -> list:
+    """List the benchmarks whose median got slower than tolerance allows"""
+    regressions = []
+    for size, benchmarks in results["sizes"].items():
+        for name, result in benchmarks.items():
+            base = baseline.get("sizes", {}).get(size, {}).get(name)
+            if not base or not base["median_seconds"]:
+                continue
+            ratio = result["median_seconds"] / base["median_seconds"]
+            if ratio > 1 + tolerance:
+                regressions.append((size, name, ratio))
+    return regressions
+
+
+def print_results(results: dict):
+    for size, benchmarks in results["sizes"].items():
+        print(f"\n{size} rows")
+        for name, result in benchmarks.items():
+            line = f"  {name:<20}{result['median_seconds'] * 1000:>12.3f} ms"
+            if "rows_per_second" in result:
+                line += f"{result['rows_per_second']:>16,.0f} rows/sec"
+            print(line)
+        files = results["files"][size]
+        for name, value in files.items():
+            print(f"  {name:<32}{value:>16,}")
+        print(
+            f"  {'columnar size vs SQL dump':<32}"
+            f"{files['columnar_bytes'] / files['sql_dump_bytes']:>16.1%}")
+
+
+# -------------------------- MAIN -------------------------------------------#
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[4])
+    parser.add_argument(
+        "--sizes", type=int, nargs="+", default=[1000, 100000, 1000000])
+    parser.add_argument(
+        "--operations", type=int, default=200,
+        help="calls per single row benchmark")
+    parser.add_argument(
+        "--profile", choices=list(db_operations.PROFILES), default="safe")
+    parser.add_argument(
+        "--output", default="benchmark_results.json",
+        help="JSON file the results are written to")
+    parser.add_argument(
+        "--baseline", help="JSON results of an earlier run to compare with")
+    parser.add_argument(
+        "--tolerance", type=float, default=0.2,
+        help="allowed slowdown against the baseline (0.2 = 20%%)")
+    args = parser.parse_args(argv)
+
+    results = {
+        "python": sys.version.split()[0],
+        "sqlite": db_operations.sqlite3.sqlite_version,
+        "profile": args.profile,
+        "sizes": {},
+        "files": {},
+    }
+    with tempfile.TemporaryDirectory() as directory:
+        for size in args.sizes:
+            print(f"Benchmarking {size} rows...")
+            (
+                results["sizes"][str(size)],
+                results["files"][str(size)],
+            ) = run_size(size, args.operations, args.profile, directory)
+
+    print_results(results)
+    with open(args.output, "w") as file:
+        json.dump(results, file, indent=2)
+    print(f"\nResults written to {args.output}")
+
+    if args.baseline:
+        with open(args.baseline) as file:
+            baseline = json.load(file)
+        regressions = compare(results, baseline, args.tolerance)
+        for size, name, ratio in regressions:
+            print(f"REGRESSION {name} at {size} rows: {ratio:.2f}x slower")
+        if regressions:
+            return 1
+        print("No regressions against the baseline.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,317 @@
+"""
+    Name: columnar.py
+    Author: Jed Felker
+    Created: 10/18/26
+    Purpose: Compact column by column file of address book records
+    for analytics tools, and a memory mapped reader that hands out
+    the stored arrays without copying them.
+
+    Layout, all numbers little endian:
+        MAGIC
+        row group 1: every column's buffers, each 8 byte aligned
+        row group 2: ...
+        footer: JSON describing each buffer's offset and length
+        footer length (8 bytes), MAGIC
+
+    Columns are stored one of three ways:
+        int64:      the ids as an array of 8 byte integers
+        plain:      uint32 offsets (one more than the rows) + UTF-8 data
+        dictionary: the distinct values (as plain) + uint32 codes
+    The email is split at the last "@", the part before is stored
+    plain and the "@domain" part as a dictionary. A column with NULLs
+    also gets a mask, one byte per row, 1 for NULL.
+"""
+# Typed arrays of the offsets, codes and ids
+from array import array
+from itertools import accumulate
+import json
+# The reader maps the file instead of reading it
+import mmap
+import sys
+
+MAGIC = b"ABCOL1\0\0"
+# Footer length is stored as 8 bytes before the closing MAGIC
+TRAILER = 8 + len(MAGIC)
+# Dictionary encode a column when it has at most this share of
+# distinct values in a row group
+DICTIONARY_RATIO = 0.5
+# Arrays are written little endian, swapped on big endian machines
+SWAP = sys.byteorder == "big"
+
+
+# -------------------------- WRITER -----------------------------------------#
+class ColumnarWriter:
+    def __init__(self, path: str, columns: tuple):
+        """columns are the names of the record tuples' values, the
+        first (id) is stored as int64, "email" is split, the rest are
+        text. Use as a context manager or call close()."""
+        self.path = path
+        self.columns = columns
+        self.file = open(path, "wb")
+        self.file.write(MAGIC)
+        self.position = len(MAGIC)
+        self.row_groups = []
+        self.rows = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def write_row_group(self, records: list):
+        """Encode and write one batch of record tuples"""
+        if not records:
+            return
+        chunks = {}
+        for name, values in zip(self.columns, zip(*records)):
+            if name == self.columns[0]:
+                chunks[name] = self.write_int64(values)
+            elif name == "email":
+                chunks[name] = self.write_email(values)
+            else:
+                chunks[name] = self.write_text(values)
+        self.row_groups.append({"rows": len(records), "columns": chunks})
+        self.rows += len(records)
+
+    def write_buffer(self, data) -> list:
+        """Write bytes or an array 8 byte aligned, return [offset, length]"""
+        if isinstance(data, array):
+            if SWAP:
+                data = array(data.typecode, data)
+                data.byteswap()
+            data = data.tobytes()
+        offset = self.position
+        self.file.write(data)
+        padding = -len(data) % 8
+        self.file.write(b"\0" * padding)
+        self.position += len(data) + padding
+        return [offset, len(data)]
+
+    def write_int64(self, values) -> dict:
+        return {"encoding": "int64", "values": self.write_buffer(
+            array("q", values))}
+
+    def write_strings(self, values) -> dict:
+        """Offsets and data buffers of a list of str"""
+        encoded = [value.encode("utf-8") for value in values]
+        offsets = array("I", accumulate(map(len, encoded), initial=0))
+        return {
+            "offsets": self.write_buffer(offsets),
+            "data": self.write_buffer(b"".join(encoded)),
+        }
+
+    def write_text(self, values) -> dict:
+        """Dictionary or plain encoded text column, whichever is smaller"""
+        chunk = {}
+        if None in values:
+            chunk["nulls"] = self.write_buffer(
+                bytes(value is None for value in values))
+            values = ["" if value is None else value for value in values]
+        values = [value if type(value) is str else str(value)
+                  for value in values]
+        codes = {}
+        # setdefault numbers each new value in order of first use
+        indexes = array(
+            "I", (codes.setdefault(value, len(codes)) for value in values))
+        if len(codes) <= len(values) * DICTIONARY_RATIO:
+            chunk["encoding"] = "dictionary"
+            chunk["dictionary"] = self.write_strings(list(codes))
+            chunk["codes"] = self.write_buffer(indexes)
+        else:
+            chunk["encoding"] = "plain"
+            chunk.update(self.write_strings(values))
+        return chunk
+
+    def write_email(self, values) -> dict:
+        """Split at the last "@", the domains repeat a lot"""
+        chunk = {"encoding": "email"}
+        if None in values:
+            chunk["nulls"] = self.write_buffer(
+                bytes(value is None for value in values))
+        locals_, domains = [], []
+        for value in values:
+            value = "" if value is None else str(value)
+            at = value.rfind("@")
+            if at < 0:
+                locals_.append(value)
+                domains.append("")
+            else:
+                locals_.append(value[:at])
+                domains.append(value[at:])
+        chunk["local"] = self.write_text(locals_)
+        chunk["domain"] = self.write_text(domains)
+        return chunk
+
+    def close(self):
+        """Write the footer, the file is only readable after this"""
+        if self.file is None:
+            return
+        footer = json.dumps({
+            "columns": list(self.columns),
+            "rows": self.rows,
+            "row_groups": self.row_groups,
+        }).encode("utf-8")
+        self.file.write(footer)
+        self.file.write(len(footer).to_bytes(8, "little"))
+        self.file.write(MAGIC)
+        self.file.close()
+        self.file = None
+
+
+# -------------------------- READER -----------------------------------------#
+class StringColumn:
+    """Plain encoded strings, decoded one at a time when indexed"""
+
+    def __init__(self, offsets, data, nulls=None):
+        self.offsets = offsets
+        self.data = data
+        self.nulls = nulls
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, index: int):
+        if self.nulls is not None and self.nulls[index]:
+            return None
+        return str(
+            self.data[self.offsets[index]:self.offsets[index + 1]], "utf-8")
+
+    def __iter__(self):
+        for index in range(len(self)):
+            yield self[index]
+
+
+class DictionaryColumn:
+    """codes index into dictionary, a list of the distinct values
+
+    Tools that group or count by the column can use codes directly."""
+
+    def __init__(self, dictionary: list, codes, nulls=None):
+        self.dictionary = dictionary
+        self.codes = codes
+        self.nulls = nulls
+
+    def __len__(self):
+        return len(self.codes)
+
+    def __getitem__(self, index: int):
+        if self.nulls is not None and self.nulls[index]:
+            return None
+        return self.dictionary[self.codes[index]]
+
+    def __iter__(self):
+        if self.nulls is None:
+            dictionary = self.dictionary
+            return (dictionary[code] for code in self.codes)
+        return (self[index] for index in range(len(self)))
+
+
+class EmailColumn:
+    """The local part and the @domain joined back together"""
+
+    def __init__(self, local, domain, nulls=None):
+        self.local = local
+        self.domain = domain
+        self.nulls = nulls
+
+    def __len__(self):
+        return len(self.local)
+
+    def __getitem__(self, index: int):
+        if self.nulls is not None and self.nulls[index]:
+            return None
+        return self.local[index] + self.domain[index]
+
+    def __iter__(self):
+        return (self[index] for index in range(len(self)))
+
+
+class ColumnarReader:
+    def __init__(self, path: str):
+        """Map a file written by ColumnarWriter
+
+        Only the footer is read now. The ids, offsets and codes are
+        memoryviews straight into the mapped file, pages are read by
+        the OS when a tool touches them."""
+        self.file = open(path, "rb")
+        self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        self.buffer = memoryview(self.map)
+        if self.buffer[:len(MAGIC)] != MAGIC or (
+            self.buffer[-len(MAGIC):] != MAGIC
+        ):
+            self.close()
+            raise ValueError(f"{path} is not a columnar address book file")
+        length = int.from_bytes(
+            self.buffer[-TRAILER:-len(MAGIC)], "little")
+        footer = json.loads(
+            bytes(self.buffer[-TRAILER - length:-TRAILER]))
+        self.columns = tuple(footer["columns"])
+        self.rows = footer["rows"]
+        self.row_groups = footer["row_groups"]
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def view(self, location: list, typecode: str = None):
+        """memoryview of a stored buffer, cast to typecode if given"""
+        offset, length = location
+        view = self.buffer[offset:offset + length]
+        if typecode is None:
+            return view
+        if SWAP:
+            # Big endian machines need a swapped copy
+            values = array(typecode, view)
+            values.byteswap()
+            return memoryview(values)
+        return view.cast(typecode)
+
+    def decode(self, chunk: dict):
+        """Column object for one column chunk of a row group"""
+        nulls = self.view(chunk["nulls"]) if "nulls" in chunk else None
+        encoding = chunk["encoding"]
+        if encoding == "int64":
+            return self.view(chunk["values"], "q")
+        if encoding == "plain":
+            return StringColumn(
+                self.view(chunk["offsets"], "I"),
+                self.view(chunk["data"]),
+                nulls
+            )
+        if encoding == "dictionary":
+            # The dictionary is small, it is decoded once
+            dictionary = list(StringColumn(
+                self.view(chunk["dictionary"]["offsets"], "I"),
+                self.view(chunk["dictionary"]["data"])
+            ))
+            return DictionaryColumn(
+                dictionary, self.view(chunk["codes"], "I"), nulls)
+        if encoding == "email":
+            return EmailColumn(
+                self.decode(chunk["local"]),
+                self.decode(chunk["domain"]),
+                nulls
+            )
+        raise ValueError(f"Unknown column encoding {encoding!r}")
+
+    def column(self, name: str, row_group: int):
+        """One column of one row group, see decode()"""
+        return self.decode(self.row_groups[row_group]["columns"][name])
+
+    def iter_records(self, columns: tuple = None):
+        """Yield record tuples of the columns (all by default)"""
+        columns = columns or self.columns
+        for number in range(len(self.row_groups)):
+            yield from zip(*(
+                self.column(name, number) for name in columns))
+
+    def close(self):
+        """Unmap the file, drop every column taken from it first
+
+        mmap raises BufferError while a view into it is still held."""
+        self.buffer.release()
+        self.map.close()
+        self.file.close()
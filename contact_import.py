@@ -0,0 +1,205 @@
+"""
+    Name: contact_import.py
+    Author: Jed Felker
+    Created: 10/18/26
+    Purpose: Stream contacts from CSV and vCard files
+    into the address book in bulk
+"""
+# Read CSV files one row at a time
+import csv
+# Resume key is the absolute path of the imported file
+import os
+# Time the import to report rows/sec
+import time
+
+# Rejected rows printed, the rest are only counted
+MAX_REJECTS_SHOWN = 10
+
+# CSV header names accepted for each column
+# Headers are lower cased and spaces replaced with _ before the lookup
+CSV_COLUMNS = {
+    "first_name": ("first_name", "first", "given_name", "firstname"),
+    "last_name": ("last_name", "last", "family_name", "surname", "lastname"),
+    "phone": ("phone", "phone_number", "telephone", "mobile", "tel"),
+    "email": ("email", "e-mail", "email_address", "mail"),
+}
+
+
+# -------------------------- READ CSV ---------------------------------------#
+def read_csv(path: str):
+    """Yield (first_name, last_name, phone, email) tuples from a CSV file"""
+    # newline="" lets the csv module handle quoted line breaks
+    with open(path, newline="", encoding="utf-8-sig") as file:
+        reader = csv.reader(file)
+        header = next(reader, None)
+        if header is None:
+            return
+        header = [name.strip().lower().replace(" ", "_") for name in header]
+        # Find the position of each column once, not for every row
+        positions = []
+        for column, names in CSV_COLUMNS.items():
+            position = None
+            for name in names:
+                if name in header:
+                    position = header.index(name)
+                    break
+            positions.append(position)
+
+        for row in reader:
+            if not row:
+                continue
+            yield tuple(
+                row[position].strip()
+                if position is not None and position < len(row) else ""
+                for position in positions
+            )
+
+
+# -------------------------- READ VCARD -------------------------------------#
+def _unfold(file):
+    """Join vCard continuation lines (lines starting with a space/tab)"""
+    line = None
+    for raw in file:
+        raw = raw.rstrip("\r\n")
+        if raw[:1] in (" ", "\t") and line is not None:
+            line += raw[1:]
+            continue
+        if line is not None:
+            yield line
+        line = raw
+    if line is not None:
+        yield line
+
+
+def _unescape(value: str) -> str:
+    """Remove vCard backslash escapes"""
+    return (
+        value.replace("\\n", " ")
+        .replace("\\N", " ")
+        .replace("\\,", ",")
+        .replace("\\;", ";")
+        .replace("\\\\", "\\")
+    )
+
+
+def read_vcard(path: str):
+    """Yield (first_name, last_name, phone, email) tuples from a vCard file"""
+    with open(path, encoding="utf-8-sig") as file:
+        card = None
+        for line in _unfold(file):
+            if ":" not in line:
+                continue
+            name, value = line.split(":", 1)
+            # Drop parameters (TEL;TYPE=CELL) and groups (item1.EMAIL)
+            name = name.split(";", 1)[0].rsplit(".", 1)[-1].upper()
+
+            if name == "BEGIN" and value.strip().upper() == "VCARD":
+                card = {}
+            elif card is None:
+                continue
+            elif name == "END":
+                first_name = card.get("first_name", "")
+                last_name = card.get("last_name", "")
+                # Fall back to the formatted name if N: is missing
+                if not first_name and not last_name and "fn" in card:
+                    parts = card["fn"].rsplit(" ", 1)
+                    first_name = parts[0]
+                    last_name = parts[1] if len(parts) > 1 else ""
+                yield (
+                    first_name,
+                    last_name,
+                    card.get("phone", ""),
+                    card.get("email", ""),
+                )
+                card = None
+            elif name == "N":
+                # N:Last;First;Middle;Prefix;Suffix
+                parts = value.split(";")
+                card["last_name"] = _unescape(parts[0]).strip()
+                if len(parts) > 1:
+                    card["first_name"] = _unescape(parts[1]).strip()
+            elif name == "FN":
+                card["fn"] = _unescape(value).strip()
+            # Only the first phone and email of a card are kept
+            elif name == "TEL" and "phone" not in card:
+                card["phone"] = _unescape(value).strip()
+            elif name == "EMAIL" and "email" not in card:
+                card["email"] = _unescape(value).strip()
+
+
+# -------------------------- IMPORT FILE ------------------------------------#
+def read_contacts(path: str):
+    """Pick the reader from the file extension"""
+    if path.lower().endswith((".vcf", ".vcard")):
+        return read_vcard(path)
+    return read_csv(path)
+
+
+def import_file(
+    db_op,
+    path: str,
+    chunk_size: int = 1000,
+    resume: bool = True,
+    verbose: bool = True
+):
+    """Stream a CSV or vCard file into the database
+
+    Each chunk is committed in one transaction. If the import is
+    interrupted, running it again with resume=True continues after
+    the last committed chunk. Rows that are not valid contacts are
+    skipped, see validation.prepare_batch.
+    Returns (rows, seconds), rows includes the skipped rows."""
+    source = os.path.abspath(path)
+    if not resume:
+        db_op.clear_import_progress(source)
+    start_rows = db_op.import_progress(source)
+    start = time.perf_counter()
+
+    def report(rows_done):
+        if verbose:
+            elapsed = time.perf_counter() - start
+            rows = rows_done - start_rows
+            rate = rows / elapsed if elapsed else 0
+            print(f"{rows_done} rows committed ({rate:,.0f} rows/sec)")
+
+    # Rows read from the file, including rows skipped on resume
+    # None until the reader has been consumed to the end of the file
+    rows_read = [0, None]
+
+    def contacts():
+        for record in read_contacts(path):
+            rows_read[0] += 1
+            yield record
+        rows_read[1] = rows_read[0]
+
+    rejects = [0]
+
+    def rejected(row, record, problems):
+        rejects[0] += 1
+        if verbose and rejects[0] <= MAX_REJECTS_SHOWN:
+            # Row 1 is the first contact in the file
+            print(f"Skipped row {row + 1}: {'; '.join(problems)}")
+
+    rows_done = db_op.insert_records(
+        contacts(),
+        chunk_size=chunk_size,
+        source=source,
+        progress=report,
+        rejected=rejected
+    )
+    seconds = time.perf_counter() - start
+    rows = rows_done - start_rows
+
+    # The whole file was read and committed, the next import starts fresh
+    # Otherwise keep the saved position so the import can be resumed
+    if rows_read[1] == rows_done:
+        db_op.clear_import_progress(source)
+    if verbose:
+        rate = rows / seconds if seconds else 0
+        print(
+            f"Imported {rows} rows from {path} in {seconds:.2f} s "
+            f"({rate:,.0f} rows/sec)"
+        )
+        if rejects[0]:
+            print(f"{rejects[0]} rows were not valid contacts and skipped")
+    return rows, seconds
@@ -0,0 +1,170 @@
+"""
+    Name: db_executor.py
+    Author: Jed Felker
+    Created: 10/18/26
+    Purpose: Run DBOperations calls on a worker thread
+    and hand the results back to the Tkinter main loop
+"""
+# Worker thread that owns its own database connection
+from concurrent.futures import ThreadPoolExecutor
+# Finished jobs are passed back to the GUI thread through a queue
+import queue
+import sqlite3
+import threading
+
+
+class DBJob:
+    """One database call submitted to the executor"""
+    __slots__ = ("future", "callback", "error", "interruptible", "cancelled")
+
+    def __init__(self, callback, error, interruptible):
+        self.future = None
+        self.callback = callback
+        self.error = error
+        self.interruptible = interruptible
+        self.cancelled = False
+
+
+class DBExecutor:
+    def __init__(
+        self,
+        db_op,
+        window,
+        poll_ms: int = 20,
+        busy=None,
+        report=None
+    ):
+        """db_op is the DBOperations controller, window is the Tk root.
+
+        busy is called with True when the first job is submitted and
+        with False when the last pending job has been delivered.
+        report(message) shows a callback that raised, it is printed
+        if report is None."""
+        self.db_op = db_op
+        self.window = window
+        self.poll_ms = poll_ms
+        self.busy = busy
+        self.report = report
+        # One worker, so jobs run in the order they were submitted
+        # and the worker keeps one connection for its whole life
+        self.executor = ThreadPoolExecutor(
+            max_workers=1, thread_name_prefix="db_worker"
+        )
+        self.results = queue.Queue()
+        self.pending = 0
+        self.running = None
+        self.lock = threading.Lock()
+        self.stopped = False
+        self.poll_job = self.window.after(self.poll_ms, self.poll)
+
+# -------------------------- SUBMIT -----------------------------------------#
+    def submit(
+        self,
+        function,
+        *args,
+        callback=None,
+        error=None,
+        interruptible: bool = False
+    ) -> DBJob:
+        """Run function(*args) on the worker thread
+
+        callback(result) or error(exception) is later called on the
+        Tk thread. function must not touch any Tk widgets.
+        Only read-only jobs should be interruptible, cancelling them
+        aborts the running query with sqlite3 interrupt()."""
+        job = DBJob(callback, error, interruptible)
+        job.future = self.executor.submit(self.run, job, function, args)
+        self.pending += 1
+        if self.pending == 1 and self.busy is not None:
+            self.busy(True)
+        return job
+
+    def run(self, job, function, args):
+        """Worker thread side of a job"""
+        with self.lock:
+            self.running = job
+        try:
+            result = function(*args)
+            self.results.put((job, result, None))
+        except BaseException as e:
+            self.results.put((job, None, e))
+        finally:
+            with self.lock:
+                self.running = None
+
+# -------------------------- CANCEL -----------------------------------------#
+    def cancel(self, job: DBJob):
+        """Cancel a job, its callback will not be called"""
+        if job is None or job.cancelled:
+            return
+        job.cancelled = True
+        if job.future.cancel():
+            # Never started, it won't come back through the queue
+            self.job_done()
+            return
+        # The lock stops the worker moving on to the next job
+        # so only this job's query can be interrupted
+        with self.lock:
+            if self.running is job and job.interruptible:
+                self.db_op.interrupt()
+
+# -------------------------- POLL RESULTS -----------------------------------#
+    def poll(self):
+        """Deliver finished jobs on the Tk thread
+
+        A callback that raises is reported and the next job is still
+        delivered, the poll always runs again."""
+        try:
+            while not self.stopped:
+                try:
+                    job, result, e = self.results.get_nowait()
+                except queue.Empty:
+                    break
+                self.job_done()
+                if job.cancelled:
+                    continue
+                try:
+                    self.deliver(job, result, e)
+                except Exception as callback_error:
+                    self.report_error(callback_error)
+        finally:
+            # A callback may have closed the window
+            if not self.stopped:
+                self.poll_job = self.window.after(self.poll_ms, self.poll)
+
+    def deliver(self, job, result, e):
+        """Call the job's callback, or its error handler if it failed"""
+        if e is None:
+            if job.callback is not None:
+                job.callback(result)
+        elif job.error is not None:
+            job.error(e)
+        elif not isinstance(e, sqlite3.OperationalError) or (
+            "interrupted" not in str(e)
+        ):
+            print(f"There was an SQLite error: {e}")
+
+    def report_error(self, e: Exception):
+        """Show an exception raised by a callback"""
+        message = f"There was an error showing the result: {e}"
+        if self.report is None:
+            print(message)
+            return
+        try:
+            self.report(message)
+        except Exception:
+            print(message)
+
+    def job_done(self):
+        self.pending -= 1
+        if self.pending == 0 and self.busy is not None:
+            self.busy(False)
+
+# -------------------------- SHUTDOWN ---------------------------------------#
+    def shutdown(self):
+        """Finish the jobs already submitted and stop the worker"""
+        self.stopped = True
+        if self.poll_job is not None:
+            self.window.after_cancel(self.poll_job)
+            self.poll_job = None
+        self.executor.shutdown(wait=True)
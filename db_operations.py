@@ -7,42 +7,594 @@
 """
 # Import SQLite library to work with databases
 import sqlite3
+# Keep one connection per thread that uses the controller
+import threading
+# Split large record streams into chunks
+from itertools import islice
+# Search text and dump statement patterns
+import re
+# Compressed database dumps
+import contextlib
+import io
+# Write-behind journal progress is stored as JSON
+import json
+# Attached books are merged in sort order
+import heapq
+import os
+# Maintenance steps stop when their time budget runs out
+import time
+
+# Query latency histograms and counters
+import instrumentation
+from instrumentation import timed
+# Records are normalized and checked before they are written
+import validation
+from validation import phone_digits, email_key
+
+# Search text that only looks like a phone number
+PHONE_SEARCH = re.compile(r"[\d\s()+.-]+")
+# Columns the list can be sorted on and the full key used to page
+# through each one. The id at the end makes every key unique.
+# Each key has an index, see migration_sort_indexes
+SORT_KEYS = {
+    "id": ("id",),
+    "first_name": ("first_name", "last_name", "id"),
+    "last_name": ("last_name", "first_name", "id"),
+    "phone": ("phone", "id"),
+    "email": ("email", "id"),
+}
+# Columns of a record tuple, in the order every query returns them
+COLUMNS = ("id", "first_name", "last_name", "phone", "email")
+# Two records are duplicates when the names and email match
+# ignoring case and the phone numbers have the same digits
+DUPLICATE_KEY = (
+    "lower(first_name), lower(last_name), phone_digits, email_key")
+# Table a dumped CREATE TABLE or INSERT statement writes to
+DUMP_TARGET = re.compile(r"(?:CREATE TABLE|INSERT INTO)\s+[\"']?(\w+)")
+# Records listed across several books start with the book's name
+BOOK_COLUMNS = ("book",) + COLUMNS
+# Schema names of attached books, they are put into the SQL
+BOOK_NAME = re.compile(r"[A-Za-z_]\w*")
+
+
+# Named performance profiles, the PRAGMAs set on every new connection
+# safe:     fsync on every commit (SQLite defaults). The journal mode is
+#           stored in the file and left as it is, a rollback journal
+#           for a new file. Pass pragmas={"journal_mode": "DELETE"}
+#           to switch a WAL book back
+# balanced: WAL journal, fsync only at checkpoints, memory mapped reads
+# fast:     WAL journal, no fsync, bigger caches. A power loss can lose
+#           the last commits (but doesn't corrupt the file)
+# WAL doesn't work on network file systems, use safe there on a book
+# that has never been opened with balanced or fast
+PROFILES = {
+    "safe": {
+        "synchronous": "FULL",
+        "mmap_size": 0,
+        "cache_size": -2000,
+        "temp_store": "DEFAULT",
+        "busy_timeout": 5000,
+    },
+    "balanced": {
+        "journal_mode": "WAL",
+        "synchronous": "NORMAL",
+        "mmap_size": 64 * 1024 * 1024,
+        "cache_size": -16000,
+        "temp_store": "MEMORY",
+        "busy_timeout": 5000,
+    },
+    "fast": {
+        "journal_mode": "WAL",
+        "synchronous": "OFF",
+        "mmap_size": 256 * 1024 * 1024,
+        "cache_size": -64000,
+        "temp_store": "MEMORY",
+        "busy_timeout": 5000,
+    },
+}
+
+
+def open_dump(path: str, mode: str, compression: str = None):
+    """Open a SQL dump file as text, compressed or not
+
+    compression is None, "gzip" or "zstd". When it is None the file
+    extension decides (.gz or .zst), anything else is plain text.
+    zstd needs the optional zstandard package."""
+    if compression is None:
+        if path.endswith(".gz"):
+            compression = "gzip"
+        elif path.endswith(".zst"):
+            compression = "zstd"
+    if compression == "gzip":
+        # Imported here, most commands never read or write a dump
+        import gzip
+        return gzip.open(path, mode + "t", encoding="utf-8")
+    if compression == "zstd":
+        try:
+            import zstandard
+        except ImportError:
+            raise RuntimeError("zstd compression needs: pip install zstandard")
+        if mode == "w":
+            stream = zstandard.ZstdCompressor().stream_writer(open(path, "wb"))
+        else:
+            stream = zstandard.ZstdDecompressor().stream_reader(
+                open(path, "rb"))
+        return io.TextIOWrapper(stream, encoding="utf-8")
+    if compression is not None:
+        raise ValueError(f"Unknown compression {compression!r}")
+    return open(path, mode, encoding="utf-8")
+
+
+def sort_key(record, indexes) -> tuple:
+    """Sort key of a record the way SQLite orders it, NULL first"""
+    return tuple(
+        (record[index] is not None, record[index]) for index in indexes)
 
 
 class DBOperations:
-    def __init__(self, database: str):
+    def __init__(
+        self,
+        database: str,
+        cached_statements: int = 128,
+        profile: str = "safe",
+        pragmas: dict = None,
+        metrics: instrumentation.Metrics = None
+    ):
         self.database = database
+        # Trace every SQL statement run, see set_debugging()
         self.debugging = False
+        # Latency, row and error counts, pass one Metrics to share it
+        # between several controllers
+        self.metrics = metrics or instrumentation.Metrics()
+        # Performance profile, see PROFILES
+        # pragmas overrides single settings of the profile
+        if profile not in PROFILES:
+            raise ValueError(
+                f"Unknown profile {profile!r}, use one of {list(PROFILES)}")
+        self.profile = profile
+        self.pragmas = dict(PROFILES[profile])
+        for name, value in (pragmas or {}).items():
+            if name not in self.pragmas:
+                raise ValueError(f"Unknown PRAGMA {name!r}")
+            # PRAGMA values can't be ? parameters, only allow plain values
+            if not str(value).lstrip("-").isalnum():
+                raise ValueError(f"Invalid value {value!r} for {name}")
+            self.pragmas[name] = value
+        # Number of prepared statements each connection keeps compiled
+        # The same SQL text reuses the compiled statement on later calls
+        self.cached_statements = cached_statements
+        # Long lived connections keyed by thread id
+        # sqlite3 connections should only be used by one thread at a time
+        self._connections = {}
+        self._lock = threading.Lock()
+        # Threads inside a transaction() block, execute_sql doesn't
+        # commit their writes one at a time
+        self._transactions = set()
+        # Other address book files, schema name -> path, see attach_book
+        self.books = {}
+        # Number of books attached to each thread's connection
+        self._attached = {}
+        # Threads reading the books in parallel, started when needed
+        self._book_pool = None
+        # Threads whose own changes are tracked, see track_own_changes
+        self._tracking = set()
+
+# --------------------------- CONNECTION HANDLING ---------------------------#
+    def __enter__(self):
+        self.open()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def open(self) -> sqlite3.Connection:
+        """Open (or reuse) the connection for the calling thread"""
+        thread_id = threading.get_ident()
+        with self._lock:
+            connection = self._connections.get(thread_id)
+            if connection is None:
+                # If DATABASE does not exist, it is created
+                # check_same_thread is off so close() can run from any thread
+                # Each thread still only ever uses its own connection
+                connection = sqlite3.connect(
+                    self.database,
+                    cached_statements=self.cached_statements,
+                    check_same_thread=False
+                )
+                self.apply_pragmas(connection)
+                if self.debugging:
+                    connection.set_trace_callback(self.trace)
+                self._connections[thread_id] = connection
+                self._attached[thread_id] = 0
+                self.metrics.increment("connections_opened")
+            # Books attached since this connection was opened
+            if self._attached[thread_id] < len(self.books):
+                self.attach_books(connection, thread_id)
+        return connection
+
+    def apply_pragmas(self, connection: sqlite3.Connection):
+        """Set the performance profile on a new connection"""
+        pragmas = dict(self.pragmas)
+        # First, so the PRAGMAs below wait for another connection's
+        # lock instead of failing with "database is locked"
+        if "busy_timeout" in pragmas:
+            connection.execute(
+                f"PRAGMA busy_timeout = {pragmas.pop('busy_timeout')}")
+        if connection.execute("PRAGMA page_count").fetchone()[0] == 0:
+            # A new file, free pages can be given back a few at a time,
+            # see incremental_vacuum. It has to be set before anything
+            # is written, journal_mode = WAL already writes the header
+            # Older files switch on their next vacuum()
+            connection.execute("PRAGMA auto_vacuum = INCREMENTAL")
+        for name, value in pragmas.items():
+            try:
+                if name == "journal_mode" and connection.execute(
+                    "PRAGMA journal_mode"
+                ).fetchone()[0].upper() == str(value).upper():
+                    # Already in this mode, changing it would need the
+                    # file to itself
+                    continue
+                connection.execute(f"PRAGMA {name} = {value}")
+            except sqlite3.Error as e:
+                # journal_mode can't change while another process has
+                # the file open, keep going with the current mode
+                self.report_error(e, f"setting {name}")
+
+    def set_debugging(self, debugging: bool):
+        """Turn SQL statement tracing on or off for every connection"""
+        self.debugging = debugging
+        with self._lock:
+            connections = list(self._connections.values())
+        for connection in connections:
+            connection.set_trace_callback(self.trace if debugging else None)
+
+    def trace(self, statement: str):
+        """sqlite3 trace callback, prints each statement as it runs"""
+        self.metrics.increment("statements_traced")
+        print(f"SQL: {' '.join(statement.split())}")
+
+    def report_error(self, e: Exception, action: str = None):
+        """Print an SQLite error and count it"""
+        self.metrics.increment("errors")
+        if action:
+            print(f"There was an SQLite error {action}: {e}")
+        else:
+            print(f"There was an SQLite error: {e}")
+
+    def close(self):
+        """Close every connection opened by this controller"""
+        if self._book_pool is not None:
+            self._book_pool.shutdown(wait=True)
+            self._book_pool = None
+        with self._lock:
+            connections = list(self._connections.values())
+            self._connections.clear()
+            self._attached.clear()
+            self._tracking.clear()
+        for connection in connections:
+            connection.close()
+
+    def interrupt(self):
+        """Abort the queries running on any of the connections
+
+        Safe to call from another thread, used to cancel searches and
+        page loads that are no longer needed."""
+        with self._lock:
+            connections = list(self._connections.values())
+        for connection in connections:
+            connection.interrupt()
 
 # --------------------------- CREATE TABLE ----------------------------------#
     def create_table(self):
-        """Create database and table if not exists"""
-        # Drop table if needed to change table structure
-        SQL = "DROP TABLE IF EXISTS tbl_address_book"
-        self.execute_sql(SQL)
-        # Create the address_book table if it doesn't exist
-        SQL = """
+        """Create the database tables, or upgrade an existing database
+
+        The schema version is kept in PRAGMA user_version. Only the
+        migrations newer than that version run, each one in its own
+        transaction, so existing data is kept and upgraded in place."""
+        connection = self.open()
+        version = connection.execute("PRAGMA user_version").fetchone()[0]
+        for number, migration in enumerate(self.migrations(), start=1):
+            if number <= version:
+                continue
+            try:
+                # DDL doesn't open a transaction on its own
+                connection.execute("BEGIN")
+                migration(connection)
+                # PRAGMA values can't be ? parameters, number is an int
+                connection.execute(f"PRAGMA user_version = {number}")
+                connection.commit()
+            except Exception as e:
+                connection.rollback()
+                self.report_error(e)
+                return
+
+# --------------------------- SCHEMA MIGRATIONS -----------------------------#
+    def migrations(self) -> list:
+        """Schema changes in the order they were made
+
+        Never change or remove a migration that has shipped, add a new
+        one at the end. Its position in the list is its version."""
+        return [
+            self.migration_create_table,
+            self.migration_phone_digits,
+            self.migration_name_index,
+            self.migration_search_index,
+            self.migration_import_progress,
+            self.migration_sort_indexes,
+            self.migration_write_behind,
+            self.migration_change_log,
+            self.migration_email_key,
+            self.migration_blank_nulls,
+        ]
+
+    def migration_create_table(self, connection: sqlite3.Connection):
+        """1: The address book table as it was first released"""
+        connection.execute("""
             CREATE TABLE IF NOT EXISTS tbl_address_book(
             id          INTEGER PRIMARY KEY,
             first_name  TEXT,
             last_name   TEXT,
             phone       TEXT,
             email       TEXT
-        )"""
-        self.execute_sql(SQL)
+        )""")
+
+    def migration_phone_digits(self, connection: sqlite3.Connection):
+        """2: Indexed digits only copy of the phone number"""
+        columns = [
+            row[1] for row in
+            connection.execute("PRAGMA table_info(tbl_address_book)")
+        ]
+        # ADD COLUMN only changes the schema, rows aren't rewritten
+        if "phone_digits" not in columns:
+            connection.execute("""
+                ALTER TABLE tbl_address_book
+                ADD COLUMN phone_digits TEXT
+            """)
+        # Fill in the digits for the rows that are already there
+        rows = connection.execute("""
+            SELECT id, phone FROM tbl_address_book
+            WHERE phone_digits IS NULL
+        """).fetchall()
+        connection.executemany(
+            "UPDATE tbl_address_book SET phone_digits = ? WHERE id = ?",
+            ((phone_digits(phone), id) for id, phone in rows)
+        )
+        connection.execute("""
+            CREATE INDEX IF NOT EXISTS idx_address_book_phone_digits
+            ON tbl_address_book(phone_digits)
+        """)
+
+    def migration_name_index(self, connection: sqlite3.Connection):
+        """3: Index for the list sorted by last name, first name
+
+        It covers the ORDER BY of fetch_all_records and the keyset
+        pages of fetch_page, so neither needs a sort."""
+        connection.execute("""
+            DROP INDEX IF EXISTS idx_address_book_last_name
+        """)
+        connection.execute("""
+            CREATE INDEX IF NOT EXISTS idx_address_book_name
+            ON tbl_address_book(last_name, first_name, id)
+        """)
+
+    def migration_search_index(self, connection: sqlite3.Connection):
+        """4: FTS5 full text index over names, phone and email
+
+        fts_address_book is an external content table, it only stores
+        the index and reads the text from tbl_address_book.
+        Triggers keep it in step with every insert, update and delete."""
+        connection.execute("""
+            CREATE VIRTUAL TABLE IF NOT EXISTS fts_address_book USING fts5(
+                first_name,
+                last_name,
+                phone,
+                email,
+                content='tbl_address_book',
+                content_rowid='id',
+                prefix='2 3'
+            )
+        """)
+        connection.execute("""
+            CREATE TRIGGER IF NOT EXISTS trg_address_book_ai
+            AFTER INSERT ON tbl_address_book BEGIN
+                INSERT INTO fts_address_book(
+                    rowid, first_name, last_name, phone, email)
+                VALUES(
+                    new.id, new.first_name, new.last_name,
+                    new.phone, new.email);
+            END
+        """)
+        connection.execute("""
+            CREATE TRIGGER IF NOT EXISTS trg_address_book_ad
+            AFTER DELETE ON tbl_address_book BEGIN
+                INSERT INTO fts_address_book(
+                    fts_address_book, rowid,
+                    first_name, last_name, phone, email)
+                VALUES(
+                    'delete', old.id, old.first_name, old.last_name,
+                    old.phone, old.email);
+            END
+        """)
+        connection.execute("""
+            CREATE TRIGGER IF NOT EXISTS trg_address_book_au
+            AFTER UPDATE ON tbl_address_book BEGIN
+                INSERT INTO fts_address_book(
+                    fts_address_book, rowid,
+                    first_name, last_name, phone, email)
+                VALUES(
+                    'delete', old.id, old.first_name, old.last_name,
+                    old.phone, old.email);
+                INSERT INTO fts_address_book(
+                    rowid, first_name, last_name, phone, email)
+                VALUES(
+                    new.id, new.first_name, new.last_name,
+                    new.phone, new.email);
+            END
+        """)
+        # Index the rows that are already in the table
+        connection.execute("""
+            INSERT INTO fts_address_book(fts_address_book) VALUES('rebuild')
+        """)
+
+    def migration_import_progress(self, connection: sqlite3.Connection):
+        """5: Resume position of bulk imports
+
+        Bulk imports record how many rows of each source file
+        have been committed so an interrupted import can resume."""
+        connection.execute("""
+            CREATE TABLE IF NOT EXISTS tbl_import_progress(
+            source      TEXT PRIMARY KEY,
+            rows_done   INTEGER NOT NULL
+        )""")
+
+    def migration_sort_indexes(self, connection: sqlite3.Connection):
+        """6: Indexes for sorting the list on the other columns
+
+        Every index ends with the rowid, so (phone) also orders
+        (phone, id). Sorting by id uses the table itself and last_name
+        uses idx_address_book_name."""
+        connection.execute("""
+            CREATE INDEX IF NOT EXISTS idx_address_book_first_name
+            ON tbl_address_book(first_name, last_name, id)
+        """)
+        connection.execute("""
+            CREATE INDEX IF NOT EXISTS idx_address_book_phone
+            ON tbl_address_book(phone)
+        """)
+        connection.execute("""
+            CREATE INDEX IF NOT EXISTS idx_address_book_email
+            ON tbl_address_book(email)
+        """)
+
+    def migration_write_behind(self, connection: sqlite3.Connection):
+        """7: How much of a write-behind journal has been committed
+
+        Saved in the same transaction as the journal's writes, so a
+        journal left by a crash is never applied twice. id_map is the
+        JSON {temporary id: record id} of the journal's inserts."""
+        connection.execute("""
+            CREATE TABLE IF NOT EXISTS tbl_write_behind(
+            journal         TEXT PRIMARY KEY,
+            entries_done    INTEGER NOT NULL,
+            id_map          TEXT NOT NULL
+        )""")
+
+    def migration_change_log(self, connection: sqlite3.Connection):
+        """8: Log of every insert, update and delete, see changes_since
+
+        Triggers add a row per change with the record's values, an
+        update logs a delete of the old values and an insert of the
+        new ones. AUTOINCREMENT keeps seq increasing even after the
+        newest rows are pruned."""
+        connection.execute("""
+            CREATE TABLE IF NOT EXISTS tbl_changes(
+            seq         INTEGER PRIMARY KEY AUTOINCREMENT,
+            op          TEXT NOT NULL,
+            id          INTEGER NOT NULL,
+            first_name  TEXT,
+            last_name   TEXT,
+            phone       TEXT,
+            email       TEXT
+        )""")
+        connection.execute("""
+            CREATE TRIGGER IF NOT EXISTS trg_changes_ai
+            AFTER INSERT ON tbl_address_book BEGIN
+                INSERT INTO tbl_changes(
+                    op, id, first_name, last_name, phone, email)
+                VALUES(
+                    'insert', new.id, new.first_name, new.last_name,
+                    new.phone, new.email);
+            END
+        """)
+        connection.execute("""
+            CREATE TRIGGER IF NOT EXISTS trg_changes_ad
+            AFTER DELETE ON tbl_address_book BEGIN
+                INSERT INTO tbl_changes(
+                    op, id, first_name, last_name, phone, email)
+                VALUES(
+                    'delete', old.id, old.first_name, old.last_name,
+                    old.phone, old.email);
+            END
+        """)
+        # Only changes to the listed columns, not phone_digits alone
+        connection.execute("""
+            CREATE TRIGGER IF NOT EXISTS trg_changes_au
+            AFTER UPDATE OF first_name, last_name, phone, email
+            ON tbl_address_book BEGIN
+                INSERT INTO tbl_changes(
+                    op, id, first_name, last_name, phone, email)
+                VALUES(
+                    'delete', old.id, old.first_name, old.last_name,
+                    old.phone, old.email);
+                INSERT INTO tbl_changes(
+                    op, id, first_name, last_name, phone, email)
+                VALUES(
+                    'insert', new.id, new.first_name, new.last_name,
+                    new.phone, new.email);
+            END
+        """)
+
+    def migration_email_key(self, connection: sqlite3.Connection):
+        """9: Indexed lower case copy of the email for exact lookups"""
+        columns = [
+            row[1] for row in
+            connection.execute("PRAGMA table_info(tbl_address_book)")
+        ]
+        if "email_key" not in columns:
+            connection.execute("""
+                ALTER TABLE tbl_address_book
+                ADD COLUMN email_key TEXT
+            """)
+        rows = connection.execute("""
+            SELECT id, email FROM tbl_address_book
+            WHERE email_key IS NULL
+        """).fetchall()
+        connection.executemany(
+            "UPDATE tbl_address_book SET email_key = ? WHERE id = ?",
+            ((email_key(email), id) for id, email in rows)
+        )
+        connection.execute("""
+            CREATE INDEX IF NOT EXISTS idx_address_book_email_key
+            ON tbl_address_book(email_key)
+        """)
+
+    def migration_blank_nulls(self, connection: sqlite3.Connection):
+        """10: NULL names, phones and emails become ""
+
+        Row value comparisons with NULL are never true, fetch_page
+        couldn't page past a NULL in a sort column. Every write path
+        stores "" now, see validation.clean."""
+        connection.execute("""
+            UPDATE tbl_address_book
+            SET first_name = IFNULL(first_name, ''),
+            last_name = IFNULL(last_name, ''),
+            phone = IFNULL(phone, ''),
+            email = IFNULL(email, ''),
+            phone_digits = IFNULL(phone_digits, ''),
+            email_key = IFNULL(email_key, '')
+            WHERE first_name IS NULL OR last_name IS NULL
+            OR phone IS NULL OR email IS NULL
+        """)
 
 # -------------------------- INSERT RECORD ----------------------------------#
+    @timed(rows=lambda id: 1)
     def insert_record(
         self,
         first_name: str,
         last_name: str,
         phone: str,
         email: str
-    ):
-        """Insert new record"""
+    ) -> int:
+        """Insert new record, return the new record id
+
+        The record is normalized first, ValidationError if it is
+        not valid, see validation.clean_record."""
+        first_name, last_name, phone, email = validation.clean_record(
+            first_name, last_name, phone, email)
         SQL = """
-            INSERT INTO tbl_address_book
-            VALUES(NULL, ?, ?, ?, ?)
+            INSERT INTO tbl_address_book(
+                first_name, last_name, phone, email, phone_digits, email_key)
+            VALUES(?, ?, ?, ?, ?, ?)
         """
         # Parameters are a tuple of variables or values
         # They are mapped to the ? ? placeholders of the query
@@ -50,31 +602,489 @@ class DBOperations:
             first_name,
             last_name,
             phone,
-            email
+            email,
+            phone_digits(phone),
+            email_key(email)
+        )
+        cursor = self.execute_sql(SQL, parameters)
+        if cursor is not None:
+            return cursor.lastrowid
+
+# -------------------------- INSERT RECORDS (BULK) --------------------------#
+    @timed(rows=lambda rows: rows)
+    def insert_records(
+        self,
+        records,
+        chunk_size: int = 1000,
+        source: str = None,
+        progress=None,
+        rejected=None
+    ) -> int:
+        """Insert many records, one transaction per chunk
+
+        records is any iterable of (first_name, last_name, phone, email)
+        tuples, it is consumed lazily one chunk at a time.
+        Each chunk is normalized in one go, invalid records are skipped
+        and rejected(row, record, problems) is called for each, row
+        counts from 0 at the start of records.
+        If source is given, the committed row count for that source is
+        saved in the same transaction as each chunk, and rows committed
+        by an earlier interrupted run are skipped.
+        progress is called with the total rows committed after each chunk.
+        Returns the number of rows committed, skipped rows included."""
+        SQL = """
+            INSERT INTO tbl_address_book(
+                first_name, last_name, phone, email, phone_digits, email_key)
+            VALUES(?, ?, ?, ?, ?, ?)
+        """
+        PROGRESS_SQL = """
+            INSERT OR REPLACE INTO tbl_import_progress
+            VALUES(?, ?)
+        """
+        connection = self.open()
+        # Skip the rows already committed for this source
+        rows_done = self.import_progress(source) if source else 0
+        iterator = islice(records, rows_done, None)
+        try:
+            while True:
+                chunk = list(islice(iterator, chunk_size))
+                if not chunk:
+                    break
+                if rejected is not None:
+                    def reject(index, record, problems, start=rows_done):
+                        rejected(start + index, record, problems)
+                else:
+                    reject = None
+                rows = validation.prepare_batch(chunk, reject)
+                # One transaction per chunk, commits when the with exits
+                # If anything fails the whole chunk is rolled back
+                with connection:
+                    connection.executemany(SQL, rows)
+                    if source:
+                        connection.execute(
+                            PROGRESS_SQL, (source, rows_done + len(chunk))
+                        )
+                rows_done += len(chunk)
+                if progress is not None:
+                    progress(rows_done)
+        except Exception as e:
+            self.report_error(e)
+        return rows_done
+
+    def import_progress(self, source: str) -> int:
+        """Rows already committed by an earlier import of source"""
+        SQL = """
+            SELECT rows_done FROM tbl_import_progress
+            WHERE source = ?
+        """
+        row = self.open().execute(SQL, (source,)).fetchone()
+        return row[0] if row else 0
+
+    def clear_import_progress(self, source: str):
+        """Forget the saved position of a finished import"""
+        SQL = """
+            DELETE FROM tbl_import_progress
+            WHERE source = ?
+        """
+        self.execute_sql(SQL, (source,))
+
+    def write_behind_progress(self, journal: str) -> tuple:
+        """(entries_done, id_map) of a write-behind journal"""
+        SQL = """
+            SELECT entries_done, id_map FROM tbl_write_behind
+            WHERE journal = ?
+        """
+        row = self.open().execute(SQL, (journal,)).fetchone()
+        if row is None:
+            return 0, {}
+        return row[0], {
+            int(temporary): id
+            for temporary, id in json.loads(row[1]).items()
+        }
+
+    def save_write_behind_progress(
+        self,
+        journal: str,
+        entries_done: int,
+        id_map: dict
+    ):
+        """Record the committed part of a journal, call in transaction()
+
+        Progress of older journals is dropped, they have been replaced."""
+        self.execute_sql(
+            "DELETE FROM tbl_write_behind WHERE journal != ?", (journal,))
+        self.execute_sql(
+            "INSERT OR REPLACE INTO tbl_write_behind VALUES(?, ?, ?)",
+            (journal, entries_done, json.dumps(id_map))
         )
-        self.execute_sql(SQL, parameters)
 
 # -------------------------- FETCH ALL RECORDS ------------------------------#
+    @timed()
     def fetch_all_records(self):
         """Fetch all records"""
         # Query to get all contacts
-        # SELECT * FROM selects all records from a table
-        # sorted by last name
+        # SELECT FROM selects all records from a table
+        # sorted by last name, then first name
         # desc (decsending) order for GUI Treeview
         # asc (ascending) order for CLI
+        # The name index returns the rows in this order, no sort needed
         SQL = """
-            SELECT * FROM tbl_address_book
-            ORDER BY last_name asc
-        """
-        with sqlite3.connect(self.database) as connection:
-            cursor = connection.cursor()
-            # fetchall() fetches the records returned by the SQL
-            # statement as a list of tuples
-            records = cursor.execute(SQL).fetchall()
+            SELECT id, first_name, last_name, phone, email
+            FROM tbl_address_book
+            ORDER BY last_name asc, first_name asc, id asc
+        """
+        connection = self.open()
+        # fetchall() fetches the records returned by the SQL
+        # statement as a list of tuples
+        records = connection.execute(SQL).fetchall()
         if records:
             return records
-        
+
+# -------------------------- FETCH RECORD -----------------------------------#
+    @timed()
+    def fetch_record(self, id: int):
+        """Fetch one record by id, None if it doesn't exist"""
+        SQL = """
+            SELECT id, first_name, last_name, phone, email
+            FROM tbl_address_book
+            WHERE id = ?
+        """
+        return self.open().execute(SQL, (id,)).fetchone()
+
+# -------------------------- FETCH PAGE (KEYSET PAGINATION) -----------------#
+    @timed(rows=lambda count: 0)
+    def count_records(self) -> int:
+        """Number of records in the address book"""
+        SQL = "SELECT COUNT(*) FROM tbl_address_book"
+        return self.open().execute(SQL).fetchone()[0]
+
+    @timed()
+    def fetch_page(
+        self,
+        after: tuple = None,
+        before: tuple = None,
+        limit: int = 100,
+        descending: bool = False,
+        sort: str = "last_name",
+        book: str = "main"
+    ) -> list:
+        """Fetch one page of records in sort column order
+
+        The full sort key of each column is in SORT_KEYS, the id at
+        the end makes every key unique. after and before are keys of
+        rows already shown, the page starts just after / ends just
+        before that row. The query walks the column's index from the
+        key, so every page costs the same no matter how deep into the
+        table it is. book is "main" or the name of an attached book.
+        Sort columns hold "" instead of NULL (see migration_blank_nulls),
+        a NULL in a key would match no rows."""
+        table = self.book_table(book, "tbl_address_book")
+        columns = self.sort_key_columns(sort)
+        key = ", ".join(columns)
+        placeholders = ", ".join("?" for column in columns)
+        # Compare in display order, flip the comparison for desc order
+        greater, less = (">", "<") if not descending else ("<", ">")
+        forward = ", ".join(
+            f"{column} {'DESC' if descending else 'ASC'}"
+            for column in columns)
+        backward = ", ".join(
+            f"{column} {'ASC' if descending else 'DESC'}"
+            for column in columns)
+        if after is not None:
+            SQL = f"""
+                SELECT id, first_name, last_name, phone, email
+                FROM {table}
+                WHERE ({key}) {greater} ({placeholders})
+                ORDER BY {forward}
+                LIMIT ?
+            """
+            parameters = (*after, limit)
+        elif before is not None:
+            # Walk backwards from the key, then put the page in order
+            SQL = f"""
+                SELECT id, first_name, last_name, phone, email
+                FROM {table}
+                WHERE ({key}) {less} ({placeholders})
+                ORDER BY {backward}
+                LIMIT ?
+            """
+            parameters = (*before, limit)
+        else:
+            SQL = f"""
+                SELECT id, first_name, last_name, phone, email
+                FROM {table}
+                ORDER BY {forward}
+                LIMIT ?
+            """
+            parameters = (limit,)
+        records = self.open().execute(SQL, parameters).fetchall()
+        if before is not None:
+            records.reverse()
+        return records
+
+    @timed(rows=lambda key: 0)
+    def fetch_key_at(
+        self,
+        offset: int,
+        descending: bool = False,
+        sort: str = "last_name"
+    ) -> tuple:
+        """Sort key of the row at offset in sort column order
+
+        Used to jump to a scrollbar position. OFFSET steps over every
+        index entry before the row, so the cost grows with offset (only
+        the index is read, not the rows). Scrolling from a shown row
+        uses fetch_page, whose cost doesn't depend on the position."""
+        columns = self.sort_key_columns(sort)
+        order = ", ".join(
+            f"{column} {'DESC' if descending else 'ASC'}"
+            for column in columns)
+        SQL = f"""
+            SELECT {", ".join(columns)} FROM tbl_address_book
+            ORDER BY {order}
+            LIMIT 1 OFFSET ?
+        """
+        return self.open().execute(SQL, (offset,)).fetchone()
+
+    def sort_key_columns(self, sort: str) -> tuple:
+        """Columns of the sort key, only known columns reach the SQL"""
+        if sort not in SORT_KEYS:
+            raise ValueError(
+                f"Can't sort on {sort!r}, use one of {list(SORT_KEYS)}")
+        return SORT_KEYS[sort]
+
+    def iter_records(
+        self,
+        sort: str = "last_name",
+        descending: bool = False,
+        batch_size: int = 1000
+    ):
+        """Yield every record in sort column order, one page at a time
+
+        Each page is its own short query, so a slow reader (a pipe to
+        another program) never keeps a read transaction open."""
+        after = None
+        while True:
+            page = self.fetch_page(
+                after=after,
+                limit=batch_size,
+                descending=descending,
+                sort=sort
+            )
+            yield from page
+            if len(page) < batch_size:
+                return
+            after = tuple(
+                page[-1][COLUMNS.index(column)]
+                for column in self.sort_key_columns(sort)
+            )
+
+# -------------------------- SEARCH RECORDS ---------------------------------#
+    @timed()
+    def search_records(
+        self,
+        text: str,
+        limit: int = 500,
+        book: str = "main"
+    ) -> list:
+        """Search names, phone and email for words starting with text
+
+        Text that only looks like a phone number is matched against the
+        indexed phone digits, an email address (or the start of one)
+        against the indexed email keys. Everything else uses the FTS5
+        index with a prefix query for every word, all words must match.
+        Results are sorted by (last_name, first_name, id) in descending
+        order, the same order as the GUI list. The sort runs before the
+        limit, so with more matches than limit the first limit records
+        in that order are returned."""
+        table = self.book_table(book, "tbl_address_book")
+        fts_table = self.book_table(book, "fts_address_book")
+        text = text.strip()
+        if not text:
+            return []
+        digits = phone_digits(text)
+        if digits and PHONE_SEARCH.fullmatch(text):
+            # Digits sort before ":" so this range is every number
+            # that starts with the digits, read from the index
+            SQL = f"""
+                SELECT id, first_name, last_name, phone, email
+                FROM {table}
+                WHERE phone_digits >= ? AND phone_digits < ?
+                ORDER BY last_name DESC, first_name DESC, id DESC
+                LIMIT ?
+            """
+            parameters = (digits, digits + ":", limit)
+        elif "@" in text[1:] and " " not in text:
+            # Every key starting with the text, U+10FFFF sorts after
+            # any other character
+            key = email_key(text)
+            SQL = f"""
+                SELECT id, first_name, last_name, phone, email
+                FROM {table}
+                WHERE email_key >= ? AND email_key < ?
+                ORDER BY last_name DESC, first_name DESC, id DESC
+                LIMIT ?
+            """
+            parameters = (key, key + "\U0010ffff", limit)
+        else:
+            # "ann lee" -> "ann"* "lee"*, quotes are doubled inside words
+            query = " ".join(
+                '"' + word.replace('"', '""') + '"*' for word in text.split()
+            )
+            SQL = f"""
+                SELECT t.id, t.first_name, t.last_name, t.phone, t.email
+                FROM {fts_table} AS f
+                JOIN {table} AS t ON t.id = f.rowid
+                WHERE f.fts_address_book MATCH ?
+                ORDER BY t.last_name DESC, t.first_name DESC, t.id DESC
+                LIMIT ?
+            """
+            parameters = (query, limit)
+        # SQLite sorts the matches keeping only the first limit rows
+        try:
+            return self.open().execute(SQL, parameters).fetchall()
+        except sqlite3.Error as e:
+            self.report_error(e)
+            return []
+
+# -------------------------- ATTACHED BOOKS ---------------------------------#
+    def attach_book(self, path: str, name: str = None) -> str:
+        """Open another address book file next to this one
+
+        The book is attached to every connection with ATTACH DATABASE,
+        as schema name (the file name by default), which is returned.
+        Its tables are created or upgraded first. SQLite attaches at
+        most 10 books to a connection by default."""
+        if name is None:
+            name = re.sub(r"\W", "_", os.path.splitext(
+                os.path.basename(path))[0])
+            if not BOOK_NAME.fullmatch(name):
+                name = "book_" + name
+            # Two departments' files can have the same name
+            base, number = name, 2
+            while name in self.books or name.lower() in ("main", "temp"):
+                name, number = f"{base}_{number}", number + 1
+        if not BOOK_NAME.fullmatch(name) or name in self.books or (
+            name.lower() in ("main", "temp")
+        ):
+            raise ValueError(f"Invalid or duplicate book name {name!r}")
+        # The same file twice would list every record twice
+        if os.path.abspath(path) in (
+            os.path.abspath(book)
+            for book in [self.database, *self.books.values()]
+        ):
+            raise ValueError(f"{path} is already open")
+        with DBOperations(path) as book:
+            book.create_table()
+        with self._lock:
+            self.books[name] = path
+        # Attach it to this thread's connection now, the others
+        # attach it when they are next used, see open()
+        self.open()
+        return name
+
+    def attach_books(self, connection: sqlite3.Connection, thread_id: int):
+        """Attach the books this connection doesn't have yet, hold _lock"""
+        for name, path in list(self.books.items())[
+            self._attached[thread_id]:
+        ]:
+            try:
+                connection.execute("ATTACH DATABASE ? AS ?", (path, name))
+            except sqlite3.Error as e:
+                self.report_error(e, f"attaching {path}")
+            self._attached[thread_id] += 1
+
+    def book_names(self) -> list:
+        """This book ("main") and every attached book"""
+        return ["main", *self.books]
+
+    def book_table(self, book: str, table: str) -> str:
+        """Schema qualified table name, only known books reach the SQL"""
+        if book != "main" and book not in self.books:
+            raise ValueError(
+                f"No book {book!r}, use one of {self.book_names()}")
+        return f"{book}.{table}"
+
+    def book_pool(self):
+        """ThreadPoolExecutor reading the books in parallel, one thread
+        per book
+
+        sqlite3 lets go of the GIL while a query runs, so each book's
+        query runs on its own core on its own connection."""
+        if self._book_pool is None:
+            # Imported here, concurrent.futures loads logging and is
+            # only needed once several books are listed together
+            from concurrent.futures import ThreadPoolExecutor
+            # A few spare threads for books attached later
+            self._book_pool = ThreadPoolExecutor(
+                max_workers=len(self.books) + 4,
+                thread_name_prefix="db_book"
+            )
+        return self._book_pool
+
+    def iter_all_records(
+        self,
+        sort: str = "last_name",
+        descending: bool = False,
+        batch_size: int = 1000
+    ):
+        """Yield every record of every book in sort column order
+
+        Each record is (book, id, first_name, last_name, phone, email).
+        Every book is paged through on its own pool thread, the next
+        page of each book is read while the current one is merged.
+        The pages are merged as they arrive (a k-way merge on the sort
+        key), only one page per book is held at a time."""
+        columns = self.sort_key_columns(sort)
+        indexes = [COLUMNS.index(column) + 1 for column in columns]
+        pool = self.book_pool()
+
+        def book_records(book):
+            future = pool.submit(
+                self.fetch_page, None, None, batch_size,
+                descending, sort, book)
+            while future is not None:
+                page = future.result()
+                future = None
+                if len(page) == batch_size:
+                    # Read ahead while this page is merged
+                    after = tuple(
+                        page[-1][index - 1] for index in indexes)
+                    future = pool.submit(
+                        self.fetch_page, after, None, batch_size,
+                        descending, sort, book)
+                for record in page:
+                    yield (book, *record)
+
+        yield from heapq.merge(
+            *(book_records(book) for book in self.book_names()),
+            key=lambda record: sort_key(record, indexes),
+            reverse=descending
+        )
+
+    def search_all_records(self, text: str, limit: int = 500) -> list:
+        """search_records() in every book at once, merged in list order
+
+        Records are (book, id, first_name, last_name, phone, email)
+        sorted by (last_name, first_name, id) in descending order."""
+        pool = self.book_pool()
+        futures = {
+            book: pool.submit(self.search_records, text, limit, book)
+            for book in self.book_names()
+        }
+        # Each book's results are already in list order
+        merged = heapq.merge(
+            *(
+                [(book, *record) for record in future.result()]
+                for book, future in futures.items()
+            ),
+            key=lambda record: sort_key(record, (3, 2, 1)),
+            reverse=True
+        )
+        return list(islice(merged, limit))
+
 # -------------------------- UPDATE RECORD ----------------------------------#
+    @timed()
     def update_record(
         self,
         first_name: str,
@@ -83,13 +1093,19 @@ class DBOperations:
         email: str,
         id: int
     ):
-        """Update selected record by id"""
+        """Update selected record by id, return the updated record
+
+        ValidationError if the new values are not valid."""
+        first_name, last_name, phone, email = validation.clean_record(
+            first_name, last_name, phone, email)
         SQL = """
             UPDATE tbl_address_book
             SET first_name = ?,
             last_name = ?,
             phone = ?,
             email = ?,
+            phone_digits = ?,
+            email_key = ?
             WHERE id = ?
         """
         # Parameters are a tuple of variables or values
@@ -99,13 +1115,18 @@ class DBOperations:
             last_name,
             phone,
             email,
+            phone_digits(phone),
+            email_key(email),
             id
         )
-        self.execute_sql(SQL, parameters)
+        cursor = self.execute_sql(SQL, parameters)
+        if cursor is not None and cursor.rowcount:
+            return self.fetch_record(id)
 
 # -------------------------- DELETE RECORD ----------------------------------#
-    def delete_record(self, id: int):
-        """Deleter selected record by id"""
+    @timed(rows=lambda count: count)
+    def delete_record(self, id: int) -> int:
+        """Delete selected record by id, return the number of rows deleted"""
         SQL = """
             DELETE FROM tbl_address_book
             WHERE id = ?
@@ -115,44 +1136,632 @@ class DBOperations:
         parameters = (
             id,
         )
-        self.execute_sql(SQL, parameters)
+        cursor = self.execute_sql(SQL, parameters)
+        if cursor is not None:
+            return cursor.rowcount
+        return 0
+
+# -------------------------- BULK UPDATE AND DELETE -------------------------#
+    def execute_many(self, SQL: str, rows) -> int:
+        """executemany in one transaction, return the rows changed
+
+        Either every row is written or none is. Inside transaction()
+        the rows join that transaction under a savepoint instead."""
+        connection = self.open()
+        try:
+            if threading.get_ident() in self._transactions:
+                connection.execute("SAVEPOINT execute_many")
+                try:
+                    cursor = connection.executemany(SQL, rows)
+                except sqlite3.Error:
+                    connection.execute("ROLLBACK TO execute_many")
+                    raise
+                finally:
+                    connection.execute("RELEASE execute_many")
+            else:
+                # One commit for all the rows
+                connection.execute("BEGIN IMMEDIATE")
+                with connection:
+                    cursor = connection.executemany(SQL, rows)
+            return cursor.rowcount
+        except sqlite3.Error as e:
+            self.report_error(e)
+            return 0
+
+    @timed(rows=lambda count: count)
+    def update_records(self, records) -> int:
+        """Update many records, return the number of rows updated
+
+        records is an iterable of (first_name, last_name, phone, email,
+        id) tuples, the arguments of update_record. They are all checked
+        first, ValidationError if any is not valid and nothing changes."""
+        SQL = """
+            UPDATE tbl_address_book
+            SET first_name = ?,
+            last_name = ?,
+            phone = ?,
+            email = ?,
+            phone_digits = ?,
+            email_key = ?
+            WHERE id = ?
+        """
+        rows = []
+        for *values, id in records:
+            first, last, phone, email = validation.clean_record(*values)
+            rows.append((
+                first, last, phone, email,
+                phone_digits(phone), email_key(email), int(id)
+            ))
+        return self.execute_many(SQL, rows)
+
+    @timed(rows=lambda count: count)
+    def delete_records(self, ids) -> int:
+        """Delete many records by id, return the number of rows deleted"""
+        SQL = """
+            DELETE FROM tbl_address_book
+            WHERE id = ?
+        """
+        return self.execute_many(SQL, ((int(id),) for id in ids))
 
 # -------------------------- DATABASE DUMP TO SQL FILE ----------------------#
-    def database_dump(self):
+    def database_dump(
+        self,
+        path: str = "database_dump.sql",
+        sink=None,
+        compression: str = None,
+        progress=None,
+        progress_every: int = 10000
+    ) -> int:
+        """Write the database as SQL statements in one streaming pass
+
+        The dump goes to sink (any file-like object with write) if given,
+        otherwise to path, compressed with gzip or zstd if asked for or
+        if path ends in .gz or .zst.
+        progress is called with the number of statements written so far.
+        The full text search index is derived data, only its CREATE
+        statement is dumped and restore rebuilds it from the table.
+        Returns the number of statements written."""
+        statements = 0
         try:
-            with sqlite3.connect(self.database) as connection:
-                # Iterate through database, print SQL
+            connection = self.open()
+            # Virtual tables and their shadow tables are left out,
+            # iterdump() can't restore them
+            virtual_tables = connection.execute("""
+                SELECT name, sql FROM sqlite_master
+                WHERE type = 'table' AND sql LIKE 'CREATE VIRTUAL TABLE%'
+            """).fetchall()
+            skipped = tuple(name for name, sql in virtual_tables)
+            shadow = tuple(f"{name}_" for name in skipped)
+            # Use with context manager to write and close/save the file
+            with contextlib.ExitStack() as stack:
+                if sink is None:
+                    sink = stack.enter_context(
+                        open_dump(path, "w", compression))
+                # Iterate through database once, write SQL to file
                 for line in connection.iterdump():
-                    print(line)
-                
-                # Use with context manager to write and close/save the file
-                with open("database_dump.sql", "w") as file:
-                    # Iterate through database, write SQL to file
-                    for line in connection.iterdump():
-                        file.write(f"{line}\n")
-                print("File written to disk.")
+                    if line.startswith((
+                        "PRAGMA writable_schema", "INSERT INTO sqlite_master"
+                    )):
+                        continue
+                    target = DUMP_TARGET.match(line)
+                    if target and (
+                        target.group(1) in skipped
+                        or target.group(1).startswith(shadow)
+                    ):
+                        continue
+                    sink.write(f"{line}\n")
+                    statements += 1
+                    if progress is not None and (
+                        statements % progress_every == 0
+                    ):
+                        progress(statements)
+                # Recreate the search index after the data is loaded
+                for name, sql in virtual_tables:
+                    sink.write(f"{sql};\n")
+                    if "fts5" in sql.lower():
+                        sink.write(
+                            f"INSERT INTO {name}({name}) VALUES('rebuild');\n")
+                # iterdump() leaves out the schema version
+                version = connection.execute(
+                    "PRAGMA user_version").fetchone()[0]
+                sink.write(f"PRAGMA user_version = {version};\n")
+            if progress is not None:
+                progress(statements)
         except Exception as e:
-            print(f"There was an SQLite error: {e}")
+            self.report_error(e)
+        return statements
+
+# -------------------------- COLUMNAR EXPORT --------------------------------#
+    @timed(rows=lambda rows: rows)
+    def columnar_export(
+        self,
+        path: str = "address_book.abcol",
+        row_group_size: int = 65536,
+        progress=None
+    ) -> int:
+        """Write the records to a columnar file, see columnar.py
+
+        The table is read in one pass, fetchmany() hands over one row
+        group at a time and each group is encoded and written before
+        the next is read. Repeated names and email domains are
+        dictionary encoded. Read it back with columnar.ColumnarReader.
+        progress is called with the rows written so far.
+        Returns the number of rows written."""
+        SQL = """
+            SELECT id, first_name, last_name, phone, email
+            FROM tbl_address_book
+            ORDER BY id
+        """
+        # Imported here, only the columnar export needs it
+        import columnar
+        rows = 0
+        try:
+            cursor = self.open().execute(SQL)
+            with columnar.ColumnarWriter(path, COLUMNS) as writer:
+                while True:
+                    records = cursor.fetchmany(row_group_size)
+                    if not records:
+                        break
+                    writer.write_row_group(records)
+                    rows += len(records)
+                    if progress is not None:
+                        progress(rows)
+        except Exception as e:
+            self.report_error(e)
+        return rows
+
+# -------------------------- RESTORE SQL DUMP -------------------------------#
+    def restore(
+        self,
+        path: str = "database_dump.sql",
+        source=None,
+        compression: str = None,
+        batch_size: int = 10000,
+        progress=None
+    ) -> int:
+        """Replay a dump made by database_dump into this database
+
+        The database should be empty. Statements are run in
+        transactions of batch_size statements instead of one big
+        transaction (or one per row). A dump of an older version is
+        upgraded by the migrations it doesn't have yet.
+        Returns the number of statements run."""
+        statements = 0
+        connection = self.open()
+        try:
+            with contextlib.ExitStack() as stack:
+                if source is None:
+                    source = stack.enter_context(
+                        open_dump(path, "r", compression))
+                statement = ""
+                connection.execute("BEGIN")
+                for line in source:
+                    statement += line
+                    # CREATE statements and strings can span lines
+                    if not sqlite3.complete_statement(statement):
+                        continue
+                    command, statement = statement, ""
+                    # The dump's own transaction is replaced by batches
+                    if command.strip().upper() in (
+                        "BEGIN TRANSACTION;", "COMMIT;"
+                    ):
+                        continue
+                    connection.execute(command)
+                    statements += 1
+                    if statements % batch_size == 0:
+                        connection.commit()
+                        if progress is not None:
+                            progress(statements)
+                        connection.execute("BEGIN")
+            connection.commit()
+            if progress is not None:
+                progress(statements)
+        except Exception as e:
+            connection.rollback()
+            self.report_error(e)
+            return statements
+        # The dump set its own user_version
+        self.create_table()
+        return statements
+
+# -------------------------- ONLINE BACKUP ----------------------------------#
+    def backup(
+        self,
+        path: str,
+        pages: int = 256,
+        sleep: float = 0.005,
+        progress=None
+    ):
+        """Copy the live database to path with the SQLite backup API
+
+        pages are copied per step and the source is unlocked for sleep
+        seconds between steps, so writers are never blocked for long.
+        progress(status, remaining, total) is called after every step."""
+        try:
+            target = sqlite3.connect(path)
+            try:
+                self.open().backup(
+                    target, pages=pages, progress=progress, sleep=sleep)
+            finally:
+                target.close()
+        except Exception as e:
+            self.report_error(e)
+
+# -------------------------- DUPLICATES -------------------------------------#
+    @timed()
+    def find_duplicates(self) -> list:
+        """Records that have at least one duplicate
+
+        Returns (id, first_name, last_name, phone, email, keep) tuples,
+        keep is the lowest id of the group, the record that is kept."""
+        SQL = f"""
+            SELECT id, first_name, last_name, phone, email, keep
+            FROM (
+                SELECT *,
+                    min(id) OVER duplicates AS keep,
+                    count(*) OVER duplicates AS copies
+                FROM tbl_address_book
+                WINDOW duplicates AS (PARTITION BY {DUPLICATE_KEY})
+            )
+            WHERE copies > 1
+            ORDER BY keep, id
+        """
+        try:
+            return self.open().execute(SQL).fetchall()
+        except sqlite3.Error as e:
+            self.report_error(e)
+            return []
+
+    @timed(rows=lambda count: count)
+    def remove_duplicates(self) -> int:
+        """Delete every duplicate but the lowest id, return rows deleted"""
+        SQL = f"""
+            DELETE FROM tbl_address_book
+            WHERE id NOT IN (
+                SELECT min(id) FROM tbl_address_book
+                GROUP BY {DUPLICATE_KEY}
+            )
+        """
+        cursor = self.execute_sql(SQL, ())
+        return cursor.rowcount if cursor is not None else 0
+
+    @timed()
+    def merge_records(self, keep: int, duplicates) -> tuple:
+        """Merge duplicate records into the record keep
+
+        Empty fields of keep are filled from the duplicates, in the
+        order given, then the duplicates are deleted. All of it is one
+        transaction, either every record is merged or nothing changes.
+        Returns the merged record, None if a record doesn't exist."""
+        duplicates = [int(id) for id in duplicates if int(id) != int(keep)]
+        ids = [int(keep)] + duplicates
+        placeholders = ", ".join("?" for id in ids)
+        SELECT_SQL = f"""
+            SELECT id, first_name, last_name, phone, email
+            FROM tbl_address_book
+            WHERE id IN ({placeholders})
+        """
+        UPDATE_SQL = """
+            UPDATE tbl_address_book
+            SET first_name = ?, last_name = ?, phone = ?, email = ?,
+            phone_digits = ?, email_key = ?
+            WHERE id = ?
+        """
+        DELETE_SQL = "DELETE FROM tbl_address_book WHERE id = ?"
+        connection = self.open()
+        try:
+            # IMMEDIATE takes the write lock before the records are read
+            # so nobody can change them between the read and the merge
+            connection.execute("BEGIN IMMEDIATE")
+            with connection:
+                records = {
+                    record[0]: record
+                    for record in connection.execute(SELECT_SQL, ids)
+                }
+                if len(records) != len(set(ids)):
+                    return None
+                merged = list(records[ids[0]])
+                for id in duplicates:
+                    for column in range(1, 5):
+                        if not merged[column] and records[id][column]:
+                            merged[column] = records[id][column]
+                connection.execute(
+                    UPDATE_SQL,
+                    (*merged[1:], phone_digits(merged[3]),
+                     email_key(merged[4]), merged[0])
+                )
+                connection.executemany(
+                    DELETE_SQL, ((id,) for id in duplicates))
+        except sqlite3.Error as e:
+            self.report_error(e)
+            return None
+        return tuple(merged)
+
+# -------------------------- VACUUM -----------------------------------------#
+    def database_size(self) -> int:
+        """Size of the database file in bytes"""
+        connection = self.open()
+        page_count = connection.execute("PRAGMA page_count").fetchone()[0]
+        page_size = connection.execute("PRAGMA page_size").fetchone()[0]
+        return page_count * page_size
+
+    @timed(rows=lambda sizes: 0)
+    def vacuum(self) -> tuple:
+        """Rebuild the database file to drop free pages
+
+        The rebuilt file uses incremental auto vacuum, so from then on
+        incremental_vacuum can keep it compact without a full rebuild.
+        Returns the size in bytes (before, after)."""
+        before = self.database_size()
+        try:
+            # VACUUM can't run inside a transaction
+            connection = self.open()
+            connection.commit()
+            connection.execute("PRAGMA auto_vacuum = INCREMENTAL")
+            connection.execute("VACUUM")
+            # Refresh the query planner statistics as well
+            connection.execute("PRAGMA optimize")
+        except sqlite3.Error as e:
+            self.report_error(e)
+        return before, self.database_size()
+
+# -------------------------- MAINTENANCE ------------------------------------#
+    @contextlib.contextmanager
+    def time_budget(self, seconds: float = None):
+        """Abort statements of the calling thread after seconds
+
+        A statement still running when the budget is used up raises
+        sqlite3.OperationalError "interrupted" and is rolled back.
+        None is no limit."""
+        if seconds is None:
+            yield
+            return
+        connection = self.open()
+        end = time.perf_counter() + seconds
+        # Called every 1000 virtual machine steps, True aborts
+        connection.set_progress_handler(
+            lambda: time.perf_counter() > end, 1000)
+        try:
+            yield
+        finally:
+            connection.set_progress_handler(None, 0)
+
+    def free_pages(self) -> int:
+        """Unused pages in the database file"""
+        return self.open().execute("PRAGMA freelist_count").fetchone()[0]
+
+    @timed(rows=lambda finished: 0)
+    def optimize(self, budget: float = None) -> bool:
+        """Refresh the query planner statistics
+
+        ANALYZE the first time, PRAGMA optimize after that, which only
+        analyzes tables whose statistics are out of date. Each index is
+        sampled, not read in full. Returns False if budget ran out."""
+        connection = self.open()
+        analyzed = connection.execute("""
+            SELECT 1 FROM sqlite_master WHERE name = 'sqlite_stat1'
+        """).fetchone()
+        try:
+            with self.time_budget(budget):
+                connection.execute("PRAGMA analysis_limit = 1000")
+                connection.execute(
+                    "PRAGMA optimize" if analyzed else "ANALYZE")
+                connection.commit()
+        except sqlite3.OperationalError as e:
+            connection.rollback()
+            if "interrupted" not in str(e):
+                self.report_error(e)
+            return False
+        return True
+
+    @timed(rows=lambda pages: pages)
+    def incremental_vacuum(
+        self,
+        pages: int = 256,
+        budget: float = None
+    ) -> int:
+        """Give free pages back to the file system, pages at a time
+
+        Each step is its own short write, other writers get in between
+        steps. Stops when no free pages are left or budget seconds
+        have passed. Returns the number of pages freed, None if the
+        file doesn't use incremental auto vacuum yet, see vacuum()."""
+        connection = self.open()
+        if connection.execute("PRAGMA auto_vacuum").fetchone()[0] != 2:
+            return None
+        end = None if budget is None else time.perf_counter() + budget
+        freed = 0
+        while True:
+            before = self.free_pages()
+            if not before:
+                break
+            try:
+                with self.time_budget(
+                    None if end is None else end - time.perf_counter()
+                ):
+                    # Int, not a ? parameter, PRAGMAs don't take them
+                    # Every row has to be stepped through for it to run
+                    connection.execute(
+                        f"PRAGMA incremental_vacuum({int(pages)})"
+                    ).fetchall()
+                    connection.commit()
+            except sqlite3.OperationalError as e:
+                connection.rollback()
+                if "interrupted" not in str(e):
+                    self.report_error(e)
+                break
+            freed += before - self.free_pages()
+            if end is not None and time.perf_counter() >= end:
+                break
+        return freed
+
+    @timed(rows=lambda problems: 0)
+    def quick_check(self, budget: float = None, max_errors: int = 10):
+        """PRAGMA quick_check, a fast integrity check of the file
+
+        Returns the problems found, an empty list if the file is fine,
+        None if budget ran out before the check finished."""
+        connection = self.open()
+        try:
+            with self.time_budget(budget):
+                rows = connection.execute(
+                    f"PRAGMA quick_check({int(max_errors)})").fetchall()
+        except sqlite3.OperationalError as e:
+            if "interrupted" not in str(e):
+                self.report_error(e)
+            return None
+        problems = [row[0] for row in rows]
+        return [] if problems == ["ok"] else problems
+
+# -------------------------- CHANGE LOG -------------------------------------#
+    @timed(rows=lambda counted: 0)
+    def count_with_seq(self) -> tuple:
+        """(number of records, newest change seq)
+
+        Read in one statement, so the count includes exactly the
+        changes up to seq. Poll changes_since(seq) from there."""
+        SQL = """
+            SELECT
+                (SELECT COUNT(*) FROM tbl_address_book),
+                (SELECT COALESCE(MAX(seq), 0) FROM tbl_changes)
+        """
+        return self.open().execute(SQL).fetchone()
+
+    def track_own_changes(self):
+        """Remember the changes made on the calling thread's connection
+
+        A temporary trigger (only this connection fires it) saves
+        their seq, changes_since(skip_own=True) leaves them out. Call
+        it before the thread's first write."""
+        connection = self.open()
+        connection.execute("""
+            CREATE TEMP TABLE IF NOT EXISTS tbl_own_changes(
+            seq INTEGER PRIMARY KEY
+        )""")
+        connection.execute("""
+            CREATE TEMP TRIGGER IF NOT EXISTS trg_own_changes
+            AFTER INSERT ON main.tbl_changes BEGIN
+                INSERT INTO tbl_own_changes VALUES(new.seq);
+            END
+        """)
+        self._tracking.add(threading.get_ident())
+
+    @timed(rows=lambda result: len(result[1]))
+    def changes_since(
+        self,
+        seq: int,
+        limit: int = 1000,
+        skip_own: bool = False
+    ) -> tuple:
+        """(newest seq, changes) of the edits made after change seq
+
+        Each change is (seq, "insert" or "delete", record), oldest
+        first. Only the seq range is read from the table itself.
+        With skip_own the changes this thread made are left out, see
+        track_own_changes. Returns None if there are more than limit
+        changes or some were pruned, reading everything again is
+        cheaper then."""
+        connection = self.open()
+        oldest = connection.execute(
+            "SELECT MIN(seq) FROM tbl_changes").fetchone()[0]
+        if oldest is not None and oldest > seq + 1:
+            return None
+        rows = connection.execute("""
+            SELECT seq, op, id, first_name, last_name, phone, email
+            FROM tbl_changes
+            WHERE seq > ?
+            ORDER BY seq
+            LIMIT ?
+        """, (seq, limit + 1)).fetchall()
+        if len(rows) > limit:
+            return None
+        if not rows:
+            return seq, []
+        newest = rows[-1][0]
+        if skip_own and threading.get_ident() in self._tracking:
+            own = {
+                row[0] for row in connection.execute(
+                    "SELECT seq FROM temp.tbl_own_changes WHERE seq <= ?",
+                    (newest,))
+            }
+            self.execute_sql(
+                "DELETE FROM temp.tbl_own_changes WHERE seq <= ?", (newest,))
+            rows = [row for row in rows if row[0] not in own]
+        return newest, [(row[0], row[1], row[2:]) for row in rows]
+
+    def prune_changes(self, keep: int = 10000) -> int:
+        """Drop all but the newest keep changes, return rows deleted
+
+        Pollers more than keep changes behind read everything again."""
+        SQL = """
+            DELETE FROM tbl_changes
+            WHERE seq <= (SELECT MAX(seq) FROM tbl_changes) - ?
+        """
+        cursor = self.execute_sql(SQL, (keep,))
+        return cursor.rowcount if cursor is not None else 0
+
+# -------------------------- GROUP COMMIT -----------------------------------#
+    @contextlib.contextmanager
+    def transaction(self):
+        """Commit all the writes made in the with block at once
+
+        insert_record, update_record and delete_record called inside
+        the block share one transaction, so many writes cost one
+        commit (one fsync) instead of one each. A write that fails is
+        rolled back on its own, see execute_in_transaction."""
+        connection = self.open()
+        thread_id = threading.get_ident()
+        connection.execute("BEGIN IMMEDIATE")
+        self._transactions.add(thread_id)
+        try:
+            yield connection
+            connection.commit()
+        except BaseException:
+            connection.rollback()
+            raise
+        finally:
+            self._transactions.discard(thread_id)
+
+    def execute_in_transaction(self, SQL: str, parameters: tuple = None):
+        """execute_sql inside transaction(), nothing is committed yet
+
+        Each statement gets a savepoint, an error undoes only that
+        statement and the rest of the transaction goes on."""
+        connection = self.open()
+        connection.execute("SAVEPOINT execute_sql")
+        try:
+            return connection.execute(SQL, parameters or ())
+        except Exception as e:
+            connection.execute("ROLLBACK TO execute_sql")
+            self.report_error(e)
+        finally:
+            connection.execute("RELEASE execute_sql")
 
 # -------------------------- EXECUTE SQL ------------------------------------#
     def execute_sql(self, SQL: str, parameters: tuple = None):
         # This is an overloaded method in Python, parameters is optional
-        # If everything inside the with sqlite3.connect is successful
-        # connect.commit() and connect.close() are automatically called
-        # when the with statement exits
-        # If DATABASE does not exist, it is created
+        # Returns the cursor so callers can read lastrowid and rowcount
+        # or None if there was an error
+        # The connection is reused between calls, it is only closed
+        # by close() or when the with DBOperations block exits
+        # If everything inside the with connection block is successful
+        # connection.commit() is automatically called when it exits
+        if threading.get_ident() in self._transactions:
+            return self.execute_in_transaction(SQL, parameters)
         try:
-            with sqlite3.connect(self.database) as connection:
+            connection = self.open()
+            with connection:
                 # Create cursor to work with SQL
                 cursor = connection.cursor()
                 if parameters is not None:
                     # Execute SQL with parameters
+                    # The compiled statement is reused from the cache
                     cursor.execute(SQL, parameters)
                 else:
                     # Execute SQL without parameters
                     cursor.executescript(SQL)
                 # Records are written automatically
                 # after the with statement exits
-                # All connections are closed
+            return cursor
         except Exception as e:
-            print(f"There was an SQLite error: {e}")
\ No newline at end of file
+            self.report_error(e)
@@ -0,0 +1,250 @@
+"""
+    Name: dedupe.py
+    Author: Jed Felker
+    Created: 10/18/26
+    Purpose: Find near-duplicate contacts without comparing every
+    pair. Records are grouped into blocks by cheap keys and only
+    records sharing a block are scored against each other.
+"""
+# Scoring can be spread over several processes
+from concurrent.futures import ProcessPoolExecutor
+# Name similarity
+from difflib import SequenceMatcher
+from itertools import combinations, islice, repeat
+
+import db_operations
+import validation
+
+# Soundex digit of each consonant, vowels and h w y have none
+SOUNDEX_CODES = {
+    **dict.fromkeys("bfpv", "1"),
+    **dict.fromkeys("cgjkqsxz", "2"),
+    **dict.fromkeys("dt", "3"),
+    "l": "4",
+    **dict.fromkeys("mn", "5"),
+    "r": "6",
+}
+# Blocks bigger than this are compared as a sliding window over the
+# records sorted by name, instead of every pair in the block
+MAX_BLOCK_SIZE = 50
+WINDOW = 10
+# Blocks sent to a worker process at a time
+BLOCKS_PER_TASK = 200
+
+
+# -------------------------- NORMALIZE --------------------------------------#
+def soundex(name: str) -> str:
+    """Four character soundex code, "Robert" and "Rupert" -> R163"""
+    letters = [letter for letter in name.lower() if letter.isalpha()]
+    if not letters:
+        return ""
+    code = letters[0].upper()
+    last = SOUNDEX_CODES.get(letters[0], "")
+    for letter in letters[1:]:
+        digit = SOUNDEX_CODES.get(letter, "")
+        if digit and digit != last:
+            code += digit
+            if len(code) == 4:
+                break
+        # h and w don't separate two letters with the same code
+        if letter not in "hw":
+            last = digit
+    return code.ljust(4, "0")
+
+
+def normalize_email(email: str) -> str:
+    """Email compared without case or surrounding spaces"""
+    return validation.email_key(email)
+
+
+def normalize_phone(phone: str) -> str:
+    """Phone digits without a leading US country code
+
+    "+1 (555) 123-4567" and "555.123.4567" -> 5551234567"""
+    digits = db_operations.phone_digits(phone)
+    if len(digits) == 11 and digits.startswith("1"):
+        digits = digits[1:]
+    return digits
+
+
+def normalize(record) -> tuple:
+    """(id, name, last_name, phone, email) ready to compare
+
+    name is the lower case full name, the others are normalized."""
+    id, first_name, last_name, phone, email = record
+    first_name = (first_name or "").strip().lower()
+    last_name = (last_name or "").strip().lower()
+    return (
+        id,
+        f"{first_name} {last_name}".strip(),
+        last_name,
+        normalize_phone(phone),
+        normalize_email(email),
+    )
+
+
+def blocking_keys(contact) -> list:
+    """Keys of the blocks a normalized contact belongs to
+
+    Last name soundex plus first initial, the email, and the phone
+    number. Two contacts are only scored if they share a key."""
+    id, name, last_name, phone, email = contact
+    keys = []
+    if last_name:
+        keys.append("name:" + soundex(last_name) + name[:1])
+    if email:
+        keys.append("email:" + email)
+    # Very short numbers (extensions, typos) would block too widely
+    if len(phone) >= 7:
+        keys.append("phone:" + phone)
+    return keys
+
+
+# -------------------------- BLOCKING ---------------------------------------#
+def build_blocks(contacts) -> list:
+    """Lists of contacts sharing a blocking key, single contacts left out"""
+    blocks = {}
+    for contact in contacts:
+        for key in blocking_keys(contact):
+            blocks.setdefault(key, []).append(contact)
+    return [block for block in blocks.values() if len(block) > 1]
+
+
+def candidate_pairs(blocks):
+    """Yield each pair of contacts in the blocks to score once
+
+    A pair that shares several blocks is only yielded the first time."""
+    seen = set()
+    for block in blocks:
+        if len(block) <= MAX_BLOCK_SIZE:
+            pairs = combinations(block, 2)
+        else:
+            # Sorted neighbourhood, compare each contact with the
+            # next WINDOW contacts in name order
+            block = sorted(block, key=lambda contact: contact[1])
+            pairs = (
+                (block[i], other)
+                for i in range(len(block))
+                for other in block[i + 1:i + 1 + WINDOW]
+            )
+        for a, b in pairs:
+            ids = (a[0], b[0]) if a[0] < b[0] else (b[0], a[0])
+            if ids not in seen:
+                seen.add(ids)
+                yield a, b
+
+
+# -------------------------- SCORING ----------------------------------------#
+def score(a, b, threshold: float = 0.0) -> float:
+    """Similarity of two normalized contacts from 0 to 1
+
+    The name counts double, phone and email once each: 1 if they are
+    the same, 0 if different, 0.5 if either contact has none. A name
+    alone doesn't make a match, many people share a name.
+    Returns 0 as soon as the contacts can't reach threshold, most
+    pairs are ruled out before the slow name comparison."""
+    fields = 0.0
+    for column in (3, 4):
+        if a[column] and b[column]:
+            fields += a[column] == b[column]
+        else:
+            fields += 0.5
+    # Name similarity needed to still reach threshold
+    needed = (threshold * 4 - fields) / 2
+    if needed > 1:
+        return 0.0
+    if a[1] == b[1]:
+        name = 1.0
+    else:
+        matcher = SequenceMatcher(None, a[1], b[1])
+        # Cheap upper bounds of ratio() first
+        if matcher.real_quick_ratio() < needed or (
+            matcher.quick_ratio() < needed
+        ):
+            return 0.0
+        name = matcher.ratio()
+    return (2 * name + fields) / 4
+
+
+def score_pairs(pairs, threshold: float) -> list:
+    """(score, id_a, id_b) of the pairs scoring at least threshold"""
+    matches = []
+    for a, b in pairs:
+        similarity = score(a, b, threshold)
+        if similarity >= threshold:
+            matches.append((similarity, min(a[0], b[0]), max(a[0], b[0])))
+    return matches
+
+
+def score_blocks(blocks, threshold: float) -> list:
+    """Score the pairs of some blocks, run in the worker processes
+
+    Only the blocks are sent to a worker, not every pair."""
+    return score_pairs(candidate_pairs(blocks), threshold)
+
+
+def chunks(iterable, size: int):
+    iterator = iter(iterable)
+    while chunk := list(islice(iterator, size)):
+        yield chunk
+
+
+def find_candidates(
+    records,
+    threshold: float = 0.85,
+    processes: int = 1
+) -> list:
+    """Merge candidate pairs (score, id_a, id_b), best first
+
+    records are (id, first_name, last_name, phone, email) tuples.
+    With processes > 1 the blocks are scored in a process pool."""
+    blocks = build_blocks(normalize(record) for record in records)
+    if processes > 1:
+        with ProcessPoolExecutor(processes) as pool:
+            results = pool.map(
+                score_blocks,
+                chunks(blocks, BLOCKS_PER_TASK),
+                repeat(threshold)
+            )
+            # A pair in blocks sent to two workers is found twice
+            matches = list({
+                match for result in results for match in result})
+    else:
+        matches = score_blocks(blocks, threshold)
+    matches.sort(key=lambda match: (-match[0], match[1], match[2]))
+    return matches
+
+
+def group_candidates(matches) -> list:
+    """Join candidate pairs into groups, lowest id first in each
+
+    If a matches b and b matches c, all three are one group."""
+    parent = {}
+
+    def root(id):
+        parent.setdefault(id, id)
+        while parent[id] != id:
+            # Path halving keeps the trees flat
+            parent[id] = parent[parent[id]]
+            id = parent[id]
+        return id
+
+    for similarity, a, b in matches:
+        root_a, root_b = root(a), root(b)
+        if root_a != root_b:
+            # The lower id stays the root, it is the record kept
+            parent[max(root_a, root_b)] = min(root_a, root_b)
+    groups = {}
+    for id in parent:
+        groups.setdefault(root(id), []).append(id)
+    return sorted(sorted(group) for group in groups.values())
+
+
+# -------------------------- MERGE ------------------------------------------#
+def merge_duplicates(db_op, groups) -> int:
+    """Merge each group into its lowest id, return records removed"""
+    removed = 0
+    for group in groups:
+        if db_op.merge_records(group[0], group[1:]) is not None:
+            removed += len(group) - 1
+    return removed
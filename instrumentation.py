@@ -0,0 +1,183 @@
+"""
+    Name: instrumentation.py
+    Author: Jed Felker
+    Created: 10/18/26
+    Purpose: Latency histograms, row counts and counters for the
+    data layer and the GUI, dumped as JSON or Prometheus text
+"""
+# Find the histogram bucket of a latency
+from bisect import bisect_left
+from contextlib import contextmanager
+import functools
+import json
+import threading
+import time
+
+# Upper bounds of the latency buckets in seconds, the last bucket
+# (+Inf) holds everything slower
+BUCKETS = (
+    0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01,
+    0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0,
+)
+# Prometheus metric names start with this
+PREFIX = "address_book"
+
+
+class Histogram:
+    """Latencies of one named operation"""
+    __slots__ = ("buckets", "count", "sum", "max", "rows")
+
+    def __init__(self):
+        self.buckets = [0] * (len(BUCKETS) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+        self.rows = 0
+
+    def observe(self, seconds: float, rows: int = 0):
+        self.buckets[bisect_left(BUCKETS, seconds)] += 1
+        self.count += 1
+        self.sum += seconds
+        self.rows += rows
+        if seconds > self.max:
+            self.max = seconds
+
+    def quantile(self, q: float) -> float:
+        """Upper bound of the bucket holding the q quantile"""
+        rank = q * self.count
+        seen = 0
+        for bound, count in zip(BUCKETS, self.buckets):
+            seen += count
+            if seen >= rank:
+                return bound
+        return self.max
+
+    def as_dict(self) -> dict:
+        return {
+            "count": self.count,
+            "rows": self.rows,
+            "sum_seconds": self.sum,
+            "max_seconds": self.max,
+            "p50_seconds": self.quantile(0.5),
+            "p95_seconds": self.quantile(0.95),
+            "buckets": dict(zip(
+                [str(bound) for bound in BUCKETS] + ["+Inf"], self.buckets)),
+        }
+
+
+class Metrics:
+    def __init__(self):
+        """Histograms are grouped in families, "query" for DBOperations
+        calls and "gui" for GUI phases. Safe to use from any thread."""
+        # (family, name) -> Histogram
+        self.histograms = {}
+        # name -> count
+        self.counters = {}
+        self.lock = threading.Lock()
+
+# -------------------------- RECORD -----------------------------------------#
+    def observe(self, family: str, name: str, seconds: float, rows: int = 0):
+        with self.lock:
+            histogram = self.histograms.get((family, name))
+            if histogram is None:
+                histogram = self.histograms[(family, name)] = Histogram()
+            histogram.observe(seconds, rows)
+
+    def increment(self, name: str, amount: int = 1):
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + amount
+
+    @contextmanager
+    def timer(self, family: str, name: str):
+        """Time the body of a with block"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(family, name, time.perf_counter() - start)
+
+    def reset(self):
+        with self.lock:
+            self.histograms.clear()
+            self.counters.clear()
+
+# -------------------------- DUMP -------------------------------------------#
+    def snapshot(self) -> dict:
+        """Everything recorded so far as plain dicts"""
+        with self.lock:
+            families = {}
+            for (family, name), histogram in sorted(self.histograms.items()):
+                families.setdefault(family, {})[name] = histogram.as_dict()
+            return {"histograms": families, "counters": dict(self.counters)}
+
+    def to_json(self) -> str:
+        return json.dumps(self.snapshot(), indent=2)
+
+    def to_prometheus(self) -> str:
+        """Prometheus text exposition format"""
+        snapshot = self.snapshot()
+        lines = []
+        for family, histograms in snapshot["histograms"].items():
+            metric = f"{PREFIX}_{family}_seconds"
+            lines.append(f"# TYPE {metric} histogram")
+            for name, histogram in histograms.items():
+                label = f'name="{name}"'
+                total = 0
+                # Prometheus buckets count everything up to the bound
+                for bound, count in histogram["buckets"].items():
+                    total += count
+                    lines.append(
+                        f'{metric}_bucket{{{label},le="{bound}"}} {total}')
+                lines.append(
+                    f"{metric}_sum{{{label}}} {histogram['sum_seconds']}")
+                lines.append(f"{metric}_count{{{label}}} {histogram['count']}")
+            rows = f"{PREFIX}_{family}_rows_total"
+            lines.append(f"# TYPE {rows} counter")
+            for name, histogram in histograms.items():
+                lines.append(f'{rows}{{name="{name}"}} {histogram["rows"]}')
+        for name, count in snapshot["counters"].items():
+            metric = f"{PREFIX}_{name}_total"
+            lines.append(f"# TYPE {metric} counter")
+            lines.append(f"{metric} {count}")
+        return "\n".join(lines) + "\n"
+
+    def dump(self, path: str):
+        """Write the metrics to path, Prometheus text if it ends in .prom"""
+        text = self.to_prometheus() if path.endswith(".prom") else (
+            self.to_json())
+        with open(path, "w") as file:
+            file.write(text)
+
+
+# -------------------------- DBOPERATIONS DECORATOR -------------------------#
+def row_count(result) -> int:
+    """Rows returned by a DBOperations call"""
+    if isinstance(result, list):
+        return len(result)
+    if isinstance(result, tuple):
+        # One record
+        return 1
+    return 0
+
+
+def timed(rows=row_count):
+    """Time a DBOperations method into self.metrics
+
+    rows(result) is the row count recorded with the call."""
+    def decorate(method):
+        name = method.__name__
+
+        @functools.wraps(method)
+        def wrapper(self, *args, **kwargs):
+            start = time.perf_counter()
+            try:
+                result = method(self, *args, **kwargs)
+            except Exception:
+                self.metrics.increment("errors")
+                raise
+            self.metrics.observe(
+                "query", name, time.perf_counter() - start,
+                rows(result) if result is not None else 0)
+            return result
+        return wrapper
+    return decorate
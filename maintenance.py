@@ -0,0 +1,155 @@
+"""
+    Name: maintenance.py
+    Author: Jed Felker
+    Created: 10/18/26
+    Purpose: Keep the database file compact and its queries fast.
+    Refreshes the query planner statistics, gives free pages back a
+    few at a time, checks the file's integrity and prunes the change
+    log. Each task runs in a small time budget, so the GUI can run
+    them while it is idle. The CLI runs them all with maintain.
+"""
+import sys
+import time
+
+# Seconds between runs of each task, in the order they run
+INTERVALS = {
+    "optimize": 60 * 60,
+    "incremental_vacuum": 10 * 60,
+    "prune_changes": 60 * 60,
+    "quick_check": 24 * 60 * 60,
+}
+# Pages given back per incremental vacuum step, each step is a
+# commit, about 30 ms with the safe profile's fsync
+VACUUM_PAGES = 32
+# Newest change log entries kept, see DBOperations.prune_changes
+KEEP_CHANGES = 10000
+# Rows read to time the list's first page before and after a task
+PROBE_ROWS = 100
+# A task that ran out of budget gets twice the budget next time,
+# up to this many seconds. One that doesn't finish in this either
+# waits its whole interval before it is tried again
+MAX_BUDGET = 2.0
+
+
+class Maintenance:
+    def __init__(self, db_op, budget: float = 0.05, intervals: dict = None,
+                 log=None):
+        """db_op is the DBOperations controller to maintain
+
+        budget is the seconds a task may run at a time, None for no
+        limit. intervals overrides single entries of INTERVALS.
+        log(line) gets one line per task run, stderr by default."""
+        self.db_op = db_op
+        self.intervals = dict(INTERVALS, **(intervals or {}))
+        self.budgets = dict.fromkeys(self.intervals, budget)
+        self.log = log or (lambda line: print(line, file=sys.stderr))
+        # Task -> time.monotonic() it last finished, None if it hasn't
+        self.finished = dict.fromkeys(self.intervals)
+
+# -------------------------- SCHEDULE ---------------------------------------#
+    def due(self, now: float = None) -> list:
+        """Tasks not finished within their interval, in INTERVALS order"""
+        if now is None:
+            now = time.monotonic()
+        return [
+            task for task, interval in self.intervals.items()
+            if self.finished[task] is None
+            or now - self.finished[task] >= interval
+        ]
+
+    def probe(self) -> float:
+        """Seconds to read the first page of the list"""
+        start = time.perf_counter()
+        self.db_op.fetch_page(limit=PROBE_ROWS)
+        return time.perf_counter() - start
+
+# -------------------------- RUN --------------------------------------------#
+    def run_task(self, task: str) -> dict:
+        """Run one task within its budget, log it and return its report
+
+        Runs on the calling thread, the GUI's database worker. A task
+        that didn't finish stays due and goes on from where it stopped
+        (incremental_vacuum) or starts over with more budget. One that
+        can't get anywhere (MAX_BUDGET used up, or no pages freed) is
+        postponed by its interval instead of retried right away."""
+        db_op = self.db_op
+        budget = self.budgets[task]
+        size_before = db_op.database_size()
+        probe_before = self.probe()
+        start = time.perf_counter()
+        problems = []
+        # incremental_vacuum made progress, the others start over
+        progress = False
+        if task == "optimize":
+            finished = db_op.optimize(budget)
+            result = "statistics refreshed"
+        elif task == "incremental_vacuum":
+            freed = db_op.incremental_vacuum(VACUUM_PAGES, budget)
+            if freed is None:
+                finished = True
+                result = "needs one full vacuum first"
+            else:
+                finished = not db_op.free_pages()
+                progress = freed > 0
+                result = f"{freed:,} pages freed"
+        elif task == "prune_changes":
+            finished = True
+            result = f"{db_op.prune_changes(KEEP_CHANGES):,} changes pruned"
+        elif task == "quick_check":
+            problems = db_op.quick_check(budget)
+            finished = problems is not None
+            problems = problems or []
+            if not finished:
+                result = "check not finished"
+            else:
+                result = "; ".join(problems) if problems else "file is ok"
+        else:
+            raise ValueError(f"Unknown maintenance task {task!r}")
+        seconds = time.perf_counter() - start
+        report = {
+            "task": task,
+            "finished": finished,
+            "result": result,
+            "problems": problems,
+            "seconds": seconds,
+            "size_before": size_before,
+            "size_after": db_op.database_size(),
+            "probe_before": probe_before,
+            "probe_after": self.probe(),
+        }
+        if finished:
+            self.finished[task] = time.monotonic()
+        elif progress:
+            # incremental_vacuum goes on where it stopped
+            report["result"] = "out of time, " + result
+        elif budget is None or budget >= MAX_BUDGET or (
+            task == "incremental_vacuum"
+        ):
+            # More time won't help, don't run it again every idle
+            # second, wait a whole interval as if it had finished
+            self.finished[task] = time.monotonic()
+            report["result"] = "out of time, postponed, " + result
+        else:
+            # Start over with more time
+            report["result"] = "out of time, " + result
+            self.budgets[task] = min(budget * 2, MAX_BUDGET)
+        db_op.metrics.observe("maintenance", task, seconds)
+        self.log(self.format_report(report))
+        return report
+
+    def run_all(self, tasks=None) -> list:
+        """Run every task (or the tasks listed) now, return the reports
+
+        Without a budget each one runs to the end, for the CLI."""
+        return [self.run_task(task) for task in tasks or self.intervals]
+
+    @staticmethod
+    def format_report(report: dict) -> str:
+        """One log line, sizes in bytes and the probe in milliseconds"""
+        return (
+            f"maintenance {report['task']}: {report['result']} in "
+            f"{report['seconds'] * 1000:.1f} ms, "
+            f"{report['size_before']:,} -> {report['size_after']:,} bytes, "
+            f"first page {report['probe_before'] * 1000:.2f} -> "
+            f"{report['probe_after'] * 1000:.2f} ms"
+        )
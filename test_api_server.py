@@ -0,0 +1,79 @@
+"""
+    Name: test_api_server.py
+    Author: Jed Felker
+    Created: 10/18/26
+    Purpose: Bad requests to the API server are answered with 400
+
+    python -m pytest test_api_server.py
+"""
+import asyncio
+import json
+
+import pytest
+
+import api_server
+
+
+@pytest.fixture
+def server(tmp_path):
+    server = api_server.APIServer(str(tmp_path / "book.db"), pool_size=1)
+    server.db_op.insert_records([
+        ("Ann", "Lee", "555-123-4567", "ann@example.com"),
+        ("Bob", "Ng", "555-765-4321", "bob@example.com"),
+    ])
+    yield server
+    server.close()
+
+
+def request(server, method, target, body=None):
+    """(status, decoded JSON body) of one request"""
+    status, payload, headers = asyncio.run(server.respond(
+        method, target,
+        json.dumps(body).encode() if body is not None else b""))
+    return status, json.loads(payload) if payload else None
+
+
+@pytest.mark.parametrize("key", [
+    "[1]",
+    "[\"Lee\", \"Ann\", 1, 2]",
+    "{\"id\": 1}",
+    "\"Lee\"",
+    "[[1], \"Ann\", 1]",
+    "not json",
+])
+@pytest.mark.parametrize("name", ["after", "before"])
+def test_records_key_of_the_wrong_shape(server, name, key):
+    status, body = request(server, "GET", f"/records?{name}={key}")
+    assert status == 400, body
+
+
+def test_records_key_of_the_right_shape(server):
+    status, body = request(server, "GET", "/records?after=[\"Lee\",\"Ann\",1]")
+    assert status == 200
+    assert [record["first_name"] for record in body["records"]] == ["Bob"]
+    status, body = request(server, "GET", "/records?sort=id&before=[2]")
+    assert status == 200
+    assert [record["id"] for record in body["records"]] == [1]
+
+
+@pytest.mark.parametrize("requests", [[1], ["GET /count"], [None], [[]]])
+def test_batch_items_must_be_objects(server, requests):
+    status, body = request(server, "POST", "/batch", {"requests": requests})
+    assert status == 400, body
+
+
+def test_batch_runs_object_items(server):
+    status, body = request(server, "POST", "/batch", {"requests": [
+        {"method": "GET", "path": "/count"},
+        {"method": "DELETE", "path": "/records/1"},
+    ]})
+    assert status == 200
+    assert [response["status"] for response in body["responses"]] == [
+        200, 200]
+
+
+@pytest.mark.parametrize("target", [
+    "/key", "/key?offset=x", "/key?offset=-1", "/records?limit=abc"])
+def test_bad_integer_options(server, target):
+    status, body = request(server, "GET", target)
+    assert status == 400, body
@@ -0,0 +1,106 @@
+"""
+    Name: test_db_operations.py
+    Author: Jed Felker
+    Created: 10/18/26
+    Purpose: Keyset pagination through records with missing values
+
+    python -m pytest test_db_operations.py
+"""
+import sqlite3
+
+import pytest
+
+import db_operations
+
+# first_name, last_name, phone, email with every column missing somewhere
+RECORDS = [
+    ("Ann", "Lee", "555-123-4567", "ann@example.com"),
+    (None, "Lee", None, "lee@example.com"),
+    ("Bob", None, "555-123-0000", None),
+    ("Cat", "Ng", None, None),
+    (None, "Ng", "555-999-0000", "ng@example.com"),
+    ("Dan", "Ortiz", "555-000-1111", None),
+    ("Eve", None, None, "eve@example.com"),
+]
+
+
+@pytest.fixture
+def db_op(tmp_path):
+    with db_operations.DBOperations(str(tmp_path / "book.db")) as db_op:
+        db_op.create_table()
+        yield db_op
+
+
+def all_pages(db_op, sort, descending, batch_size=2):
+    """Every record read through iter_records in small pages"""
+    return list(db_op.iter_records(sort, descending, batch_size))
+
+
+def expected(db_op, sort, descending):
+    """Every record sorted in Python on the full sort key"""
+    indexes = [
+        db_operations.COLUMNS.index(column)
+        for column in db_op.sort_key_columns(sort)
+    ]
+    return sorted(
+        db_op.fetch_all_records(),
+        key=lambda record: db_operations.sort_key(record, indexes),
+        reverse=descending
+    )
+
+
+@pytest.mark.parametrize("descending", [False, True])
+@pytest.mark.parametrize("sort", list(db_operations.SORT_KEYS))
+def test_pages_reach_every_record(db_op, sort, descending):
+    db_op.insert_records(RECORDS)
+    assert all_pages(db_op, sort, descending) == expected(
+        db_op, sort, descending)
+
+
+@pytest.mark.parametrize("descending", [False, True])
+@pytest.mark.parametrize("sort", list(db_operations.SORT_KEYS))
+def test_pages_after_upgrade_from_null_values(tmp_path, sort, descending):
+    # A book written before missing values were stored as ""
+    path = str(tmp_path / "old.db")
+    with db_operations.DBOperations(path) as db_op:
+        db_op.create_table()
+        db_op.insert_records(RECORDS)
+    connection = sqlite3.connect(path)
+    connection.execute("""
+        UPDATE tbl_address_book
+        SET first_name = NULLIF(first_name, ''),
+        last_name = NULLIF(last_name, ''),
+        phone = NULLIF(phone, ''),
+        email = NULLIF(email, '')
+    """)
+    connection.execute("PRAGMA user_version = 9")
+    connection.commit()
+    connection.close()
+
+    with db_operations.DBOperations(path) as db_op:
+        db_op.create_table()
+        records = all_pages(db_op, sort, descending)
+        assert len(records) == len(RECORDS)
+        assert records == expected(db_op, sort, descending)
+        assert all(None not in record for record in records)
+
+
+def test_write_paths_store_blank_values(db_op):
+    id = db_op.insert_record(None, "Lee", None, None)
+    db_op.insert_records([("Ann", None, None, None)])
+    assert db_op.fetch_record(id) == (id, "", "Lee", "", "")
+    assert db_op.update_record("Ann", "Lee", None, None, id) == (
+        id, "Ann", "Lee", "", "")
+    assert all(None not in record for record in db_op.fetch_all_records())
+
+
+def test_attached_books_merge_every_record(db_op, tmp_path):
+    db_op.insert_records(RECORDS[:4])
+    other = str(tmp_path / "other.db")
+    with db_operations.DBOperations(other) as book:
+        book.create_table()
+        book.insert_records(RECORDS[4:])
+    db_op.attach_book(other, "other")
+    for sort in db_operations.SORT_KEYS:
+        records = list(db_op.iter_all_records(sort, True, batch_size=2))
+        assert len(records) == len(RECORDS)
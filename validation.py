@@ -0,0 +1,149 @@
+"""
+    Name: validation.py
+    Author: Jed Felker
+    Created: 10/18/26
+    Purpose: Clean up and check contacts before they are written.
+    The GUI, DBOperations and the bulk imports share these rules,
+    and the indexed lookup keys stored with each record come from here.
+
+    Stored values have spaces trimmed and runs of spaces made one, the
+    email domain is lower case. The phone is kept as typed, its digits
+    are the phone key. The lower case email is the email key.
+    A missing value is stored as "", never NULL, keyset pagination
+    can't page past a NULL, see DBOperations.fetch_page.
+"""
+import re
+
+# Patterns are compiled once, the batch form runs them for every row
+# Everything that isn't a digit
+NON_DIGITS = re.compile(r"\D")
+# Characters a typed phone number may have, "+1 (555) 123-4567 x12"
+PHONE = re.compile(
+    r"\+?[\d().\-/ ]+(?:(?:x|ext\.?) ?\d+)?", re.IGNORECASE)
+# Something before one @, a dotted domain after it, no spaces
+EMAIL = re.compile(r"[^@\s]+@[^@\s.]+(?:\.[^@\s.]+)+")
+# Digits in a phone number, a local number up to the longest E.164
+# (15) with a short extension
+MIN_PHONE_DIGITS = 7
+MAX_PHONE_DIGITS = 20
+
+
+class ValidationError(ValueError):
+    """A record breaking the rules, problems has one line per rule"""
+
+    def __init__(self, problems: list):
+        super().__init__("; ".join(problems))
+        self.problems = problems
+
+
+# -------------------------- KEYS -------------------------------------------#
+def phone_digits(phone: str) -> str:
+    """Phone number with only the digits kept,
+    "(555) 123-4567" -> 5551234567"""
+    return NON_DIGITS.sub("", phone or "")
+
+
+def email_key(email: str) -> str:
+    """Email compared without case or surrounding spaces"""
+    return (email or "").strip().lower()
+
+
+# -------------------------- ONE RECORD -------------------------------------#
+def clean(value: str) -> str:
+    """Trim the value and make runs of spaces one space
+
+    None (a missing value) becomes the empty string ""."""
+    if not value:
+        return ""
+    return " ".join(value.split())
+
+
+def clean_email(email: str) -> str:
+    """Trimmed email with the domain in lower case, the part before
+    the @ can be case sensitive"""
+    email = clean(email)
+    if email:
+        at = email.rfind("@")
+        if at >= 0:
+            email = email[:at] + email[at:].lower()
+    return email
+
+
+def normalize_record(first_name, last_name, phone, email) -> tuple:
+    """(first_name, last_name, phone, email) the way they are stored"""
+    return clean(first_name), clean(last_name), clean(phone), (
+        clean_email(email))
+
+
+def validate_record(first_name, last_name, phone, email) -> list:
+    """What is wrong with a normalized record, empty if nothing is
+
+    A record needs a first or last name. Phone and email can be
+    left empty, but must look like a phone number and an email."""
+    problems = []
+    if not first_name and not last_name:
+        problems.append("a first or last name is needed")
+    if phone and not (
+        PHONE.fullmatch(phone)
+        and MIN_PHONE_DIGITS <= len(phone_digits(phone)) <= MAX_PHONE_DIGITS
+    ):
+        problems.append(f"{phone!r} is not a phone number")
+    if email and not EMAIL.fullmatch(email):
+        problems.append(f"{email!r} is not an email address")
+    return problems
+
+
+def clean_record(first_name, last_name, phone, email) -> tuple:
+    """Normalized record, ValidationError if it breaks a rule"""
+    record = normalize_record(first_name, last_name, phone, email)
+    problems = validate_record(*record)
+    if problems:
+        raise ValidationError(problems)
+    return record
+
+
+# -------------------------- BATCH ------------------------------------------#
+def prepare_batch(records, rejected=None) -> list:
+    """Rows to insert for many (first_name, last_name, phone, email)
+    records: the normalized record followed by its phone_digits and
+    email_key
+
+    Invalid records are left out, rejected(index, record, problems)
+    is called for each, index is its position in records. The same
+    rules as clean_record, inlined with the patterns' methods looked
+    up once, bulk imports run this for every row."""
+    rows = []
+    append = rows.append
+    phone_match = PHONE.fullmatch
+    email_match = EMAIL.fullmatch
+    strip_digits = NON_DIGITS.sub
+    for index, record in enumerate(records):
+        first_name, last_name, phone, email = record
+        # clean() and clean_email() inlined
+        first_name = " ".join(first_name.split()) if first_name else ""
+        last_name = " ".join(last_name.split()) if last_name else ""
+        digits = ""
+        if phone:
+            phone = " ".join(phone.split())
+            digits = strip_digits("", phone)
+        else:
+            phone = ""
+        key = ""
+        if email:
+            email = " ".join(email.split())
+            at = email.rfind("@")
+            if at >= 0:
+                email = email[:at] + email[at:].lower()
+            key = email.lower()
+        else:
+            email = ""
+        if (not first_name and not last_name) or (phone and not (
+            phone_match(phone)
+            and MIN_PHONE_DIGITS <= len(digits) <= MAX_PHONE_DIGITS
+        )) or (email and not email_match(email)):
+            if rejected is not None:
+                rejected(index, record, validate_record(
+                    first_name, last_name, phone, email))
+            continue
+        append((first_name, last_name, phone, email, digits, key))
+    return rows
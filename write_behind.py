@@ -0,0 +1,167 @@
+"""
+    Name: write_behind.py
+    Author: Jed Felker
+    Created: 10/18/26
+    Purpose: Write-behind journal for GUI edits. Adds, updates and
+    deletes are saved to a local journal file right away and written
+    to SQLite later, many at a time in one group commit.
+"""
+import json
+import os
+# Every journal file gets a new id, see tbl_write_behind
+import uuid
+
+
+class WriteBehind:
+    def __init__(self, path: str, sync: bool = False):
+        """path is the journal file, kept next to the database
+
+        Each edit is flushed to the journal file before it shows in
+        the GUI, so the edits survive the program crashing. With sync
+        every edit is also fsync'd, which survives a power loss too.
+        A journal left over from a crash is loaded and flushed first."""
+        self.path = path
+        self.sync = sync
+        # Edits not committed to SQLite yet, oldest first
+        # {"op": "insert" | "update" | "delete", "id": id, "record": [...]}
+        self.entries = []
+        # Number of entries at the front being committed right now
+        self.flushing = 0
+        # Records added in write-behind mode get negative temporary ids
+        # until they are committed and get their real id
+        self.next_temporary_id = -1
+        # temporary id -> real id of every committed insert
+        self.real_ids = {}
+        self.journal = None
+        self.file = None
+        self.load()
+
+# -------------------------- JOURNAL FILE -----------------------------------#
+    def load(self):
+        """Read a journal left by an earlier run, or start a new one"""
+        if os.path.exists(self.path):
+            with open(self.path, encoding="utf-8") as file:
+                lines = file.read().splitlines()
+            try:
+                self.journal = json.loads(lines[0])["journal"]
+            except (IndexError, KeyError, ValueError):
+                lines = []
+            for line in lines[1:]:
+                try:
+                    self.entries.append(json.loads(line))
+                except ValueError:
+                    # Half written last line, that edit never showed
+                    break
+            temporary = [
+                entry["id"] for entry in self.entries if entry["id"] < 0]
+            self.next_temporary_id = min(temporary, default=0) - 1
+        self.rewrite()
+
+    def rewrite(self):
+        """Replace the journal file with the uncommitted entries
+
+        The new file is written next to the old one and renamed over
+        it, so there is always one complete journal on disk."""
+        if self.file is not None:
+            self.file.close()
+        if self.journal is None or not self.entries:
+            # New journal id, the old one's progress no longer applies
+            self.journal = uuid.uuid4().hex
+        temporary_path = self.path + ".tmp"
+        with open(temporary_path, "w", encoding="utf-8") as file:
+            file.write(json.dumps({"journal": self.journal}) + "\n")
+            for entry in self.entries:
+                file.write(json.dumps(entry) + "\n")
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(temporary_path, self.path)
+        self.file = open(self.path, "a", encoding="utf-8")
+
+    def append(self, entry: dict):
+        self.entries.append(entry)
+        self.file.write(json.dumps(entry) + "\n")
+        self.file.flush()
+        if self.sync:
+            os.fsync(self.file.fileno())
+
+    def close(self):
+        """Close the journal, removing it if nothing is pending"""
+        self.file.close()
+        if not self.entries:
+            os.remove(self.path)
+
+# -------------------------- EDITS ------------------------------------------#
+    @property
+    def pending(self) -> int:
+        """Edits not committed to SQLite yet"""
+        return len(self.entries)
+
+    def resolve(self, id: int) -> int:
+        """Real id of a record, also after its temporary id was replaced"""
+        return self.real_ids.get(id, id)
+
+    def insert(self, first_name, last_name, phone, email) -> int:
+        """Journal a new record, return its temporary id"""
+        id = self.next_temporary_id
+        self.next_temporary_id -= 1
+        self.append({
+            "op": "insert",
+            "id": id,
+            "record": [first_name, last_name, phone, email],
+        })
+        return id
+
+    def update(self, first_name, last_name, phone, email, id):
+        self.append({
+            "op": "update",
+            "id": self.resolve(int(id)),
+            "record": [first_name, last_name, phone, email],
+        })
+
+    def delete(self, id):
+        self.append({"op": "delete", "id": self.resolve(int(id))})
+
+# -------------------------- GROUP COMMIT -----------------------------------#
+    def take(self) -> tuple:
+        """(journal id, entries) to commit, marks them as flushing"""
+        self.flushing = len(self.entries)
+        return self.journal, list(self.entries)
+
+    def committed(self, id_map: dict):
+        """The entries from take() are in SQLite, drop them
+
+        Edits made while they were committed stay in the journal,
+        with the temporary ids of committed inserts replaced."""
+        self.real_ids.update(id_map)
+        remaining = self.entries[self.flushing:]
+        for entry in remaining:
+            entry["id"] = self.resolve(entry["id"])
+        self.entries = remaining
+        self.flushing = 0
+        self.journal = None
+        self.rewrite()
+
+    def failed(self):
+        """The commit failed, the entries are kept for the next flush"""
+        self.flushing = 0
+
+
+def apply(db_op, journal: str, entries: list) -> dict:
+    """Write journal entries to SQLite in one transaction
+
+    Runs on the database worker. Entries a crashed run already
+    committed are skipped. Returns {temporary id: record id}."""
+    entries_done, id_map = db_op.write_behind_progress(journal)
+    with db_op.transaction():
+        for entry in entries[entries_done:]:
+            id = id_map.get(entry["id"], entry["id"])
+            if entry["op"] == "insert":
+                new_id = db_op.insert_record(*entry["record"])
+                if new_id is not None:
+                    id_map[entry["id"]] = new_id
+            elif entry["op"] == "update":
+                db_op.update_record(*entry["record"], id)
+            elif entry["op"] == "delete":
+                db_op.delete_record(id)
+        db_op.save_write_behind_progress(journal, len(entries), id_map)
+    return id_map